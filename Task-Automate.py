@@ -8,21 +8,60 @@ import subprocess
 import sys
 import time
 import importlib
+import importlib.util
+import ast
+import re
+import shutil
+import venv
 import threading
 import json
+import hashlib
+from collections import OrderedDict, deque
 import pyperclip
 from PIL import Image
-import markdown2
 from threading import Lock
 import io
+import queue
+import asyncio
+import itertools
+import contextlib
+import contextvars
+import argparse
+import mimetypes
+import mmap
+import sqlite3
+import marshal
+import types
+import base64
+import math
+import numpy as np
+import tempfile
+import atexit
+import copy
+import datetime
+import heapq
 import sys 
 from packaging import version
 import requests
-from pynput import keyboard as pynput_keyboard
-from pynput.keyboard import Key, KeyCode
-import keyboard
-import win32gui
-import win32con
+# Desktop-only modules; batch mode runs without them on headless Linux boxes
+try:
+    from pynput import keyboard as pynput_keyboard
+    from pynput.keyboard import Key, KeyCode
+except ImportError:
+    pynput_keyboard = None
+try:
+    import keyboard
+except ImportError:
+    keyboard = None
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+try:
+    import win32gui
+    import win32con
+except ImportError:
+    win32gui = win32con = None
 
 class PopupSearchBar:
     def __init__(self, app):
@@ -73,7 +112,7 @@ class PopupSearchBar:
         self.app.gui.entry.delete(0, END)
         self.app.gui.entry.insert(0, query)
         self.app.gui.mode_var.set("Automation")  # Set mode to Automation
-        self.app.gui.process_input()  # Run the Automation task
+        self.app.gui.process_input(JobEngine.HIGH_PRIORITY)  # Run the Automation task ahead of queued jobs
         self.close_window()
         
     def start_move(self, event):
@@ -132,23 +171,31 @@ class UpdateHandler:
             return False
 
 class APIHandler:
-    def __init__(self, settings):
+    def __init__(self, settings, api_tracker=None):
         self.settings = settings
+        self.api_tracker = api_tracker
+        self.model = None
         self.api_key = self.settings.get_setting('api_key')
         self.configure_api()
-        
-        
+        self.settings.subscribe(['api_key', 'model_backends', 'hedge_requests', 'hedge_min_delay'], self.settings_changed)
+
+    def settings_changed(self, key, value):
+        if key == 'hedge_requests':
+            self.model.hedging = value
+        elif key == 'hedge_min_delay':
+            self.model.hedge_min_delay = value
+        else:
+            self.api_key = self.settings.get_setting('api_key')
+            self.configure_api()
+
     def get_api_key(self):
-        config_file = 'config.json'
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                config = json.load(f)
-                return config.get('api_key')
-        
+        api_key = self.settings.get_setting('api_key')
+        if api_key:
+            return api_key
+
         api_key = simpledialog.askstring("API Key", "Enter your API key:", show='*')
         if api_key:
-            with open(config_file, 'w') as f:
-                json.dump({'api_key': api_key}, f)
+            self.settings.set_setting('api_key', api_key)
             return api_key
         else:
             messagebox.showerror("Error", "API key is required to use this application.")
@@ -156,120 +203,1968 @@ class APIHandler:
 
     def configure_api(self):
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        backends = [ModelBackend(name, genai.GenerativeModel(name))
+                    for name in self.settings.get_setting('model_backends')]
+        if self.model is None:
+            self.model = ModelRouter(backends, self.api_tracker, self.settings.get_setting('hedge_requests'),
+                                     self.settings.get_setting('hedge_min_delay'))
+        else:
+            # Handlers keep a reference to the router, so swap the backends in place
+            self.model.set_backends(backends)
 
     def change_api_key(self):
         new_api_key = simpledialog.askstring("Change API Key", "Enter new API key:", show='*')
         if new_api_key:
-            with open('config.json', 'w') as f:
-                json.dump({'api_key': new_api_key}, f)
-            self.api_key = new_api_key
-            self.configure_api()
+            self.settings.set_setting('api_key', new_api_key)  # reconfigures through settings_changed
             messagebox.showinfo("Success", "API key updated successfully.")
         else:
             messagebox.showwarning("Warning", "API key not changed.")
 
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class ModelBackend:
+    def __init__(self, name, model, sample_size=50):
+        self.name = name
+        self.model = model
+        self.latencies = deque(maxlen=sample_size)  # recent time-to-first-token in seconds
+        self.requests = 0
+        self.wins = 0
+        self.failures = 0
+        self.unavailable_until = 0
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    def record_failure(self, cooldown=30):
+        self.failures += 1
+        self.unavailable_until = time.time() + cooldown
+
+    def percentile(self, fraction):
+        return percentile(self.latencies, fraction)
+
+    def keep_stats(self, previous):
+        # Same backend behind a new client, e.g. after an API key change
+        self.latencies = previous.latencies
+        self.requests = previous.requests
+        self.wins = previous.wins
+        self.failures = previous.failures
+        self.unavailable_until = previous.unavailable_until
+
+
+class ModelRouter:
+    # Looks like a GenerativeModel to the handlers but sends each message to the fastest backend
+    def __init__(self, backends, api_tracker=None, hedging=True, hedge_min_delay=1.0, min_samples=5):
+        self.backends = backends
+        self.api_tracker = api_tracker
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.last_route = None
+        self.lock = Lock()
+
+    @property
+    def model_name(self):
+        return "+".join(backend.name for backend in self.backends)
+
+    def set_backends(self, backends):
+        with self.lock:
+            previous = {backend.name: backend for backend in self.backends}
+            for backend in backends:
+                if backend.name in previous:
+                    backend.keep_stats(previous[backend.name])
+            self.backends = backends
+
+    def start_chat(self, history=None):
+        return RoutedChat(self, history or [])
+
+    def ranked_backends(self):
+        # Unmeasured backends go first so every backend gets a latency sample, unavailable ones go last
+        now = time.time()
+        with self.lock:
+            backends = list(self.backends)
+
+        def rank(backend):
+            p50 = backend.percentile(0.5)
+            return (backend.unavailable_until > now, p50 is not None, p50 or 0)
+        return sorted(backends, key=rank)
+
+    def hedge_delay(self, backend):
+        if not self.hedging or len(backend.latencies) < self.min_samples:
+            return None
+        return max(self.hedge_min_delay, backend.percentile(0.95))
+
+    def can_send_extra(self):
+        # The caller booked one slot; a hedge or failover is another real request, so only send one if the quota
+        # has room right now
+        if self.api_tracker is None:
+            return True
+        return self.api_tracker.try_reserve()
+
+    def record_hedge(self):
+        with self.lock:
+            self.hedges += 1
+
+    def record_route(self, backend, hedged):
+        with self.lock:
+            backend.wins += 1
+            if hedged:
+                self.hedge_wins += 1
+            self.last_route = backend.name + (" (hedge)" if hedged else "")
+
+    def get_stats(self):
+        with self.lock:
+            backends = list(self.backends)
+        return {
+            'backends': [{'name': backend.name, 'p50': backend.percentile(0.5), 'p95': backend.percentile(0.95),
+                          'requests': backend.requests, 'wins': backend.wins, 'failures': backend.failures}
+                         for backend in backends],
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'last_route': self.last_route,
+        }
+
+
+class RoutedChat:
+    def __init__(self, router, history):
+        self.router = router
+        with router.lock:
+            backends = list(router.backends)
+        if not backends:
+            raise ValueError("No model backends are configured; add at least one in the settings")
+        # Keeps the conversation in a chat of the first backend so genai converts the history for us
+        self.chat = backends[0].model.start_chat(history=history)
+
+    @property
+    def history(self):
+        return self.chat.history
+
+    @history.setter
+    def history(self, history):
+        self.chat.history = history
+
+    async def first_chunk(self, backend, content):
+        backend.requests += 1
+        chat = backend.model.start_chat(history=list(self.chat.history))
+        started = time.monotonic()
+        try:
+            response = await chat.send_message_async(content, stream=True)
+            iterator = response.__aiter__()
+            chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            chunk = None
+        except asyncio.CancelledError:
+            # Lost a hedge race; still a lower bound on this backend's latency, so its p95 doesn't look too good
+            backend.record_latency(time.monotonic() - started)
+            raise
+        backend.record_latency(time.monotonic() - started)
+        return chat, iterator, chunk
+
+    async def send_message_async(self, content, stream=True):
+        candidates = self.router.ranked_backends()
+        attempts = {}
+        hedged = False
+        last_error = None
+        winner = None
+        try:
+            while winner is None:
+                if not attempts:
+                    if not candidates:
+                        raise last_error
+                    if last_error is not None and not self.router.can_send_extra():
+                        raise last_error  # failing over would go past the rate limit
+                    backend = candidates.pop(0)
+                    attempts[asyncio.ensure_future(self.first_chunk(backend, content))] = backend
+                    primary = backend
+
+                timeout = self.router.hedge_delay(primary) if candidates and not hedged else None
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than its usual p95, race a duplicate on the next backend
+                    hedged = True
+                    if self.router.can_send_extra():
+                        backend = candidates.pop(0)
+                        self.router.record_hedge()
+                        attempts[asyncio.ensure_future(self.first_chunk(backend, content))] = backend
+                    continue
+
+                for attempt in done:
+                    backend = attempts.pop(attempt)
+                    if attempt.exception() is not None:
+                        last_error = attempt.exception()
+                        backend.record_failure()
+                    elif winner is None:
+                        winner = backend, attempt.result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+        backend, (chat, iterator, chunk) = winner
+        self.router.record_route(backend, backend is not primary)
+        return self.stream(chat, iterator, chunk)
+
+    async def stream(self, chat, iterator, chunk):
+        if chunk is not None:
+            yield chunk
+            async for chunk in iterator:
+                yield chunk
+        self.chat.history = chat.history
+
+class FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeContent:
+    def __init__(self, role, parts):
+        self.role = role
+        self.parts = [part if hasattr(part, 'text') else FakePart(str(part)) for part in parts]
+
+
+class FakeResponse:
+    def __init__(self, chat, chunks, first_token_delay, chunk_delay):
+        self.chat = chat
+        self.chunks = chunks
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.text = "".join(chunks)
+
+    def __iter__(self):
+        for index, chunk in enumerate(self.chunks):
+            time.sleep(self.first_token_delay if index == 0 else self.chunk_delay)
+            yield FakePart(chunk)
+
+    async def __aiter__(self):
+        for index, chunk in enumerate(self.chunks):
+            await asyncio.sleep(self.first_token_delay if index == 0 else self.chunk_delay)
+            yield FakePart(chunk)
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = history
+
+    @property
+    def history(self):
+        return self._history
+
+    @history.setter
+    def history(self, history):
+        self._history = [content if hasattr(content, 'parts') else FakeContent(content['role'], content['parts'])
+                         for content in history]
+
+    def respond(self, content):
+        message = content if isinstance(content, str) else next((part for part in content if isinstance(part, str)), "")
+        text = self.model.lookup(message)
+        self._history.append(FakeContent('user', [message]))
+        self._history.append(FakeContent('model', [text]))
+        size = self.model.chunk_size
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        return FakeResponse(self, chunks, self.model.first_token_delay, self.model.chunk_delay)
+
+    def send_message(self, content, stream=False):
+        response = self.respond(content)
+        if not stream:
+            time.sleep(response.first_token_delay + response.chunk_delay * (len(response.chunks) - 1))
+        return response
+
+    async def send_message_async(self, content, stream=False):
+        response = self.respond(content)
+        if not stream:
+            await asyncio.sleep(response.first_token_delay + response.chunk_delay * (len(response.chunks) - 1))
+        return response
+
+
+class FakeGenerativeModel:
+    # Stands in for genai.GenerativeModel with recorded responses and fixed timing, for offline benchmarks
+    def __init__(self, responses=None, default_response="", first_token_delay=0.5, chunk_delay=0.05, chunk_size=40,
+                 model_name="fake"):
+        self.responses = responses or {}
+        self.default_response = default_response
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.model_name = model_name
+        # Longest first so "open word and excel" wins over "open word"
+        self.recorded_prompts = sorted(self.responses, key=len, reverse=True)
+
+    def lookup(self, message):
+        if message in self.responses:
+            return self.responses[message]
+        # Handlers wrap the user's task in their own prompt template
+        for prompt in self.recorded_prompts:
+            if prompt in message:
+                return self.responses[prompt]
+        return self.default_response
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history or [])
+
+class FileHasher:
+    # SHA-256 of file contents, remembered by (path, size, mtime) so unchanged files aren't re-read
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hashes = OrderedDict()  # stat key -> content hash, least recently used first
+        self.lock = Lock()
+
+    def hash(self, file_path):
+        stat = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            content_hash = self.hashes.get(stat_key)
+            if content_hash is not None:
+                self.hashes.move_to_end(stat_key)
+                return content_hash
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        with self.lock:
+            self.hashes[stat_key] = content_hash
+            while len(self.hashes) > self.max_entries:
+                self.hashes.popitem(last=False)
+        return content_hash
+
+# Shared so a file attached to a request is hashed once for the response cache and the attachment
+file_hashes = FileHasher()
+
+class ResponseCache:
+    def __init__(self, cache_folder, max_bytes=50 * 1024 * 1024):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size on disk, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.in_flight = {}
+        self.lock = Lock()
+
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+        self.load_index()
+
+    def load_index(self):
+        found = []
+        for entry in os.scandir(self.cache_folder):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        with self.lock:
+            self.evict()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_folder, f"{key}.json")
+
+    def make_key(self, prompt, file_path, model_name):
+        normalized_prompt = " ".join(prompt.split())  # only whitespace; case can change what is asked for
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8") + b"\0")
+        digest.update(normalized_prompt.encode("utf-8") + b"\0")
+        if file_path:
+            digest.update(file_hashes.hash(file_path).encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f)['response']
+            os.utime(path)  # keep the on-disk order in line with the LRU order
+            return response
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                size = self.entries.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+
+    def put(self, key, response):
+        data = json.dumps({'response': response, 'created': time.time()}).encode("utf-8")
+        path = self.entry_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self.evict()
+
+    def evict(self):
+        # Caller holds self.lock
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.entry_path(key))
+            except OSError:
+                pass
+
+    async def get_or_compute(self, key, compute):
+        # Identical requests issued while one is already running wait for it and share its result.
+        # Runs on the job engine loop, so in_flight needs no lock.
+        while key in self.in_flight:
+            pending = self.in_flight[key]
+            try:
+                result = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                continue  # the request we were waiting on was cancelled, make our own
+            with self.lock:
+                self.coalesced += 1
+            return result, True
+
+        pending = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = pending
+        try:
+            result = self.get(key)
+            cached = result is not None
+            with self.lock:
+                if cached:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if not cached:
+                result = await compute()
+                if result:
+                    self.put(key, result)
+            pending.set_result(result)
+            return result, cached
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            del self.in_flight[key]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'coalesced': self.coalesced,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes
+            }
+
+class AttachmentProcessor:
+    # Files on the File API are deleted after 48 hours, so handles are re-uploaded a little before that
+    upload_ttl = 47 * 60 * 60
+    text_extensions = {'.py', '.txt', '.md', '.json', '.csv', '.log', '.yaml', '.yml', '.ini', '.cfg', '.toml',
+                       '.xml', '.html', '.js', '.ts', '.sql', '.sh', '.bat', '.ps1'}
+
+    def __init__(self, cache_folder=None, max_image_side=1536, jpeg_quality=85, text_byte_budget=64 * 1024,
+                 upload=False):
+        self.cache_folder = cache_folder
+        self.max_image_side = max_image_side
+        self.jpeg_quality = jpeg_quality
+        self.text_byte_budget = text_byte_budget
+        self.upload = upload and cache_folder is not None
+        self.prepared = OrderedDict()  # content hash -> prepared text or blob, most recently added last
+        self.max_prepared = 32
+        self.uploads = {}  # content hash -> {'name', 'uri', 'mime_type', 'uploaded'}
+        self.upload_bytes = 0
+        self.lock = Lock()
+
+        if self.cache_folder:
+            if not os.path.exists(self.cache_folder):
+                os.makedirs(self.cache_folder)
+            self.load_uploads()
+
+    def index_path(self):
+        return os.path.join(self.cache_folder, "uploads.json")
+
+    def load_uploads(self):
+        try:
+            with open(self.index_path(), 'r') as f:
+                uploads = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self.uploads = {key: upload for key, upload in uploads.items() if now - upload['uploaded'] < self.upload_ttl}
+
+    def save_uploads(self):
+        # Caller holds self.lock
+        temp_path = f"{self.index_path()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.uploads, f)
+            os.replace(temp_path, self.index_path())
+        except OSError:
+            pass
+
+    def prepare(self, file_path):
+        # Returns a content part for send_message: text, an inline blob or a reference to an uploaded file
+        content_hash = file_hashes.hash(file_path)
+        with self.lock:
+            upload = self.uploads.get(content_hash)
+            if upload and time.time() - upload['uploaded'] < self.upload_ttl:
+                return {'file_data': {'mime_type': upload['mime_type'], 'file_uri': upload['uri']}}
+            part = self.prepared.get(content_hash)
+
+        if part is None:
+            mime_type = mimetypes.guess_type(file_path)[0] or ''
+            if mime_type.startswith('image/'):
+                part = self.prepare_image(file_path)
+            elif self.is_text(file_path, mime_type):
+                part = self.prepare_text(file_path)
+            else:
+                with open(file_path, 'rb') as file:
+                    part = {'mime_type': mime_type or 'application/octet-stream', 'data': file.read()}
+            with self.lock:
+                self.prepared[content_hash] = part
+                while len(self.prepared) > self.max_prepared:
+                    self.prepared.popitem(last=False)
+
+        if isinstance(part, str):
+            return part
+        if self.upload:
+            uploaded = self.upload_part(content_hash, part)
+            if uploaded:
+                return uploaded
+        return part
+
+    def is_text(self, file_path, mime_type):
+        if mime_type.startswith('text/') or os.path.splitext(file_path)[1].lower() in self.text_extensions:
+            return True
+        with open(file_path, 'rb') as file:
+            sample = file.read(4096)
+        if b"\0" in sample:
+            return False
+        try:
+            sample.decode('utf-8')
+        except UnicodeDecodeError as e:
+            return e.start > len(sample) - 4  # a character cut off by the sample boundary
+        return True
+
+    def prepare_image(self, file_path):
+        image = Image.open(file_path)
+        # Lets the JPEG decoder scale down while decoding instead of expanding every pixel of a huge photo
+        image.draft('RGB', (self.max_image_side, self.max_image_side))
+        image.thumbnail((self.max_image_side, self.max_image_side))
+        output = io.BytesIO()
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image.save(output, format='PNG', optimize=True)
+            mime_type = 'image/png'
+        else:
+            image.convert('RGB').save(output, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            mime_type = 'image/jpeg'
+        return {'mime_type': mime_type, 'data': output.getvalue()}
+
+    def prepare_text(self, file_path):
+        with open(file_path, 'rb') as file:
+            data = file.read(self.text_byte_budget + 1)
+            truncated = len(data) > self.text_byte_budget
+            if truncated:
+                data = data[:self.text_byte_budget]
+                # Cut at a line boundary so the model doesn't see half a line
+                data = data[:data.rfind(b"\n") + 1] or data
+                remaining = os.fstat(file.fileno()).st_size - len(data)
+        text = data.decode('utf-8', errors='replace')
+        name = os.path.basename(file_path)
+        if truncated:
+            text += f"\n[... {remaining} more bytes of {name} omitted ...]\n"
+        return f"Contents of the attached file {name}:\n{text}"
+
+    def upload_part(self, content_hash, part):
+        extension = mimetypes.guess_extension(part['mime_type']) or ".bin"
+        path = os.path.join(self.cache_folder, content_hash + extension)
+        try:
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(part['data'])
+            uploaded = genai.upload_file(path, mime_type=part['mime_type'])
+        except Exception:
+            return None  # no File API access, send the data inline instead
+        upload = {'name': uploaded.name, 'uri': uploaded.uri, 'mime_type': part['mime_type'], 'uploaded': time.time()}
+        with self.lock:
+            self.uploads[content_hash] = upload
+            self.upload_bytes += len(part['data'])
+            self.save_uploads()
+        return {'file_data': {'mime_type': upload['mime_type'], 'file_uri': upload['uri']}}
+
+EXECUTOR_WORKER_SOURCE = r"""
+import json
+import os
+import sys
+import threading
+import traceback
+import base64
+import marshal
+
+for _module in sys.argv[1:]:
+    try:
+        __import__(_module)
+    except Exception:
+        pass
+
+_job = json.loads(sys.stdin.readline())
+sys.stdin = open(os.devnull)
+
+# The protocol gets its own copy of the stdout pipe; fds 1 and 2 are then pointed at private pipes, so neither
+# the script nor its child processes (os.system, subprocess) can write into the protocol stream
+_protocol_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+_protocol_lock = threading.Lock()
+
+def _emit(message):
+    with _protocol_lock:
+        _protocol_out.write(json.dumps(message) + "\n")
+        _protocol_out.flush()
+
+def _relay(read_fd, name):
+    buffer = b""
+    while True:
+        data = os.read(read_fd, 64 * 1024)
+        if not data:
+            break
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            _emit({"stream": name, "text": line.decode("utf-8", "replace").rstrip("\r")})
+    if buffer:
+        _emit({"stream": name, "text": buffer.decode("utf-8", "replace").rstrip("\r")})
+    os.close(read_fd)
+
+def _redirect(fd, name):
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, fd)
+    os.close(write_fd)
+    thread = threading.Thread(target=_relay, args=(read_fd, name), daemon=True)
+    thread.start()
+    return thread
+
+_relays = [_redirect(1, "stdout"), _redirect(2, "stderr")]
+os.environ.update(_job.get("env") or {})
+_error = None
+_code = None
+if _job.get("bytecode") and _job.get("cache_tag") == sys.implementation.cache_tag:
+    try:
+        _code = marshal.loads(base64.b64decode(_job["bytecode"]))
+    except (ValueError, EOFError, TypeError):
+        pass  # damaged cache entry, compile the source instead
+try:
+    if _code is None:
+        _code = compile(_job["code"], "<script>", "exec")
+    exec(_code, {"__name__": "__main__", "__builtins__": __builtins__})
+except SystemExit as e:
+    if e.code not in (None, 0):
+        _error = f"Script exited with status {e.code}"
+except BaseException as e:
+    traceback.print_exc()
+    _error = f"{type(e).__name__}: {e}"
+sys.stdout.flush()
+sys.stderr.flush()
+# Closing our ends lets the relays finish; a child still holding the pipes only delays us briefly
+_null = os.open(os.devnull, os.O_WRONLY)
+os.dup2(_null, 1)
+os.dup2(_null, 2)
+for _thread in _relays:
+    _thread.join(timeout=2)
+_emit({"done": True, "error": _error})
+"""
+
+class ScriptExecutorPool:
+    def __init__(self, size=2, preload_modules=None, python_executable=None, environment_size=1, max_environments=4):
+        self.size = size
+        self.preload_modules = preload_modules or []
+        self.python_executable = python_executable or sys.executable
+        # Script environments get a smaller pool each, kept only for the most recently used interpreters
+        self.environment_size = environment_size
+        self.max_environments = max_environments
+        self.idle_workers = OrderedDict([(self.python_executable, [])])  # interpreter -> idle workers, LRU first
+        self.running_workers = set()
+        self.lock = Lock()
+        self.closed = False
+
+    def start(self, python_executable=None):
+        threading.Thread(target=self.fill, args=(python_executable or self.python_executable,), daemon=True).start()
+
+    def spawn_worker(self, python_executable=None):
+        env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+        return subprocess.Popen(
+            [python_executable or self.python_executable, "-c", EXECUTOR_WORKER_SOURCE] + list(self.preload_modules),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace", env=env,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+
+    def fill(self, python_executable):
+        size = self.size if python_executable == self.python_executable else self.environment_size
+        while True:
+            with self.lock:
+                if self.closed or python_executable not in self.idle_workers:
+                    return  # closed, or the environment was evicted meanwhile
+                workers = [w for w in self.idle_workers[python_executable] if w.poll() is None]
+                self.idle_workers[python_executable] = workers
+                if len(workers) >= size:
+                    return
+            worker = self.spawn_worker(python_executable)
+            with self.lock:
+                if self.closed or python_executable not in self.idle_workers:
+                    worker.kill()
+                    return
+                self.idle_workers[python_executable].append(worker)
+
+    def acquire(self, python_executable=None):
+        python_executable = python_executable or self.python_executable
+        worker = None
+        evicted = []
+        with self.lock:
+            workers = self.idle_workers.setdefault(python_executable, [])
+            self.idle_workers.move_to_end(python_executable)
+            while workers and worker is None:
+                candidate = workers.pop(0)
+                if candidate.poll() is None:
+                    worker = candidate
+            environments = [key for key in self.idle_workers if key != self.python_executable]
+            for key in environments[:max(0, len(environments) - self.max_environments)]:
+                evicted.extend(self.idle_workers.pop(key))
+        for idle in evicted:
+            idle.kill()
+        if worker is None:
+            worker = self.spawn_worker(python_executable)  # pool exhausted, fall back to a cold start
+        with self.lock:
+            self.running_workers.add(worker)
+        self.start(python_executable)  # replace the worker we just took
+        return worker
+
+    def run(self, code, on_output, python_executable=None, on_start=None, bytecode=None, env=None):
+        # Workers are single-use so every script gets a clean interpreter and namespace
+        worker = self.acquire(python_executable)
+        if on_start:
+            on_start(worker)
+        job = {'code': code, 'env': env}
+        if bytecode:
+            # The worker only uses it if its interpreter matches the one that compiled it
+            job.update(bytecode=base64.b64encode(bytecode).decode('ascii'), cache_tag=sys.implementation.cache_tag)
+        try:
+            try:
+                worker.stdin.write(json.dumps(job) + "\n")
+                worker.stdin.close()
+            except OSError as e:
+                return f"Could not start script worker: {e}"
+
+            # The worker's own stderr (interpreter crashes, preload warnings) is kept apart from the protocol
+            stderr_reader = threading.Thread(target=self.forward_stderr, args=(worker, on_output), daemon=True)
+            stderr_reader.start()
+            error = "Script worker exited unexpectedly"
+            for line in worker.stdout:
+                message = self.parse_message(line)
+                if message is None:
+                    on_output('stdout', line.rstrip("\n"))
+                elif 'done' in message:
+                    error = message.get('error')
+                    break
+                else:
+                    on_output(message['stream'], message['text'])
+            stderr_reader.join(timeout=5)
+            return error
+        finally:
+            try:
+                worker.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+            with self.lock:
+                self.running_workers.discard(worker)
+
+    @staticmethod
+    def parse_message(line):
+        # Anything that isn't a well-formed protocol message is treated as plain output
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(message, dict):
+            return None
+        if message.get('done') is True and (message.get('error') is None or isinstance(message.get('error'), str)):
+            return {'done': True, 'error': message.get('error')}
+        if message.get('stream') in ('stdout', 'stderr') and isinstance(message.get('text'), str):
+            return message
+        return None
+
+    @staticmethod
+    def forward_stderr(worker, on_output):
+        for line in worker.stderr:
+            on_output('stderr', line.rstrip("\n"))
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            workers = [worker for idle in self.idle_workers.values() for worker in idle] + list(self.running_workers)
+            self.idle_workers.clear()
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+
+class BytecodeCache:
+    # Compiled saved scripts marshalled to disk, keyed by source hash and interpreter, so repeat runs skip compiling
+    def __init__(self, cache_folder, max_memory_entries=256):
+        self.cache_folder = cache_folder
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()  # key -> marshalled code object, least recently used first
+        self.suffix = f".{sys.implementation.cache_tag}-{importlib.util.MAGIC_NUMBER.hex()}.bin"
+        self.hits = 0
+        self.compiles = 0
+        self.lock = Lock()
+
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+    def make_key(self, code):
+        return hashlib.sha256(code.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_folder, key + self.suffix)
+
+    def get(self, code):
+        # Returns marshalled bytecode, or None if the code doesn't compile so the worker reports the error
+        key = self.make_key(code)
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self.read_entry(key)
+        if data is not None:
+            with self.lock:
+                self.hits += 1
+        else:
+            try:
+                data = marshal.dumps(compile(code, "<script>", "exec"))
+            except (SyntaxError, ValueError):
+                return None
+            self.put(key, data)
+        self.remember(key, data)
+        return data
+
+    def read_entry(self, key):
+        # A truncated or corrupt entry is treated as a miss and overwritten by a fresh compile
+        try:
+            with open(self.entry_path(key), 'rb') as f:
+                data = f.read()
+            if isinstance(marshal.loads(data), types.CodeType):
+                return data
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        return None
+
+    def put(self, key, data):
+        path = self.entry_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            pass  # still cached in memory
+        with self.lock:
+            self.compiles += 1
+
+    def remember(self, key, data):
+        with self.lock:
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+
+    def prune(self, codes):
+        # Drops entries for source that no saved script has any more (edited or deleted scripts)
+        keep = {self.make_key(code) for code in codes}
+        with self.lock:
+            for key in [key for key in self.memory if key not in keep]:
+                del self.memory[key]
+        removed = 0
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.endswith(".bin") and entry.name.split(".", 1)[0] not in keep:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class DependencyResolver:
+    # Import names whose pip distribution is published under a different name
+    distribution_names = {
+        'win32gui': 'pywin32', 'win32con': 'pywin32', 'win32api': 'pywin32', 'win32com': 'pywin32',
+        'win32clipboard': 'pywin32', 'win32process': 'pywin32', 'win32file': 'pywin32', 'win32event': 'pywin32',
+        'win32service': 'pywin32', 'win32ui': 'pywin32', 'pythoncom': 'pywin32', 'pywintypes': 'pywin32',
+        'PIL': 'Pillow', 'bs4': 'beautifulsoup4', 'cv2': 'opencv-python', 'sklearn': 'scikit-learn',
+        'skimage': 'scikit-image', 'yaml': 'PyYAML', 'dateutil': 'python-dateutil', 'dotenv': 'python-dotenv',
+        'docx': 'python-docx', 'pptx': 'python-pptx', 'fitz': 'PyMuPDF', 'serial': 'pyserial', 'usb': 'pyusb',
+        'Crypto': 'pycryptodome', 'OpenSSL': 'pyOpenSSL', 'jwt': 'PyJWT', 'magic': 'python-magic',
+        'speech_recognition': 'SpeechRecognition', 'vlc': 'python-vlc', 'Levenshtein': 'python-Levenshtein',
+        'MySQLdb': 'mysqlclient', 'psycopg2': 'psycopg2-binary', 'zmq': 'pyzmq', 'wx': 'wxPython',
+        'gi': 'PyGObject', 'telegram': 'python-telegram-bot', 'attr': 'attrs', 'googleapiclient': 'google-api-python-client',
+    }
+
+    def __init__(self, python_executable=None):
+        self.python_executable = python_executable or sys.executable
+        self.stdlib_modules = set(getattr(sys, 'stdlib_module_names', ())) | set(sys.builtin_module_names)
+        self.stdlib_modules.add('__future__')
+        self.spec_cache = {}  # module name -> installed?, kept for the lifetime of the app
+        self.lock = Lock()
+
+    def find_imports(self, code):
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return self.find_imports_in_lines(code)
+
+        optional = self.optional_imports(tree)
+        modules = []
+        for node in ast.walk(tree):
+            if node in optional:
+                continue
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            elif (isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant)
+                  and isinstance(node.args[0].value, str) and self.is_dynamic_import(node.func)):
+                names = [node.args[0].value]  # __import__("x") or importlib.import_module("x")
+            else:
+                continue
+            for name in names:
+                top_level = name.split('.')[0]
+                if top_level not in modules:
+                    modules.append(top_level)
+        return modules
+
+    @staticmethod
+    def is_dynamic_import(func):
+        if isinstance(func, ast.Name):
+            return func.id in ('__import__', 'import_module')
+        return (isinstance(func, ast.Attribute) and func.attr == 'import_module'
+                and isinstance(func.value, ast.Name) and func.value.id == 'importlib')
+
+    def optional_imports(self, tree):
+        # Imports in a try whose ImportError handler imports something else, e.g. ujson falling back to json;
+        # the fallback is what has to be there
+        optional = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Try):
+                continue
+            for handler in node.handlers:
+                caught = handler.type
+                names = caught.elts if isinstance(caught, ast.Tuple) else [caught]
+                if not any(name is None or (isinstance(name, ast.Name)
+                                            and name.id in ('ImportError', 'ModuleNotFoundError', 'Exception'))
+                           for name in names):
+                    continue
+                if any(isinstance(child, (ast.Import, ast.ImportFrom)) for statement in handler.body
+                       for child in ast.walk(statement)):
+                    optional.update(child for statement in node.body for child in ast.walk(statement)
+                                    if isinstance(child, (ast.Import, ast.ImportFrom)))
+                    break
+        return optional
+
+    def find_imports_in_lines(self, code):
+        # Fallback for code that does not parse, e.g. a truncated response
+        modules = []
+        for line in code.splitlines():
+            import_match = re.match(r"\s*import\s+(.+)", line)
+            from_match = re.match(r"\s*from\s+([\w.]+)\s+import\b", line)
+            if from_match:
+                names = [from_match.group(1)]
+            elif import_match:
+                names = [part.split(" as ")[0].strip() for part in import_match.group(1).split("#")[0].split(",")]
+            else:
+                continue
+            for name in names:
+                top_level = name.split('.')[0]
+                if top_level.isidentifier() and top_level not in modules:
+                    modules.append(top_level)
+        return modules
+
+    def is_stdlib(self, module):
+        return module in self.stdlib_modules
+
+    def distribution_name(self, module):
+        return self.distribution_names.get(module, module)
+
+    def is_installed(self, module):
+        with self.lock:
+            if module in self.spec_cache:
+                return self.spec_cache[module]
+        try:
+            installed = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            installed = False
+        with self.lock:
+            self.spec_cache[module] = installed
+        return installed
+
+    def third_party_distributions(self, code):
+        modules = [module for module in self.find_imports(code) if not self.is_stdlib(module)]
+        return sorted(set(self.distribution_name(module) for module in modules))
+
+    def find_missing(self, code):
+        missing = {}
+        for module in self.find_imports(code):
+            if not self.is_stdlib(module) and not self.is_installed(module):
+                missing[module] = self.distribution_name(module)
+        return missing
+
+    def install(self, distributions, on_start=None):
+        # A single pip invocation resolves and installs the whole set at once
+        run_pip([self.python_executable, "-m", "pip", "install", *distributions], on_start)
+        importlib.invalidate_caches()
+        with self.lock:
+            self.spec_cache = {module: installed for module, installed in self.spec_cache.items() if installed}
+
+def run_pip(command, on_start=None):
+    # Like subprocess.check_call, but hands the process to on_start so a cancelled job can terminate it
+    process = subprocess.Popen(command)
+    if on_start:
+        on_start(process)
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+class DependencyPrefetcher:
+    def __init__(self, dependency_resolver, install_packages, log_output, check_installed=True):
+        self.dependency_resolver = dependency_resolver
+        self.install_packages = install_packages
+        self.log_output = log_output
+        self.check_installed = check_installed
+        self.buffer = ""
+        self.continued_line = ""
+        self.in_string = False
+        self.seen_modules = set()
+        self.pending_modules = []
+        self.finished = False
+        self.cancelled = False
+        self.process = None  # the pip run in progress, terminated on cancel
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def feed(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.scan_line(line)
+
+    def scan_line(self, line):
+        # Skip text inside triple-quoted strings so docstrings are not mistaken for imports
+        quotes = line.count('"""') + line.count("'''")
+        if self.in_string or quotes:
+            if quotes % 2:
+                self.in_string = not self.in_string
+            return
+
+        line = self.continued_line + line.strip()
+        if line.endswith("\\"):
+            self.continued_line = line[:-1] + " "
+            return
+        self.continued_line = ""
+
+        modules = [module for module in self.dependency_resolver.find_imports_in_lines(line)
+                   if module not in self.seen_modules and not self.dependency_resolver.is_stdlib(module)]
+        if not modules:
+            return
+        with self.condition:
+            if self.finished:
+                return
+            self.seen_modules.update(modules)
+            self.pending_modules.extend(modules)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.install_pending, daemon=True)
+                self.worker.start()
+            self.condition.notify()
+
+    def install_pending(self):
+        while True:
+            with self.condition:
+                while not self.pending_modules and not self.finished:
+                    self.condition.wait()
+                if not self.pending_modules:
+                    return
+                # Everything detected since the last install goes into the same pip invocation
+                modules, self.pending_modules = self.pending_modules, []
+
+            if self.check_installed:
+                modules = [module for module in modules if not self.dependency_resolver.is_installed(module)]
+            packages = sorted(set(self.dependency_resolver.distribution_name(module) for module in modules))
+            if packages and not self.cancelled:
+                self.log_output.insert(tk.END, f"Prefetching dependencies while the response streams: {' '.join(packages)}\n")
+                self.log_output.see(tk.END)
+                self.install_packages(packages, self.process_started)
+                with self.condition:
+                    self.process = None
+
+    def process_started(self, process):
+        with self.condition:
+            self.process = process
+            cancelled = self.cancelled
+        if cancelled:
+            process.terminate()
+
+    def finish(self):
+        # Lets the install thread exit once the pending installs are done; safe to call more than once
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+            return self.worker
+
+    def wait(self):
+        if self.buffer:
+            self.scan_line(self.buffer)
+            self.buffer = ""
+        worker = self.finish()
+        if worker:
+            worker.join()
+
+    def cancel(self):
+        # Drops queued installs and stops the one in progress, without waiting for the thread
+        with self.condition:
+            self.cancelled = True
+            self.pending_modules = []
+            process = self.process
+        self.finish()
+        if process and process.poll() is None:
+            process.terminate()
+
+class EnvironmentManager:
+    def __init__(self, environments_folder, wheelhouse_folder, base_python=None):
+        self.environments_folder = environments_folder
+        self.wheelhouse_folder = wheelhouse_folder
+        self.base_python = base_python or sys.executable
+        self.base_folder = os.path.join(self.environments_folder, "_base")
+        self.lock = Lock()
+        self.environment_locks = {}
+
+        for folder in (self.environments_folder, self.wheelhouse_folder):
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+    def environment_key(self, packages):
+        normalized = sorted(set(re.sub(r"[-_.]+", "-", package).lower() for package in packages))
+        return hashlib.sha256("\n".join(normalized).encode("utf-8")).hexdigest()[:16]
+
+    def environment_python(self, environment_folder):
+        if os.name == 'nt':
+            return os.path.join(environment_folder, "Scripts", "python.exe")
+        return os.path.join(environment_folder, "bin", "python")
+
+    def ensure_base(self):
+        with self.lock:
+            if os.path.exists(os.path.join(self.base_folder, ".ready")):
+                return
+            if os.path.exists(self.base_folder):
+                shutil.rmtree(self.base_folder)
+            venv.EnvBuilder(with_pip=True, symlinks=(os.name != 'nt')).create(self.base_folder)
+            with open(os.path.join(self.base_folder, ".ready"), 'w') as f:
+                f.write(self.base_python)
+
+    def link_or_copy(self, source, destination):
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)  # different volume or no hardlink support
+        return destination
+
+    def clone_base(self, environment_folder):
+        # Hardlinking the base env makes a new env cost a directory walk instead of a venv + pip bootstrap
+        shutil.copytree(self.base_folder, environment_folder, symlinks=True, copy_function=self.link_or_copy,
+                        ignore=shutil.ignore_patterns(".ready"))
+
+    def fetch_wheels(self, packages, on_start=None):
+        # pip resolves the whole dependency tree; the offline pass succeeds when the wheelhouse already covers it
+        download = [self.base_python, "-m", "pip", "download", "--dest", self.wheelhouse_folder,
+                    "--find-links", self.wheelhouse_folder, "--prefer-binary"]
+        try:
+            run_pip(download + ["--no-index", "-qqq", *packages], on_start)
+        except subprocess.CalledProcessError:
+            run_pip(download + list(packages), on_start)
+
+    def install_into(self, environment_folder, packages):
+        python_executable = self.environment_python(environment_folder)
+        offline_install = [python_executable, "-m", "pip", "install", "--no-index",
+                           "--find-links", self.wheelhouse_folder, *packages]
+        if subprocess.call(offline_install) != 0:
+            self.fetch_wheels(packages)
+            subprocess.check_call(offline_install)
+
+    def ensure_environment(self, packages):
+        key = self.environment_key(packages)
+        environment_folder = os.path.join(self.environments_folder, key)
+        python_executable = self.environment_python(environment_folder)
+        marker = os.path.join(environment_folder, ".ready")
+
+        with self.lock:
+            environment_lock = self.environment_locks.setdefault(key, Lock())
+        with environment_lock:
+            if os.path.exists(marker):
+                return python_executable
+
+            self.ensure_base()
+            if os.path.exists(environment_folder):
+                shutil.rmtree(environment_folder)  # left over from an interrupted install
+            self.clone_base(environment_folder)
+            try:
+                self.install_into(environment_folder, packages)
+            except (subprocess.CalledProcessError, OSError):
+                shutil.rmtree(environment_folder, ignore_errors=True)
+                raise
+            with open(marker, 'w') as f:
+                json.dump(sorted(packages), f)
+        return python_executable
+
+class MarkdownStream:
+    # Renders Markdown into Tk text tags as chunks arrive, in one pass over the text
+    line_prefix = re.compile(r"[ \t]*[#>*+\-`0-9.]*[ \t]*")
+    header = re.compile(r"(#{1,6})[ \t]+")
+    bullet = re.compile(r"([ \t]*)[-*+][ \t]+")
+    rule = re.compile(r"[ \t]*([-*_])[ \t]*(\1[ \t]*){2,}$")
+    inline_special = re.compile(r"[`*\n]")
+    code_special = re.compile(r"[`\n]")
+
+    def __init__(self, log_output):
+        self.log_output = log_output
+        self.pending = ""
+        self.at_line_start = True
+        self.in_code_block = False
+        self.line_tags = ()  # tags for the rest of the current line, e.g. a header
+        self.bold = False
+        self.italic = False
+        self.code = False
+        self.in_fence_line = False  # skipping the rest of a ``` line, e.g. the language name
+
+    def tags(self):
+        if self.in_code_block:
+            return ('md_code_block',)
+        tags = self.line_tags
+        if self.code:
+            return tags + ('md_code',)
+        if self.bold:
+            tags += ('md_bold',)
+        if self.italic:
+            tags += ('md_italic',)
+        return tags
+
+    def emit(self, text, tags=None):
+        if text:
+            self.log_output.insert(tk.END, text, tags if tags is not None else self.tags())
+
+    def feed(self, text):
+        text = self.pending + text
+        self.pending = ""
+        position = 0
+        length = len(text)
+        while position < length:
+            if self.in_fence_line:
+                newline = text.find("\n", position)
+                if newline == -1:
+                    return
+                self.in_fence_line = False
+                self.at_line_start = True
+                position = newline + 1
+                continue
+
+            if self.at_line_start:
+                prefix_end = self.line_prefix.match(text, position).end()
+                if prefix_end == length:
+                    # Can't tell a marker from text yet, wait for the next chunk
+                    self.pending = text[position:]
+                    return
+                position = self.start_line(text, position, prefix_end)
+                continue
+
+            pattern = self.code_special if (self.code or self.in_code_block) else self.inline_special
+            match = pattern.search(text, position)
+            if match is None:
+                self.emit(text[position:])
+                return
+            self.emit(text[position:match.start()])
+            position = match.start()
+            char = text[position]
+
+            if char == "\n":
+                self.emit("\n", self.tags() if self.in_code_block else ())
+                self.line_tags = ()
+                self.bold = self.italic = self.code = False
+                self.at_line_start = True
+                position += 1
+            elif char == "`":
+                if self.in_code_block:
+                    self.emit("`")
+                else:
+                    self.code = not self.code
+                position += 1
+            elif position + 1 == length:
+                self.pending = "*"  # might be the first half of **
+                return
+            elif text[position + 1] == "*":
+                self.bold = not self.bold
+                position += 2
+            elif self.italic or not text[position + 1].isspace():
+                self.italic = not self.italic
+                position += 1
+            else:
+                self.emit("*")  # a lone asterisk, e.g. in 2 * 3
+                position += 1
+
+    def start_line(self, text, position, prefix_end):
+        self.at_line_start = False
+        newline = text.find("\n", position)
+        line_end = newline if newline != -1 else len(text)
+        line = text[position:line_end]
+
+        if line.lstrip().startswith("```"):
+            self.in_code_block = not self.in_code_block
+            self.in_fence_line = True
+            return position
+        if self.in_code_block:
+            return position
+        if newline != -1 and self.rule.match(line):
+            self.emit("\u2500" * 40, ('md_rule',))
+            return newline
+
+        header = self.header.match(text, position)
+        if header:
+            self.line_tags = (f"md_h{min(len(header.group(1)), 3)}",)
+            return header.end()
+        bullet = self.bullet.match(text, position)
+        if bullet and bullet.end() <= prefix_end:
+            self.emit(bullet.group(1) + "\u2022 ", ('md_bullet',))
+            return bullet.end()
+        if text.startswith(">", position):
+            self.line_tags = ('md_quote',)
+            return position + 1 + (text[position + 1:position + 2] == " ")
+        return position
+
+    def flush(self):
+        # The answer ended inside something that looked like a marker, show it as text
+        self.emit(self.pending)
+        self.pending = ""
+
+class StreamingOutput:
+    def __init__(self, log_output, progress_var, ttft_var=None, expected_length=1500, renderer=None):
+        self.log_output = log_output
+        self.progress_var = progress_var
+        self.ttft_var = ttft_var
+        self.renderer = renderer
+        self.expected_length = expected_length
+        self.mark = f"stream_{id(self)}"
+        self.received = 0
+        self.request_started = None
+        self.first_token_time = None
+        self.closed = False
+
+    def start(self):
+        self.log_output.mark_set(self.mark, "end-1c")
+        self.log_output.mark_gravity(self.mark, tk.LEFT)
+        if self.ttft_var:
+            self.ttft_var.set("First token: waiting...")
+
+    def begin_request(self):
+        self.request_started = time.time()
+
+    def write(self, text):
+        if self.first_token_time is None and self.request_started is not None:
+            self.first_token_time = time.time() - self.request_started
+            if self.ttft_var:
+                self.ttft_var.set(f"First token: {self.first_token_time:.2f}s")
+        # Appends are merged into one insert per frame by the UI update bus
+        if self.renderer:
+            self.renderer.feed(text)
+        else:
+            self.log_output.insert(tk.END, text)
+        self.log_output.see(tk.END)
+        self.received += len(text)
+        # The final length is unknown, so approach 90% asymptotically instead of stepping per chunk
+        self.progress_var.set(90 * self.received / (self.received + self.expected_length))
+
+    def close(self, final_text=None, cached=False):
+        if self.closed:
+            return
+        self.closed = True
+        if self.renderer:
+            self.renderer.flush()
+        if final_text is not None:
+            self.log_output.delete(self.mark, tk.END)
+            self.log_output.insert(tk.END, final_text)
+        self.log_output.mark_unset(self.mark)
+        self.log_output.see(tk.END)
+        if self.ttft_var and self.first_token_time is None:
+            self.ttft_var.set("First token: cached" if cached else "")
+
+# Id of the job whose coroutine (or to_thread call) is running, so spans can be attributed without threading it through
+current_job_id = contextvars.ContextVar('current_job_id', default=None)
+
+class MetricsRecorder:
+    stages = ['prompt_build', 'first_token', 'stream', 'resolve', 'install', 'execute', 'render']
+
+    def __init__(self, export_file=None, window=500, export_interval=5, max_jobs=50):
+        self.export_file = export_file
+        self.window = window
+        self.export_interval = export_interval
+        self.max_jobs = max_jobs
+        self.samples = {}  # stage -> recent durations in seconds
+        self.counts = {}
+        self.sums = {}
+        self.jobs = OrderedDict()  # job id -> spans of the most recent jobs
+        self.dirty = False
+        self.lock = Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # Exports run on their own thread so the render spans recorded on the UI thread never wait on disk
+        if self.export_file:
+            self.thread = threading.Thread(target=self.export_loop, daemon=True)
+            self.thread.start()
+
+    def export_loop(self):
+        while not self.stopped.wait(self.export_interval):
+            if self.dirty:
+                self.export()
+
+    def shutdown(self):
+        self.stopped.set()
+        if self.export_file and self.dirty:
+            self.export()
+
+    def record(self, stage, seconds, detail=None, job_id=None):
+        if job_id is None:
+            job_id = current_job_id.get()
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+                self.sums[stage] = 0.0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+            self.sums[stage] += seconds
+            if job_id is not None:
+                span = {'stage': stage, 'seconds': seconds, 'finished': time.time()}
+                if detail:
+                    span['detail'] = detail
+                self.jobs.setdefault(job_id, []).append(span)
+                self.jobs.move_to_end(job_id)
+                while len(self.jobs) > self.max_jobs:
+                    self.jobs.popitem(last=False)
+            self.dirty = True
+
+    @contextlib.contextmanager
+    def span(self, stage, detail=None):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - started, detail)
+
+    def get_stage_stats(self):
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+            counts = dict(self.counts)
+            sums = dict(self.sums)
+        ordered = [stage for stage in self.stages if stage in samples] + sorted(set(samples) - set(self.stages))
+        return {stage: {'p50': percentile(samples[stage], 0.5), 'p95': percentile(samples[stage], 0.95),
+                        'count': counts[stage], 'sum': sums[stage]} for stage in ordered}
+
+    def get_job_spans(self, job_id):
+        with self.lock:
+            return list(self.jobs.get(job_id, []))
+
+    def format_prometheus(self, stats):
+        lines = ["# HELP task_automate_stage_seconds Duration of generate/install/execute pipeline stages.",
+                 "# TYPE task_automate_stage_seconds summary"]
+        for stage, stage_stats in stats.items():
+            for key, quantile in (('p50', '0.5'), ('p95', '0.95')):
+                lines.append(f'task_automate_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f'{stage_stats[key]:.6f}')
+            lines.append(f'task_automate_stage_seconds_sum{{stage="{stage}"}} {stage_stats["sum"]:.6f}')
+            lines.append(f'task_automate_stage_seconds_count{{stage="{stage}"}} {stage_stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        self.dirty = False
+        stats = self.get_stage_stats()
+        if self.export_file.endswith(".json"):
+            with self.lock:
+                jobs = {str(job_id): list(spans) for job_id, spans in self.jobs.items()}
+            content = json.dumps({'updated': time.time(), 'stages': stats, 'jobs': jobs}, indent=2)
+        else:
+            content = self.format_prometheus(stats)
+
+        # Write to a temp file and swap it in, so scrapers never read a half-written file
+        temp_file = f"{self.export_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(content)
+            os.replace(temp_file, self.export_file)
+        except OSError:
+            pass
+
+class Job:
+    def __init__(self, job_id, description, priority, coroutine_factory):
+        self.job_id = job_id
+        self.description = description
+        self.priority = priority
+        self.coroutine_factory = coroutine_factory
+        self.status = 'queued'
+        self.task = None
+        self.process = None  # worker process of a running script, killed on cancel
+        self.on_update = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+class JobEngine:
+    HIGH_PRIORITY = 0
+    NORMAL_PRIORITY = 10
+    LOW_PRIORITY = 20
+
+    def __init__(self, max_concurrent_jobs=2, max_history=50):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_history = max_history
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_loop, daemon=True)
+        self.job_ids = itertools.count(1)
+        self.jobs = {}  # job id -> queued or running job
+        self.history = OrderedDict()  # job id -> the most recently finished jobs, oldest first
+        self.lock = Lock()
+        self.listeners = []
+        self.queue = None
+        self.workers = []
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start_workers(), self.loop).result()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def start_workers(self):
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [self.loop.create_task(self.worker()) for _ in range(self.max_concurrent_jobs)]
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def notify(self, job):
+        for callback in self.listeners:
+            callback(job)
+        if job.on_update:
+            job.on_update(job)
+
+    def submit(self, description, coroutine_factory, priority=NORMAL_PRIORITY, on_update=None):
+        # coroutine_factory receives the Job and returns the coroutine to run on the engine loop; on_update is
+        # called with the Job on every status change, starting with 'queued' before submit returns.
+        # Listeners run inline on the notifying thread, so callers must not hold their own locks while submitting
+        job = Job(next(self.job_ids), description, priority, coroutine_factory)
+        job.on_update = on_update
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (priority, job.job_id, job))
+        self.notify(job)
+        return job
+
+    def busy(self, except_job=None):
+        # Whether any other job is queued or running, e.g. still writing to the shared output
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return any(job is not except_job and job.status in ('queued', 'running') for job in jobs)
+
+    def known_job_ids(self):
+        # Active jobs plus the recent history, e.g. for the rows the job list keeps
+        with self.lock:
+            return set(self.jobs) | set(self.history)
+
+    def retire(self, job):
+        # Called after the final notify; only a short history of finished jobs is kept
+        job.coroutine_factory = job.on_update = job.task = job.process = None
+        with self.lock:
+            self.jobs.pop(job.job_id, None)
+            self.history[job.job_id] = job
+            while len(self.history) > self.max_history:
+                self.history.popitem(last=False)
+
+    def submit_blocking(self, description, function, *args, priority=NORMAL_PRIORITY):
+        return self.submit(description, lambda job: asyncio.to_thread(function, *args), priority)
+
+    async def worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job.status == 'cancelled':
+                continue
+            job.status = 'running'
+            job.started = time.time()
+            self.notify(job)
+            current_job_id.set(job.job_id)  # copied into the job's task context
+            job.task = self.loop.create_task(job.coroutine_factory(job))
+            try:
+                job.result = await job.task
+                job.status = 'done'
+            except asyncio.CancelledError:
+                job.status = 'cancelled'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = e
+            job.finished = time.time()
+            self.notify(job)
+            self.retire(job)
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.status not in ('queued', 'running'):
+            return False
+        self.loop.call_soon_threadsafe(self.cancel_job, job)
+        return True
+
+    def cancel_job(self, job):
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished = time.time()
+            self.notify(job)
+            self.retire(job)
+            return
+        if job.task:
+            job.task.cancel()
+        if job.process and job.process.poll() is None:
+            job.process.kill()
+
+    def shutdown(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        for job_id in job_ids:
+            self.cancel(job_id)
+        self.loop.call_soon_threadsafe(self.stop_workers)
+
+    def stop_workers(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.loop.call_soon(self.loop.stop)  # after the workers have processed their cancellation
+
+class ConversationSession:
+    def __init__(self, conversation_id, chat):
+        self.conversation_id = conversation_id
+        self.chat = chat
+        self.lock = asyncio.Lock()  # one request at a time, so a follow-up sees the previous reply
+        self.dropped_requests = []  # requests trimmed out of the history, kept for the summary turn
+
+class ChatSessionManager:
+    def __init__(self, model, history_token_budget=8000, max_sessions=8):
+        self.model = model
+        self.history_token_budget = history_token_budget
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()  # conversation id -> session, least recently used first
+        self.conversation_ids = itertools.count(1)
+        self.lock = Lock()
+
+    def new_conversation(self):
+        return next(self.conversation_ids)
+
+    def get(self, conversation_id):
+        with self.lock:
+            session = self.sessions.get(conversation_id)
+            if session is None:
+                session = ConversationSession(conversation_id, self.model.start_chat(history=[]))
+                self.sessions[conversation_id] = session
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(conversation_id)
+            return session
+
+    def record(self, session, prompt, response):
+        # Used when a reply came from the response cache so follow-ups still have the context
+        session.chat.history = list(session.chat.history) + [
+            {'role': 'user', 'parts': [prompt]}, {'role': 'model', 'parts': [response]}]
+
+    def content_text(self, content):
+        return "".join(getattr(part, 'text', '') or '' for part in content.parts)
+
+    def estimate_tokens(self, history):
+        # Roughly 4 characters per token; attachments are counted as a fixed cost
+        total = 0
+        for content in history:
+            for part in content.parts:
+                text = getattr(part, 'text', '')
+                total += len(text) // 4 if text else 258
+        return total
+
+    def trim(self, session):
+        history = list(session.chat.history)
+        if self.estimate_tokens(history) <= self.history_token_budget:
+            return
+
+        # The first exchange holds the original request and script, so it is always kept
+        first, rest = history[:2], history[2:]
+        if session.dropped_requests:
+            rest = rest[2:]  # the previous summary turn, rebuilt below
+        while len(rest) > 2 and self.estimate_tokens(first + rest) > self.history_token_budget:
+            session.dropped_requests.extend(
+                self.content_text(content)[:200] for content in rest[:2] if content.role == 'user')
+            rest = rest[2:]  # oldest user/model exchange after the first
+
+        if not session.dropped_requests:
+            return
+        summary = "Summary of earlier requests in this conversation:\n" + "\n".join(
+            f"- {request}" for request in session.dropped_requests)
+        session.chat.history = first + [{'role': 'user', 'parts': [summary[-2000:]]},
+                                        {'role': 'model', 'parts': ["Noted."]}] + rest
+
 class CodeGenerator:
-    def __init__(self, model, log_output, progress_var, api_tracker):
+    def __init__(self, model, log_output, progress_var, api_tracker, response_cache=None, executor_pool=None,
+                 dependency_resolver=None, environment_manager=None, job_engine=None, session_manager=None,
+                 metrics=None, attachments=None):
         self.model = model
         self.log_output = log_output
         self.progress_var = progress_var
         self.api_tracker = api_tracker
+        self.response_cache = response_cache
+        self.executor_pool = executor_pool
+        self.dependency_resolver = dependency_resolver or DependencyResolver()
+        self.environment_manager = environment_manager
+        self.job_engine = job_engine
+        self.session_manager = session_manager or ChatSessionManager(model)
+        self.metrics = metrics or MetricsRecorder()
+        self.attachments = attachments or AttachmentProcessor()
+        self.conversation_id = None
+        self.request_text = None  # what the user asked for in this conversation, saved with the script
+        self.ttft_var = None
         
     
-    def generate_code(self, user_input, file_path):
-        prompt = f"Write a Python script/program to {user_input}. Only give code and nothing else."
+    def generate_code(self, user_input, file_path, priority=JobEngine.NORMAL_PRIORITY, execute=True, follow_up=False):
+        if follow_up and self.conversation_id is not None:
+            # The session already holds the earlier script, so only the change is sent
+            prompt = f"Now change the previous script to {user_input}. Only give the complete updated code and nothing else."
+            self.request_text = f"{self.request_text}; then {user_input}"
+        else:
+            follow_up = False
+            prompt = f"Write a Python script/program to {user_input}. Only give code and nothing else."
+            self.conversation_id = self.session_manager.new_conversation()
+            self.request_text = user_input
+        conversation_id = self.conversation_id
         self.log_output.insert(tk.END, f"Request Sent: {prompt}\n")
         if file_path:
             self.log_output.insert(tk.END, f"File attached: {file_path}\n")
         self.log_output.see(tk.END)
-        self.api_tracker.add_request()
         self.progress_var.set(0)
-        
-        def generate_code_thread():
-            try:
-                chat = self.model.start_chat(history=[])
-                
-                if file_path:
-                    with open(file_path, 'rb') as file:
-                        file_content = file.read()
-                    response = chat.send_message([prompt, file_content], stream=True)
+        stream_output = StreamingOutput(self.log_output, self.progress_var, self.ttft_var)
+        stream_output.start()
+
+        return self.job_engine.submit(f"Automation: {user_input}",
+                                      lambda job: self.generate_code_job(job, prompt, file_path, stream_output, execute,
+                                                                         conversation_id, follow_up),
+                                      priority)
+
+    async def generate_code_job(self, job, prompt, file_path, stream_output, execute=True, conversation_id=None,
+                                follow_up=False):
+        result = {'prompt': prompt, 'code': None, 'cached': False, 'packages': [], 'installed': None,
+                  'error': None, 'timings': {}}
+        started = time.time()
+        # Imports arrive in the first chunks, so installs start while the rest of the code streams in
+        if self.environment_manager:
+            prefetcher = DependencyPrefetcher(self.dependency_resolver, self.fetch_packages, self.log_output,
+                                              check_installed=False)
+        else:
+            prefetcher = DependencyPrefetcher(self.dependency_resolver, self.install_packages, self.log_output)
+        try:
+            session = self.session_manager.get(conversation_id or self.session_manager.new_conversation())
+            async with session.lock:
+                self.session_manager.trim(session)
+                # Follow-ups depend on the conversation so far and can't be answered from the cache
+                if self.response_cache and not follow_up:
+                    model_name = getattr(self.model, 'model_name', '')
+                    cache_key = await asyncio.to_thread(self.response_cache.make_key, prompt, file_path, model_name)
+                    generated_code, cached = await self.response_cache.get_or_compute(
+                        cache_key, lambda: self.request_code(prompt, file_path, prefetcher, stream_output, session.chat))
+                    if cached:
+                        self.session_manager.record(session, prompt, generated_code)
                 else:
-                    response = chat.send_message(prompt, stream=True)
+                    generated_code = await self.request_code(prompt, file_path, prefetcher, stream_output, session.chat)
+                    cached = False
+            stream_output.close(cached=cached)
+            result.update(code=generated_code, cached=cached)
+            if stream_output.first_token_time is not None:
+                result['timings']['first_token'] = stream_output.first_token_time
+            result['timings']['generate'] = time.time() - started
+
+            if not self.job_engine.busy(job):  # other jobs may still be writing to the output
+                self.log_output.delete("1.0", tk.END)
+            self.log_output.insert(tk.END, generated_code)
+            self.log_output.insert(tk.END, "Response Received:\n")
+            if cached:
+                self.log_output.insert(tk.END, "(served from response cache)\n")
+            self.log_output.insert(tk.END, generated_code + "\n")
+            self.log_output.see(tk.END)
 
-                generated_code = ""
-                for chunk in response:
-                    if hasattr(chunk, 'text'):
-                        generated_code += chunk.text
-                    self.progress_var.set(min(self.progress_var.get() + 10, 90))
+            install_started = time.time()
+            await asyncio.to_thread(prefetcher.wait)
+            installed, python_executable = await asyncio.to_thread(self.install_libraries, generated_code)
+            result['packages'] = self.dependency_resolver.third_party_distributions(generated_code)
+            result['installed'] = installed
+            result['timings']['install'] = time.time() - install_started
+            if not installed:
+                result['error'] = "Failed to install required libraries"
+            elif execute:
+                execute_started = time.time()
+                result['error'] = await asyncio.to_thread(self.execute_code, generated_code, python_executable, job)
+                result['timings']['execute'] = time.time() - execute_started
+
+        except asyncio.CancelledError:
+            prefetcher.cancel()
+            stream_output.close()
+            self.log_output.insert(tk.END, f"Job #{job.job_id} cancelled.\n")
+            self.log_output.see(tk.END)
+            self.progress_var.set(0)
+            raise
+        except Exception as e:
+            prefetcher.cancel()
+            stream_output.close()
+            self.log_output.insert(tk.END, f"An error occurred: {e}\n")
+            self.log_output.see(tk.END)
+            result['error'] = str(e)
+        finally:
+            prefetcher.finish()  # otherwise the install thread waits for more imports forever
 
-                if generated_code.startswith("```") and generated_code.endswith("```"):
-                    generated_code = generated_code.strip("```").strip()
-                    if generated_code.startswith("python"):
-                        generated_code = generated_code[6:]
+        self.progress_var.set(100)
+        result['timings']['total'] = time.time() - started
+        return result
 
-                self.log_output.delete("1.0", tk.END)
-                self.log_output.insert(tk.END, generated_code)
-                self.log_output.insert(tk.END, "Response Received:\n")
-                self.log_output.insert(tk.END, generated_code + "\n")
-                self.log_output.see(tk.END)
+    async def request_code(self, prompt, file_path, prefetcher=None, stream_output=None, chat=None):
+        slot = await self.api_tracker.acquire_async(self.log_rate_limit_wait)
+        try:
+            build_started = time.time()
+            if chat is None:
+                chat = self.model.start_chat(history=[])
+            message = prompt
+            if file_path:
+                attachment = await asyncio.to_thread(self.attachments.prepare, file_path)
+                message = [prompt, attachment]
+            self.metrics.record('prompt_build', time.time() - build_started)
+
+            request_started = time.time()
+            if stream_output:
+                stream_output.begin_request()
+            response = await chat.send_message_async(message, stream=True)
+        except BaseException:
+            self.api_tracker.release(slot)  # the request never went out
+            raise
+        first_token_time = None
+
+        parts = []
+        async for chunk in response:
+            if first_token_time is None:
+                first_token_time = time.time() - request_started
+            if hasattr(chunk, 'text'):
+                parts.append(chunk.text)
+                if prefetcher:
+                    prefetcher.feed(chunk.text)
+                if stream_output:
+                    stream_output.write(chunk.text)
+        generated_code = "".join(parts)
+        if first_token_time is not None:
+            self.metrics.record('first_token', first_token_time)
+            self.metrics.record('stream', time.time() - request_started - first_token_time)
+
+        if generated_code.startswith("```") and generated_code.endswith("```"):
+            generated_code = generated_code.strip("```").strip()
+            if generated_code.startswith("python"):
+                generated_code = generated_code[6:]
+        return generated_code
+
+    def log_rate_limit_wait(self, wait):
+        self.log_output.insert(tk.END, f"Rate limit reached, request queued for {wait:.0f}s\n")
+        self.log_output.see(tk.END)
 
-                self.install_libraries(generated_code)
-                self.execute_code(generated_code)
+    def install_libraries(self, code):
+        if self.environment_manager:
+            return self.prepare_environment(code)
 
-            except Exception as e:
-                self.log_output.insert(tk.END, f"An error occurred: {e}\n")
-                self.log_output.see(tk.END)
+        with self.metrics.span('resolve'):
+            missing = self.dependency_resolver.find_missing(code)
+        if not missing:
+            return True, None
 
-            self.progress_var.set(100)
+        packages = sorted(set(missing.values()))
+        self.log_output.insert(tk.END, f"Libraries not installed: {', '.join(missing)}. Attempting to install {' '.join(packages)}...\n")
+        self.log_output.see(tk.END)
+        if self.install_packages(packages):
+            self.log_output.insert(tk.END, f"Successfully installed {', '.join(packages)}.\n")
+            self.log_output.see(tk.END)
+            return True, None
+        self.log_output.insert(tk.END, "Failed to install required libraries. Skipping script execution.\n")
+        self.log_output.see(tk.END)
+        return False, None
 
-        threading.Thread(target=generate_code_thread).start()
+    def prepare_environment(self, code):
+        with self.metrics.span('resolve'):
+            packages = self.dependency_resolver.third_party_distributions(code)
+        if not packages:
+            return True, None
+        try:
+            with self.metrics.span('install', ' '.join(packages)):
+                python_executable = self.environment_manager.ensure_environment(packages)
+            self.log_output.insert(tk.END, f"Using isolated environment for: {' '.join(packages)}\n")
+            self.log_output.see(tk.END)
+            return True, python_executable
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.log_output.insert(tk.END, f"Failed to prepare an environment for {' '.join(packages)}. Error: {e}\n")
+            self.log_output.insert(tk.END, "Skipping script execution.\n")
+            self.log_output.see(tk.END)
+            return False, None
 
-    def install_libraries(self, code):
-        libraries = self.identify_libraries(code)
-        for library in libraries:
-            if not self.is_installed(library):
-                self.log_output.insert(tk.END, f"Library '{library}' is not installed. Attempting to install...\n")
-                self.log_output.see(tk.END)
-                if self.install_package(library):
-                    self.log_output.insert(tk.END, f"Successfully installed {library}.\n")
-                    self.log_output.see(tk.END)
-                else:
-                    self.log_output.insert(tk.END, f"Failed to install {library}. Skipping script execution.\n")
-                    self.log_output.see(tk.END)
-                    return False
-        return True
+    def install_packages(self, packages, on_start=None):
+        try:
+            with self.metrics.span('install', ' '.join(packages)):
+                self.dependency_resolver.install(packages, on_start)
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.log_output.insert(tk.END, f"Failed to install {' '.join(packages)}. Error: {e}\n")
+            self.log_output.see(tk.END)
+            return False
 
-    def identify_libraries(self, code):
-        libraries = []
-        for line in code.splitlines():
-            if line.startswith("import ") or line.startswith("from "):
-                parts = line.split()
-                if parts[0] == "import":
-                    libraries.append(parts[1].split('.')[0])
-                elif parts[0] == "from":
-                    libraries.append(parts[1].split('.')[0])
-        return libraries
-
-    def is_installed(self, package_name):
-        spec = importlib.util.find_spec(package_name)
-        return spec is not None
-
-    def install_package(self, package):
+    def fetch_packages(self, packages, on_start=None):
         try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+            with self.metrics.span('install', ' '.join(packages)):
+                self.environment_manager.fetch_wheels(packages, on_start)
             return True
-        except subprocess.CalledProcessError as e:
-            self.log_output.insert(tk.END, f"Failed to install {package}. Error: {e}\n")
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.log_output.insert(tk.END, f"Failed to download {' '.join(packages)}. Error: {e}\n")
             self.log_output.see(tk.END)
             return False
 
-    def execute_code(self, code):
+    def execute_code(self, code, python_executable=None, job=None):
         start_time = time.time()
-        try:
-            exec(code)
-        except Exception as e:
-            self.log_output.insert(tk.END, f"An error occurred during script execution: {e}\n")
+        on_start = (lambda worker: setattr(job, 'process', worker)) if job else None
+        with self.metrics.span('execute'):
+            error = self.executor_pool.run(code, self.log_script_output, python_executable, on_start)
+        if error:
+            self.log_output.insert(tk.END, f"An error occurred during script execution: {error}\n")
             self.log_output.see(tk.END)
 
         end_time = time.time()
@@ -277,16 +2172,35 @@ class CodeGenerator:
         self.log_output.insert(tk.END, f"Execution time: {execution_time:.2f} seconds\n")
         self.log_output.insert(tk.END, "_" * 80 + "\n")
         self.log_output.see(tk.END)
+        return error
+
+    def log_script_output(self, stream, text):
+        self.log_output.insert(tk.END, text + "\n")
+        self.log_output.see(tk.END)
 
 class QAHandler:
-    def __init__(self, model, log_output, progress_var, copy_button, api_tracker):
+    note_budget = 32000  # characters of partial answers kept before the oldest are condensed
+
+    def __init__(self, model, log_output, progress_var, copy_button, api_tracker, job_engine=None, session_manager=None,
+                 metrics=None, attachments=None, map_chunk_bytes=512 * 1024, map_concurrency=4):
         self.model = model
         self.log_output = log_output
         self.progress_var = progress_var
         self.copy_button = copy_button  # Assign copy_button attribute
         self.api_tracker = api_tracker
-
-    def qa_mode(self, user_input, file_path):
+        self.job_engine = job_engine
+        self.session_manager = session_manager or ChatSessionManager(model)
+        self.metrics = metrics or MetricsRecorder()
+        self.attachments = attachments or AttachmentProcessor()
+        self.map_chunk_bytes = map_chunk_bytes
+        self.map_concurrency = map_concurrency
+        self.conversation_id = None
+        self.ttft_var = None
+
+    def qa_mode(self, user_input, file_path, priority=JobEngine.NORMAL_PRIORITY, follow_up=False):
+        if not follow_up or self.conversation_id is None:
+            self.conversation_id = self.session_manager.new_conversation()
+        conversation_id = self.conversation_id
         self.log_output.insert(tk.END, f"Question: {user_input}\n")
         if file_path:
             self.log_output.insert(tk.END, f"File attached: {file_path}\n")
@@ -294,87 +2208,1390 @@ class QAHandler:
         
         if self.copy_button:
             self.copy_button.config(state='disabled')
-        else:
-            print("self.copy_button is None or not initialized properly")
-        self.api_tracker.add_request()
         self.progress_var.set(0)
+        self.log_output.insert(tk.END, "Answer: ")
+        stream_output = StreamingOutput(self.log_output, self.progress_var, self.ttft_var,
+                                        renderer=MarkdownStream(self.log_output))
+        stream_output.start()
+
+        return self.job_engine.submit(f"Q/A: {user_input}",
+                                      lambda job: self.qa_mode_job(job, user_input, file_path, stream_output,
+                                                                   conversation_id),
+                                      priority)
+
+    async def qa_mode_job(self, job, user_input, file_path, stream_output, conversation_id=None):
+        result = {'prompt': user_input, 'answer': None, 'error': None, 'timings': {}}
+        started = time.time()
+        try:
+            session = self.session_manager.get(conversation_id or self.session_manager.new_conversation())
+            async with session.lock:
+                self.session_manager.trim(session)
+
+                if file_path and await asyncio.to_thread(self.needs_map_reduce, file_path):
+                    # The final answer is asked in the conversation, built from notes on each part of the file
+                    message = await self.map_reduce_message(user_input, file_path)
+                    result['timings']['map'] = time.time() - started
+                else:
+                    build_started = time.time()
+                    message = user_input
+                    if file_path:
+                        attachment = await asyncio.to_thread(self.attachments.prepare, file_path)
+                        message = [user_input, attachment]
+                    self.metrics.record('prompt_build', time.time() - build_started)
+                slot = await self.api_tracker.acquire_async()
+
+                request_started = time.time()
+                stream_output.begin_request()
+                try:
+                    response = await session.chat.send_message_async(message, stream=True)
+                except BaseException:
+                    self.api_tracker.release(slot)  # the request never went out
+                    raise
+
+                parts = []
+                first_token_time = None
+                async for chunk in response:
+                    if first_token_time is None:
+                        first_token_time = time.time() - request_started
+                    if hasattr(chunk, 'text'):
+                        parts.append(chunk.text)
+                        stream_output.write(chunk.text)
+                if first_token_time is not None:
+                    self.metrics.record('first_token', first_token_time)
+                    self.metrics.record('stream', time.time() - request_started - first_token_time)
+
+            # The answer was rendered while it streamed; keep the Markdown source for the result
+            answer = "".join(parts)
+            stream_output.close()
+            if not answer.endswith("\n"):
+                self.log_output.insert(tk.END, "\n")
+            result['answer'] = answer
+            if stream_output.first_token_time is not None:
+                result['timings']['first_token'] = stream_output.first_token_time
+            self.log_output.insert(tk.END, "_" * 80 + "\n")
+            self.log_output.see(tk.END)
+            
+        except asyncio.CancelledError:
+            stream_output.close()
+            self.log_output.insert(tk.END, f"\nJob #{job.job_id} cancelled.\n")
+            self.log_output.see(tk.END)
+            raise
+        except Exception as e:
+            stream_output.close()
+            self.log_output.insert(tk.END, f"An error occurred: {e}\n")
+            self.log_output.see(tk.END)
+            result['error'] = str(e)
+        finally:
+            if self.copy_button:
+                self.copy_button.config(state='normal')
+            self.progress_var.set(100)
+        result['timings']['total'] = time.time() - started
+        return result
 
-        def qa_mode_thread():
+    def needs_map_reduce(self, file_path):
+        # Text files that wouldn't fit the attachment budget are read in parts instead of being cut off
+        mime_type = mimetypes.guess_type(file_path)[0] or ''
+        if mime_type.startswith('image/') or os.path.getsize(file_path) <= self.attachments.text_byte_budget:
+            return False
+        return self.attachments.is_text(file_path, mime_type)
+
+    def iter_chunks(self, mapped, chunk_bytes):
+        start = 0
+        size = len(mapped)
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                newline = mapped.rfind(b"\n", start, end)
+                if newline != -1:
+                    end = newline + 1
+            yield start, end
+            start = end
+
+    async def ask(self, prompt):
+        slot = await self.api_tracker.acquire_async()
+        chat = self.model.start_chat(history=[])
+        try:
+            response = await chat.send_message_async(prompt, stream=True)
+        except BaseException:
+            self.api_tracker.release(slot)  # the request never went out
+            raise
+        parts = []
+        async for chunk in response:
+            if hasattr(chunk, 'text'):
+                parts.append(chunk.text)
+        return "".join(parts).strip()
+
+    async def map_reduce_message(self, user_input, file_path):
+        name = os.path.basename(file_path)
+        notes = []
+        fold_lock = asyncio.Lock()
+        done = 0
+
+        # The file is memory-mapped and only one part per worker is copied out at a time
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            total = -(-len(mapped) // self.map_chunk_bytes)
+            self.log_output.insert(tk.END, f"{name} is too large to send at once, reading it in about {total} parts...\n")
+            self.log_output.see(tk.END)
+            chunks = enumerate(self.iter_chunks(mapped, self.map_chunk_bytes), 1)
+
+            async def worker():
+                nonlocal done
+                for number, (start, end) in chunks:
+                    text = mapped[start:end].decode('utf-8', errors='replace')
+                    with self.metrics.span('map'):
+                        note = await self.ask(
+                            f"This is part {number} of about {total} of the file {name}.\n"
+                            f"Question about the file: {user_input}\n"
+                            "Using only this part, write short notes with everything relevant to the question "
+                            "(quote exact lines or values where useful). If nothing in this part is relevant, "
+                            f"reply with exactly NONE.\n\n{text}")
+                    del text
+                    if note and note.upper() != "NONE":
+                        notes.append(f"Part {number}: {note[:4000]}")
+                        async with fold_lock:
+                            await self.fold_notes(user_input, name, notes)
+                    done += 1
+                    self.progress_var.set(80 * done / total)
+
+            workers = [asyncio.ensure_future(worker()) for _ in range(self.map_concurrency)]
             try:
-                chat = self.model.start_chat(history=[])
-                
-                if file_path:
-                    with open(file_path, 'rb') as file:
-                        file_content = file.read()
-                    image = Image.open(io.BytesIO(file_content))  # Convert bytes to PIL Image
-                    response = chat.send_message([user_input, image], stream=True)
-                else:
-                    response = chat.send_message(user_input, stream=True)
+                await asyncio.gather(*workers)
+            finally:
+                # Nothing may still be reading from the map once it is closed
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        if not notes:
+            notes = ["No part of the file contained anything relevant to the question."]
+        return (f"{user_input}\n\nThe attached file {name} ({size_mb:.1f} MB) was too large to send in one message, "
+                "so each part was read separately. These are the notes from the relevant parts:\n\n"
+                + "\n\n".join(notes) + "\n\nUsing these notes, answer the question.")
+
+    async def fold_notes(self, user_input, name, notes):
+        # Keeps memory flat for any file size: once the notes outgrow the budget, the oldest half is condensed
+        while len(notes) > 1 and sum(len(note) for note in notes) > self.note_budget:
+            batch = notes[:max(2, len(notes) // 2)]
+            del notes[:len(batch)]
+            with self.metrics.span('reduce'):
+                summary = await self.ask(
+                    f"These are notes taken from parts of the file {name} to answer the question: {user_input}\n"
+                    "Merge them into one shorter set of notes, keeping every detail relevant to the question.\n\n"
+                    + "\n\n".join(batch))
+            notes.insert(0, f"Notes merged from earlier parts: {summary[:8000]}")
+
+class ScriptLibrary:
+    # Saved scripts and their metadata in one SQLite file, so listing, ordering and tag filters are indexed queries
+    # One entry per schema version, applied in order
+    migrations = [
+        """
+            CREATE TABLE IF NOT EXISTS scripts (
+                name TEXT PRIMARY KEY,
+                code TEXT NOT NULL,
+                prompt TEXT,
+                dependencies TEXT,  -- JSON list of distributions, NULL until resolved
+                version INTEGER NOT NULL DEFAULT 1,
+                run_count INTEGER NOT NULL DEFAULT 0,
+                total_run_seconds REAL NOT NULL DEFAULT 0,
+                last_run_seconds REAL,
+                last_run_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS scripts_by_name ON scripts (name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS scripts_by_runs ON scripts (run_count DESC, name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS scripts_by_last_run ON scripts (last_run_at DESC, name COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS script_tags (
+                tag TEXT NOT NULL,
+                name TEXT NOT NULL REFERENCES scripts (name) ON DELETE CASCADE ON UPDATE CASCADE,
+                PRIMARY KEY (tag, name)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS script_tags_by_name ON script_tags (name);
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS schedules (
+                name TEXT PRIMARY KEY REFERENCES scripts (name) ON DELETE CASCADE ON UPDATE CASCADE,
+                spec TEXT NOT NULL,  -- interval such as "every 15m", or a cron expression
+                next_run_at REAL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS script_runs (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                triggered_by TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                seconds REAL,
+                status TEXT NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS script_runs_by_name ON script_runs (name, started_at);
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS pipelines (
+                name TEXT PRIMARY KEY,
+                definition TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """,
+    ]
+    max_run_records = 10000
+    orders = {
+        'name': "name COLLATE NOCASE",
+        'most_used': "run_count DESC, name COLLATE NOCASE",
+        'recent': "last_run_at DESC, name COLLATE NOCASE",
+    }
+    upsert_sql = ("INSERT INTO scripts (name, code, prompt, dependencies, created_at, updated_at) "
+                  "VALUES (?, ?, ?, ?, ?, ?) "
+                  "ON CONFLICT(name) DO UPDATE SET code = excluded.code, prompt = excluded.prompt, "
+                  "dependencies = excluded.dependencies, version = version + 1, updated_at = excluded.updated_at")
+    manifest_name = "library.json"
+
+    def __init__(self, database_file, legacy_folder=None):
+        self.database_file = database_file
+        folder = os.path.dirname(database_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(database_file, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.data_version = None
+        with self.lock:
+            created = self.create_schema()
+        self.changed_elsewhere()
+        # Scripts saved as loose .py files before the library existed are brought in once
+        if created and legacy_folder and os.path.isdir(legacy_folder):
+            self.import_folder(legacy_folder)
+
+    def create_schema(self):
+        # Applies the migrations this file hasn't seen yet; returns True for a brand new library
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(self.migrations[version:], version + 1):
+            self.connection.executescript(f"{migration}\nPRAGMA user_version = {number};")
+        return version == 0
+
+    def entry_from_row(self, row):
+        entry = dict(row)
+        if 'dependencies' in entry:
+            entry['dependencies'] = json.loads(entry['dependencies']) if entry['dependencies'] is not None else None
+        if entry.get('run_count'):
+            entry['average_run_seconds'] = entry['total_run_seconds'] / entry['run_count']
+        return entry
+
+    def get(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM scripts WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            tags = [tag for tag, in self.connection.execute(
+                "SELECT tag FROM script_tags WHERE name = ? ORDER BY tag", (name,))]
+        entry = self.entry_from_row(row)
+        entry['tags'] = tags
+        return entry
+
+    def code(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT code FROM scripts WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
 
-                answer = ""
-                for chunk in response:
-                    if hasattr(chunk, 'text'):
-                        answer += chunk.text
-                    self.progress_var.set(min(self.progress_var.get() + 10, 90))
+    def entries(self):
+        # (name, code, prompt) for every script, for building the search indexes
+        with self.lock:
+            return [tuple(row) for row in self.connection.execute("SELECT name, code, prompt FROM scripts")]
 
-                answer = self.process_markdown(answer)  # Process Markdown in the answer
-                self.log_output.insert(tk.END, f"Answer: {answer}\n")
-                self.log_output.insert(tk.END, "_" * 80 + "\n")
-                self.log_output.see(tk.END)
-                
-                if self.copy_button:
-                    self.copy_button.config(state='normal')
-                else:
-                    print("self.copy_button is None or not initialized properly")
-                
-            except Exception as e:
-                self.log_output.insert(tk.END, f"An error occurred: {e}\n")
-                self.log_output.see(tk.END)
+    def signatures(self):
+        with self.lock:
+            return dict(self.connection.execute("SELECT name, version FROM scripts").fetchall())
 
-            self.progress_var.set(100)
+    def signature(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT version FROM scripts WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def names(self, order='name', tags=None, limit=None):
+        query = "SELECT name FROM scripts"
+        parameters = []
+        if tags:
+            tags = sorted({tag.lower() for tag in tags})
+            query += (f" WHERE name IN (SELECT name FROM script_tags WHERE tag IN ({', '.join('?' * len(tags))}) "
+                      "GROUP BY name HAVING count(*) = ?)")
+            parameters = tags + [len(tags)]
+        query += f" ORDER BY {self.orders[order]}"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self.lock:
+            return [name for name, in self.connection.execute(query, parameters)]
+
+    def save(self, name, code, prompt=None, dependencies=None):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(self.upsert_sql, (name, code, prompt,
+                                                      json.dumps(dependencies) if dependencies is not None else None,
+                                                      now, now))
+
+    def delete(self, name):
+        with self.lock, self.connection:
+            return self.connection.execute("DELETE FROM scripts WHERE name = ?", (name,)).rowcount > 0
+
+    def set_dependencies(self, name, dependencies):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE scripts SET dependencies = ? WHERE name = ?",
+                                    (json.dumps(dependencies) if dependencies is not None else None, name))
+
+    def set_tags(self, name, tags):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM script_tags WHERE name = ?", (name,))
+            self.connection.executemany("INSERT OR IGNORE INTO script_tags (tag, name) VALUES (?, ?)",
+                                        [(tag.lower(), name) for tag in tags if tag])
+
+    def record_run(self, name, seconds, error=None, trigger='manual'):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE scripts SET run_count = run_count + 1, total_run_seconds = total_run_seconds + ?, "
+                                    "last_run_seconds = ?, last_run_at = ? WHERE name = ?",
+                                    (seconds, seconds, now, name))
+            self.add_run_locked(name, trigger, now - seconds, seconds, 'failed' if error else 'done', error)
+
+    def add_run(self, name, trigger, status, error=None):
+        with self.lock, self.connection:
+            self.add_run_locked(name, trigger, time.time(), None, status, error)
+
+    def add_run_locked(self, name, trigger, started_at, seconds, status, error):
+        run_id = self.connection.execute(
+            "INSERT INTO script_runs (name, triggered_by, started_at, seconds, status, error) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, trigger, started_at, seconds, status, error)).lastrowid
+        if run_id % 1000 == 0:
+            self.connection.execute("DELETE FROM script_runs WHERE id <= ?", (run_id - self.max_run_records,))
+
+    def recent_runs(self, name, limit=5):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(
+                "SELECT * FROM script_runs WHERE name = ? ORDER BY started_at DESC LIMIT ?", (name, limit))]
 
-        threading.Thread(target=qa_mode_thread).start()
+    def schedules(self):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute("SELECT * FROM schedules")]
 
-    def process_markdown(self, text):
-        # Convert markdown to HTML
-        html = markdown2.markdown(text)
-        
-        # Basic HTML to text conversion (you might want to expand this)
-        html = html.replace('<p>', '').replace('</p>', '\n')
-        html = html.replace('<strong>', '').replace('</strong>', '')
-        html = html.replace('<em>', '').replace('</em>', '')
-        html = html.replace('<code>', '`').replace('</code>', '`')
-        
-        # Handle code blocks
-        lines = html.split('\n')
-        in_code_block = False
-        processed_lines = []
-        for line in lines:
-            if line.strip() == '<pre><code>':
-                in_code_block = True
-                processed_lines.append('```')
-            elif line.strip() == '</code></pre>':
-                in_code_block = False
-                processed_lines.append('```')
-            elif in_code_block:
-                processed_lines.append(line)
+    def set_schedule(self, name, spec, next_run_at):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO schedules (name, spec, next_run_at, created_at) VALUES (?, ?, ?, ?) "
+                                    "ON CONFLICT(name) DO UPDATE SET spec = excluded.spec, next_run_at = excluded.next_run_at",
+                                    (name, spec, next_run_at, time.time()))
+
+    def set_next_run(self, name, next_run_at):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE schedules SET next_run_at = ? WHERE name = ?", (next_run_at, name))
+
+    def delete_schedule(self, name):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM schedules WHERE name = ?", (name,))
+
+    def pipeline_names(self):
+        with self.lock:
+            return [name for name, in self.connection.execute("SELECT name FROM pipelines ORDER BY name COLLATE NOCASE")]
+
+    def pipeline(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT definition FROM pipelines WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def save_pipeline(self, name, definition):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO pipelines (name, definition, updated_at) VALUES (?, ?, ?) "
+                                    "ON CONFLICT(name) DO UPDATE SET definition = excluded.definition, "
+                                    "updated_at = excluded.updated_at", (name, definition, time.time()))
+
+    def delete_pipeline(self, name):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM pipelines WHERE name = ?", (name,))
+
+    def changed_elsewhere(self):
+        # data_version only moves when another connection (e.g. a second instance) commits
+        with self.lock:
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        changed = self.data_version is not None and data_version != self.data_version
+        self.data_version = data_version
+        return changed
+
+    @staticmethod
+    def read_json(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def import_folder(self, folder):
+        # Takes <name>.py files plus the metadata written by export_folder, or the older .prompts.json and
+        # .environments.json; returns the number of scripts imported
+        manifest = self.read_json(os.path.join(folder, self.manifest_name))
+        prompts = self.read_json(os.path.join(folder, ".prompts.json"))
+        environments = self.read_json(os.path.join(folder, ".environments.json"))
+        now = time.time()
+        scripts, tags, stats = [], [], []
+        for entry in os.scandir(folder):
+            if not (entry.name.endswith(".py") and entry.is_file()):
+                continue
+            name = entry.name[:-3]
+            with open(entry.path, "r", errors="replace") as file:
+                code = file.read()
+            metadata = manifest.get(name, {})
+            dependencies = metadata.get('dependencies', environments.get(name))
+            scripts.append((name, code, metadata.get('prompt', prompts.get(name)),
+                            json.dumps(dependencies) if dependencies is not None else None,
+                            metadata.get('created_at', now), now))
+            tags.extend((tag.lower(), name) for tag in metadata.get('tags', []))
+            if metadata.get('run_count'):
+                # Hand-edited or older manifests may lack the timings; callers expect numbers once a script has runs
+                stats.append((metadata['run_count'], metadata.get('total_run_seconds') or 0,
+                              metadata.get('last_run_seconds') or 0, metadata.get('last_run_at'), name))
+        with self.lock, self.connection:
+            self.connection.executemany(self.upsert_sql, scripts)
+            self.connection.executemany("INSERT OR IGNORE INTO script_tags (tag, name) VALUES (?, ?)", tags)
+            self.connection.executemany("UPDATE scripts SET run_count = ?, total_run_seconds = ?, last_run_seconds = ?, "
+                                        "last_run_at = ? WHERE name = ?", stats)
+        return len(scripts)
+
+    def export_folder(self, folder):
+        # Writes every script as <name>.py with its metadata in library.json; returns the number exported
+        os.makedirs(folder, exist_ok=True)
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM scripts ORDER BY name").fetchall()
+            tags = {}
+            for tag, name in self.connection.execute("SELECT tag, name FROM script_tags ORDER BY tag"):
+                tags.setdefault(name, []).append(tag)
+        manifest = {}
+        for row in rows:
+            entry = self.entry_from_row(row)
+            name = entry.pop('name')
+            with open(os.path.join(folder, f"{name}.py"), "w") as file:
+                file.write(entry.pop('code'))
+            entry.pop('version')
+            entry.pop('average_run_seconds', None)
+            entry['tags'] = tags.get(name, [])
+            manifest[name] = entry
+        with open(os.path.join(folder, self.manifest_name), "w") as f:
+            json.dump(manifest, f, indent=4)
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class ScriptIndex:
+    # Saved script versions kept in memory so listeners hear which scripts were added, removed or edited;
+    # another instance writing to the library is noticed through SQLite's data_version, not by re-reading it
+    def __init__(self, library, poll_interval=2.0):
+        self.library = library
+        self.poll_interval = poll_interval
+        self.scripts = {}  # script name -> version
+        self.listeners = []
+        self.lock = Lock()
+        self.stopped = threading.Event()
+        self.rescan()
+
+    def add_listener(self, callback):
+        # Called with (added, removed, changed) names, from whichever thread noticed the change
+        self.listeners.append(callback)
+
+    def notify(self, added, removed, changed):
+        if added or removed or changed:
+            for callback in self.listeners:
+                callback(added, removed, changed)
+
+    def rescan(self):
+        try:
+            entries = self.library.signatures()
+        except sqlite3.Error:
+            return
+        with self.lock:
+            previous = self.scripts
+            self.scripts = entries
+        self.notify([name for name in entries if name not in previous],
+                    [name for name in previous if name not in entries],
+                    [name for name in entries if name in previous and previous[name] != entries[name]])
+
+    def refresh_entry(self, name):
+        signature = self.library.signature(name)
+        with self.lock:
+            previous = self.scripts.get(name)
+            if signature is None:
+                self.scripts.pop(name, None)
             else:
-                processed_lines.append(line)
-        
-        return '\n'.join(processed_lines)
-    
+                self.scripts[name] = signature
+        if previous == signature:
+            return  # already seen, e.g. the poller reporting our own save
+        self.notify([name] if previous is None else [], [name] if signature is None else [],
+                    [name] if previous is not None and signature is not None else [])
+
+    def names(self):
+        with self.lock:
+            names = list(self.scripts)
+        return sorted(names, key=str.lower)
+
+    def start(self):
+        threading.Thread(target=self.poll, daemon=True).start()
+
+    def poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                changed = self.library.changed_elsewhere()
+            except sqlite3.Error:
+                continue
+            if changed:
+                self.rescan()
+
+    def stop(self):
+        self.stopped.set()
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CAMEL_CASE_PATTERN = re.compile(r"([a-z0-9])([A-Z])")
+
+def tokenize_words(text):
+    terms = []
+    for word in WORD_PATTERN.findall(CAMEL_CASE_PATTERN.sub(r"\1 \2", text).lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]  # "pdfs" finds "pdf"
+        terms.append(word)
+    return terms
+
+
+class ScriptSearchIndex:
+    # Ranked full-text search over script names, contents and the prompts that produced them.
+    # Query words also match vocabulary words that share enough trigrams, so typos and word forms still hit.
+    field_weights = {'name': 3, 'prompt': 2, 'content': 1}
+
+    def __init__(self, min_similarity=0.4, max_terms_per_word=8):
+        self.min_similarity = min_similarity
+        self.max_terms_per_word = max_terms_per_word
+        self.postings = {}  # term -> {script name: field-weighted term frequency}
+        self.documents = {}  # script name -> (terms, weighted length)
+        self.trigrams = {}  # trigram -> vocabulary terms containing it
+        self.total_length = 0
+        self.norms = None  # BM25 length normalisation per script, rebuilt after the index changes
+        self.lock = Lock()
+
+    def term_trigrams(self, term):
+        padded = f"${term}$"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, name, content, prompt=""):
+        frequencies = {}
+        for field, text in (('name', name), ('prompt', prompt or ""), ('content', content)):
+            weight = self.field_weights[field]
+            for term in tokenize_words(text):
+                frequencies[term] = frequencies.get(term, 0) + weight
+        length = sum(frequencies.values())
+
+        with self.lock:
+            self.remove_locked(name)
+            for term, frequency in frequencies.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                    for trigram in self.term_trigrams(term):
+                        self.trigrams.setdefault(trigram, set()).add(term)
+                postings[name] = frequency
+            self.documents[name] = (list(frequencies), length)
+            self.total_length += length
+            self.norms = None
+
+    def remove(self, name):
+        with self.lock:
+            self.remove_locked(name)
+
+    def remove_locked(self, name):
+        # Caller holds self.lock
+        document = self.documents.pop(name, None)
+        if document is None:
+            return
+        terms, length = document
+        self.total_length -= length
+        self.norms = None
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(name, None)
+            if not postings:
+                del self.postings[term]
+                for trigram in self.term_trigrams(term):
+                    containing = self.trigrams[trigram]
+                    containing.discard(term)
+                    if not containing:
+                        del self.trigrams[trigram]
+
+    def matching_terms(self, word):
+        # Caller holds self.lock
+        trigrams = self.term_trigrams(word)
+        overlaps = {}
+        for trigram in trigrams:
+            for term in self.trigrams.get(trigram, ()):
+                overlaps[term] = overlaps.get(term, 0) + 1
+
+        exact = word in self.postings
+        matches = []
+        for term, overlap in overlaps.items():
+            if term == word:
+                similarity = 1.0
+            elif len(word) >= 2 and term.startswith(word):
+                similarity = 0.8  # the word is still being typed
+            elif exact:
+                continue  # only guess at misspellings when the word itself is unknown
+            else:
+                # Jaccard similarity; a padded term has len(term) trigrams
+                similarity = overlap / (len(trigrams) + len(term) - overlap)
+                if similarity < self.min_similarity:
+                    continue
+            matches.append((similarity, term))
+        matches.sort(reverse=True)
+        return matches[:self.max_terms_per_word]
+
+    def search(self, query, limit=200):
+        words = set(tokenize_words(query))
+        phrase = query.strip().lower()
+        scores = {}
+        with self.lock:
+            count = len(self.documents)
+            if not count:
+                return []
+            if self.norms is None:
+                average_length = self.total_length / count or 1
+                self.norms = {name: 1.2 * (0.25 + 0.75 * length / average_length)
+                              for name, (_, length) in self.documents.items()}
+            norms = self.norms
+            for word in words:
+                best = {}  # script -> score of its best matching term for this word
+                for similarity, term in self.matching_terms(word):
+                    postings = self.postings[term]
+                    # BM25 term weight
+                    weight = similarity * 2.2 * math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for name, frequency in postings.items():
+                        score = weight * frequency / (frequency + norms[name])
+                        if score > best.get(name, 0):
+                            best[name] = score
+                for name, score in best.items():
+                    scores[name] = scores.get(name, 0) + score
+            # A plain substring of the file name still wins, as the search box used to work
+            for name in self.documents:
+                if phrase and phrase in name.lower():
+                    scores[name] = scores.get(name, 0) + 100
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0].lower()))
+        return [name for name, _ in ranked[:limit]]
+
+class ScriptSimilarityIndex:
+    # TF-IDF vectors of saved scripts, to spot a request that was already solved. Each script has a vector
+    # of its prompt and one of prompt and code; a request scores the better of the two, so scripts saved
+    # without a prompt can still match. Vectors are stored by column, so a query only touches the scripts
+    # that share a word with it.
+    def __init__(self):
+        self.documents = {}  # script name -> ({term: count} of the prompt, {term: count} of prompt and code)
+        self.snapshot = None  # (names, prompt columns, combined columns, idf), replaced whole by rebuild()
+        self.dirty = False
+        self.rebuilding = False
+        self.lock = Lock()
+
+    def add(self, name, content, prompt=""):
+        prompt_counts = {}
+        for term in tokenize_words(prompt or ""):
+            prompt_counts[term] = prompt_counts.get(term, 0) + 1
+        combined_counts = dict(prompt_counts)
+        for term in tokenize_words(content):
+            combined_counts[term] = combined_counts.get(term, 0) + 1
+        with self.lock:
+            self.documents[name] = (prompt_counts, combined_counts)
+
+    def remove(self, name):
+        with self.lock:
+            self.documents.pop(name, None)
+
+    def request_rebuild(self):
+        # Rebuilds on a background thread; changes arriving meanwhile are folded into one more pass
+        with self.lock:
+            self.dirty = True
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.rebuild_loop, daemon=True).start()
+
+    def rebuild_loop(self):
+        while True:
+            with self.lock:
+                if not self.dirty:
+                    self.rebuilding = False
+                    return
+                self.dirty = False
+            self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            documents = dict(self.documents)
+        names = list(documents)
+        document_frequency = {}
+        for _, counts in documents.values():
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        idf = {term: math.log((1 + len(names)) / (1 + frequency)) + 1
+               for term, frequency in document_frequency.items()}
+        self.snapshot = (names, self.build_columns([documents[name][0] for name in names], idf),
+                         self.build_columns([documents[name][1] for name in names], idf), idf)
+
+    def build_columns(self, rows, idf):
+        columns = {}
+        for row, counts in enumerate(rows):
+            weights = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                column = columns.setdefault(term, ([], []))
+                column[0].append(row)
+                column[1].append(weight / norm)
+        return {term: (np.array(rows, dtype=np.int32), np.array(values, dtype=np.float32))
+                for term, (rows, values) in columns.items()}
+
+    def query(self, text, limit=3):
+        # Cosine similarity of the request against every saved script, best first
+        if self.snapshot is None:
+            return []
+        names, prompt_columns, combined_columns, idf = self.snapshot
+        counts = {}
+        for term in tokenize_words(text):
+            counts[term] = counts.get(term, 0) + 1
+        if not counts or not names:
+            return []
+        # Words no script uses still count towards the request's length, as the rarest possible words
+        unseen_idf = math.log(1 + len(names)) + 1
+        weights = {term: (1 + math.log(count)) * idf.get(term, unseen_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+
+        scores = np.maximum(self.score(prompt_columns, weights, norm, len(names)),
+                            self.score(combined_columns, weights, norm, len(names)))
+        limit = min(limit, len(names))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [(names[row], float(scores[row])) for row in best if scores[row] > 0]
+
+    def score(self, columns, weights, norm, count):
+        scores = np.zeros(count, dtype=np.float32)
+        for term, weight in weights.items():
+            if term in columns:
+                rows, values = columns[term]
+                scores[rows] += values * (weight / norm)
+        return scores
+
+class CronExpression:
+    # Five-field cron (minute hour day month weekday) with *, lists, ranges and steps, in local time
+    field_ranges = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields (minute hour day month weekday), got '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.field_ranges)]
+        if 7 in self.weekdays:
+            self.weekdays.add(0)  # both 0 and 7 mean Sunday
+        # Like cron, a restricted day and weekday match when either one does
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for item in field.split(','):
+            item, _, step = item.partition('/')
+            try:
+                step = int(step) if step else 1
+                if item == '*':
+                    start, end = low, high
+                elif '-' in item:
+                    start, end = (int(value) for value in item.split('-', 1))
+                else:
+                    start = int(item)
+                    end = high if step > 1 else start
+            except ValueError:
+                start = end = None
+            if start is None or start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field '{field}' (values {low}-{high})")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, timestamp):
+        # Skips whole months, days and hours that can't match instead of testing every minute
+        moment = datetime.datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=5 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+INTERVAL_PATTERN = re.compile(r"^(?:every\s+)?(\d+(?:\.\d+)?)\s*([smhd]?)$", re.IGNORECASE)
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+class Schedule:
+    def __init__(self, script_name, spec, next_run=None):
+        self.script_name = script_name
+        self.spec = spec.strip()
+        match = INTERVAL_PATTERN.match(self.spec)
+        if match:
+            # A bare number is minutes
+            self.interval = float(match.group(1)) * INTERVAL_UNITS[(match.group(2) or 'm').lower()]
+            if self.interval <= 0:
+                raise ValueError("The interval must be positive")
+            self.cron = None
+        else:
+            self.interval = None
+            self.cron = CronExpression(self.spec)
+        self.next_run = next_run
+
+    def next_after(self, timestamp):
+        if self.cron:
+            return self.cron.next_after(timestamp)
+        return timestamp + self.interval
+
+class ScriptScheduler:
+    # A heap of due times and one thread sleeping until the earliest, so idle schedules cost nothing
+    catch_up_policies = ('skip', 'once', 'all')
+
+    def __init__(self, library, job_engine, run_script, catch_up='once', max_catch_up_runs=50):
+        self.library = library
+        self.job_engine = job_engine
+        self.run_script = run_script  # called with (script_name, job) on a worker thread, returns an error or None
+        self.catch_up = catch_up if catch_up in self.catch_up_policies else 'once'
+        self.max_catch_up_runs = max_catch_up_runs
+        self.schedules = {}  # script name -> Schedule
+        self.heap = []  # (due time, sequence, script name); stale entries are dropped when popped
+        self.sequence = itertools.count()
+        self.running = set()  # script names with a run queued or in progress, so runs never overlap
+        # Never held while submitting: the job engine notifies listeners inline, which may take other locks
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def start(self):
+        now = time.time()
+        batch = []
+        with self.condition:
+            for row in self.library.schedules():
+                try:
+                    schedule = Schedule(row['name'], row['spec'], row['next_run_at'])
+                except ValueError:
+                    continue
+                self.schedules[schedule.script_name] = schedule
+                batch.extend(self.catch_up_missed(schedule, now))
+        self.submit(batch)
+        threading.Thread(target=self.run_loop, daemon=True).start()
+
+    def catch_up_missed(self, schedule, now):
+        # Caller holds self.condition; runs that came due while the app was closed follow the catch-up policy.
+        # Returns the (script name, runs) batch to submit once the condition is released
+        if schedule.next_run is None or schedule.next_run > now:
+            if schedule.next_run is None:
+                schedule.next_run = schedule.next_after(now)
+            self.push(schedule)
+            return []
+        missed = 0
+        moment = schedule.next_run
+        while moment <= now and missed < self.max_catch_up_runs:
+            missed += 1
+            moment = schedule.next_after(moment)
+        if self.catch_up == 'skip':
+            schedule.next_run = schedule.next_after(now)
+            self.library.set_next_run(schedule.script_name, schedule.next_run)
+            self.library.add_run(schedule.script_name, 'schedule', 'missed', f"{missed} missed runs skipped")
+            self.push(schedule)
+            return []
+        return self.dispatch(schedule, now, missed if self.catch_up == 'all' else 1)
+
+    def push(self, schedule):
+        heapq.heappush(self.heap, (schedule.next_run, next(self.sequence), schedule.script_name))
+        self.condition.notify()
+
+    def add(self, script_name, spec):
+        # Raises ValueError for a spec that is neither an interval nor a cron expression
+        schedule = Schedule(script_name, spec)
+        schedule.next_run = schedule.next_after(time.time())
+        self.library.set_schedule(script_name, schedule.spec, schedule.next_run)
+        with self.condition:
+            self.schedules[script_name] = schedule
+            self.push(schedule)
+        return schedule
+
+    def remove(self, script_name):
+        self.library.delete_schedule(script_name)
+        with self.condition:
+            self.schedules.pop(script_name, None)
+
+    def get(self, script_name):
+        with self.condition:
+            return self.schedules.get(script_name)
+
+    def run_loop(self):
+        while True:
+            batch = []
+            with self.condition:
+                # Collect everything that is due, then submit it with the condition released
+                while not self.stopped and not batch:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    due, _, script_name = self.heap[0]
+                    delay = due - time.time()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                        continue
+                    while self.heap and self.heap[0][0] <= time.time():
+                        due, _, script_name = heapq.heappop(self.heap)
+                        schedule = self.schedules.get(script_name)
+                        if schedule is None or schedule.next_run != due:
+                            continue  # removed or rescheduled since it was pushed
+                        batch.extend(self.dispatch(schedule, due, 1))
+                if self.stopped:
+                    return
+            self.submit(batch)
+
+    def dispatch(self, schedule, due, runs):
+        # Caller holds self.condition; returns the (script name, runs) batch to submit once it is released
+        now = time.time()
+        schedule.next_run = schedule.next_after(due)
+        if schedule.next_run <= now:
+            schedule.next_run = schedule.next_after(now)  # e.g. after the machine slept
+        self.library.set_next_run(schedule.script_name, schedule.next_run)
+        self.push(schedule)
+        if schedule.script_name in self.running:
+            self.library.add_run(schedule.script_name, 'schedule', 'skipped', "previous run still in progress")
+            return []
+        self.running.add(schedule.script_name)
+        return [(schedule.script_name, runs)]
+
+    def submit(self, batch):
+        for script_name, runs in batch:
+            self.job_engine.submit(f"Scheduled run: {script_name}",
+                                   lambda job, script_name=script_name, runs=runs:
+                                   asyncio.to_thread(self.run_job, script_name, runs, job),
+                                   priority=JobEngine.LOW_PRIORITY,
+                                   on_update=lambda job, script_name=script_name: self.job_updated(script_name, job))
+
+    def run_job(self, script_name, runs, job):
+        # Runs on a worker thread, which outlives the job's task when it is cancelled, so the run only counts
+        # as over once this returns
+        try:
+            for _ in range(runs):
+                if job.status == 'cancelled':
+                    break
+                self.run_script(script_name, job)
+        finally:
+            with self.condition:
+                self.running.discard(script_name)
+
+    def job_updated(self, script_name, job):
+        if job.status == 'cancelled' and job.started is None:
+            with self.condition:
+                self.running.discard(script_name)  # cancelled while queued, run_job never started
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+class Pipeline:
+    # Saved scripts wired into a DAG, one step per line: "[step =] script [<- step, step]"
+    def __init__(self, name, definition):
+        self.name = name
+        self.definition = definition
+        self.steps = OrderedDict()  # step -> (script name, dependency steps)
+        for number, line in enumerate(definition.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            target, _, dependencies = line.partition('<-')
+            step, has_alias, script_name = target.partition('=')
+            step = step.strip()
+            script_name = script_name.strip() if has_alias else step
+            if not step or not script_name:
+                raise ValueError(f"Line {number}: expected '[step =] script [<- step, step]'")
+            if step in self.steps:
+                raise ValueError(f"Line {number}: step '{step}' is defined twice")
+            self.steps[step] = (script_name, [dependency.strip() for dependency in dependencies.split(',')
+                                              if dependency.strip()])
+        if not self.steps:
+            raise ValueError("The pipeline has no steps")
+        for step, (_, dependencies) in self.steps.items():
+            for dependency in dependencies:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step '{step}' depends on unknown step '{dependency}'")
+        self.order = self.topological_order()
+
+    def dependents(self):
+        dependents = {step: [] for step in self.steps}
+        for step, (_, dependencies) in self.steps.items():
+            for dependency in dependencies:
+                dependents[dependency].append(step)
+        return dependents
+
+    def topological_order(self):
+        waiting = {step: len(set(dependencies)) for step, (_, dependencies) in self.steps.items()}
+        dependents = self.dependents()
+        ready = deque(step for step, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            step = ready.popleft()
+            order.append(step)
+            for dependent in set(dependents[step]):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(self.steps):
+            cycle = [step for step in self.steps if step not in order]
+            raise ValueError(f"The steps {', '.join(cycle)} depend on each other in a cycle")
+        return order
+
+    def remaining_path(self, durations, default=1.0):
+        # Longest chain of expected seconds from each step to the end of the pipeline
+        dependents = self.dependents()
+        remaining = {}
+        for step in reversed(self.order):
+            own = durations.get(self.steps[step][0]) or default
+            remaining[step] = own + max((remaining[dependent] for dependent in dependents[step]), default=0)
+        return remaining
+
+class PipelineRun:
+    # Each step becomes a job once its dependencies succeed, longest remaining path first, so independent branches
+    # run side by side and the wall time tends towards the critical path rather than the sum of the steps
+    finished_statuses = ('done', 'failed', 'cancelled', 'skipped')
+
+    def __init__(self, pipeline, job_engine, run_step, run_folder, durations=None):
+        self.pipeline = pipeline
+        self.job_engine = job_engine
+        self.run_step = run_step  # called with (script name, env, job) on a worker thread, returns an error or None
+        self.run_folder = run_folder
+        self.remaining = pipeline.remaining_path(durations or {})
+        self.dependents = pipeline.dependents()
+        self.waiting = {step: len(set(dependencies)) for step, (_, dependencies) in pipeline.steps.items()}
+        self.status = {step: 'pending' for step in pipeline.steps}
+        self.seconds = {}
+        self.errors = {}
+        self.jobs = {}  # step -> job id, for cancelling
+        self.listeners = []
+        # Never held while calling the job engine or listeners, so it can't join a lock cycle with them
+        self.lock = Lock()
+        self.cancelled = False
+        self.started = None
+        self.finished = None
+        self.finished_event = threading.Event()
+
+    def add_listener(self, callback):
+        # Called with (step, status) as steps change, then (None, overall status) when the run ends
+        self.listeners.append(callback)
+
+    def notify(self, events):
+        for step, status in events:
+            for callback in self.listeners:
+                callback(step, status)
+
+    def output_path(self, step):
+        return os.path.join(self.run_folder, f"{step}.json")
+
+    def step_env(self, step):
+        # Steps hand data on through JSON files; each one learns where to write and where its inputs are
+        dependencies = self.pipeline.steps[step][1]
+        return {
+            'TASK_PIPELINE_RUN': self.run_folder,
+            'TASK_STEP_NAME': step,
+            'TASK_STEP_OUTPUT': self.output_path(step),
+            'TASK_STEP_INPUTS': json.dumps({dependency: self.output_path(dependency) for dependency in dependencies}),
+        }
+
+    def start(self):
+        os.makedirs(self.run_folder, exist_ok=True)
+        self.started = time.time()
+        with self.lock:
+            ready = self.mark_queued([step for step, count in self.waiting.items() if count == 0])
+        self.submit(ready)
+        return self
+
+    def mark_queued(self, steps):
+        # Caller holds self.lock
+        for step in steps:
+            self.status[step] = 'queued'
+        return sorted(steps, key=lambda step: -self.remaining[step])
+
+    def submit(self, steps):
+        # Called without self.lock; the job engine notifies listeners on the submitting thread
+        self.notify([(step, 'queued') for step in steps])
+        for step in steps:
+            script_name = self.pipeline.steps[step][0]
+            env = self.step_env(step)
+            job = self.job_engine.submit(f"{self.pipeline.name}: {step}",
+                                         lambda job, script_name=script_name, env=env:
+                                         asyncio.to_thread(self.run_step, script_name, env, job),
+                                         on_update=lambda job, step=step: self.step_updated(step, job))
+            with self.lock:
+                self.jobs[step] = job.job_id
+                cancelled = self.cancelled
+            if cancelled:
+                self.job_engine.cancel(job.job_id)
+
+    def step_updated(self, step, job):
+        events = []
+        ready = []
+        with self.lock:
+            if self.status[step] in self.finished_statuses:
+                return
+            if job.status == 'running':
+                self.status[step] = 'running'
+                events.append((step, 'running'))
+            elif job.status in ('done', 'failed', 'cancelled'):
+                self.jobs.pop(step, None)
+                self.seconds[step] = (job.finished - job.started) if job.started else 0
+                if job.status == 'done' and job.result:
+                    status = 'failed'  # the script reported an error
+                    self.errors[step] = job.result
+                else:
+                    status = job.status
+                    if job.error is not None:
+                        self.errors[step] = str(job.error)
+                self.status[step] = status
+                events.append((step, status))
+                if status == 'done' and not self.cancelled:
+                    for dependent in set(self.dependents[step]):
+                        self.waiting[dependent] -= 1
+                        if self.waiting[dependent] == 0 and self.status[dependent] == 'pending':
+                            ready.append(dependent)
+                    ready = self.mark_queued(ready)
+                else:
+                    self.skip_dependents(step, events)
+            finished = self.finished is None and all(status in self.finished_statuses
+                                                     for status in self.status.values())
+            if finished:
+                self.finished = time.time()
+        self.notify(events)
+        self.submit(ready)
+        if finished:
+            self.finish()
+
+    def skip_dependents(self, step, events):
+        # Caller holds self.lock; other branches keep going
+        for dependent in self.dependents[step]:
+            if self.status[dependent] == 'pending':
+                self.status[dependent] = 'skipped'
+                events.append((dependent, 'skipped'))
+                self.skip_dependents(dependent, events)
+
+    def finish(self):
+        statuses = set(self.status.values())
+        overall = 'done' if statuses == {'done'} else 'cancelled' if 'cancelled' in statuses else 'failed'
+        self.notify([(None, overall)])
+        self.finished_event.set()
+
+    def cancel(self):
+        events = []
+        with self.lock:
+            self.cancelled = True
+            for step in self.status:
+                if self.status[step] == 'pending':
+                    self.status[step] = 'skipped'
+                    events.append((step, 'skipped'))
+            job_ids = list(self.jobs.values())
+        self.notify(events)
+        for job_id in job_ids:
+            self.job_engine.cancel(job_id)
+
+    def wait(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+    def summary(self):
+        wall = (self.finished or time.time()) - self.started
+        return (f"Pipeline '{self.pipeline.name}': {wall:.1f}s wall time for {sum(self.seconds.values()):.1f}s of steps "
+                f"({sum(1 for status in self.status.values() if status == 'done')}/{len(self.status)} steps done)")
+
 class ScriptManager:
-    def __init__(self, log_output, saved_scripts_listbox, settings):
+    def __init__(self, log_output, saved_scripts_listbox, settings, executor_pool=None, dependency_resolver=None,
+                 environment_manager=None, job_engine=None, script_index=None, library=None, bytecode_cache=None):
         self.log_output = log_output
         self.saved_scripts_listbox = saved_scripts_listbox
         self.settings = settings
+        self.executor_pool = executor_pool
+        self.dependency_resolver = dependency_resolver or DependencyResolver()
+        self.environment_manager = environment_manager
+        self.job_engine = job_engine
+        self.bytecode_cache = bytecode_cache
+        # Loose .py files in this folder are imported into the library the first time it is created
         self.scripts_folder = self.settings.get_setting('script_save_location')
-
-        # Ensure the folder exists
-        if not os.path.exists(self.scripts_folder):
-            os.makedirs(self.scripts_folder)
-
-    def save_code(self, script_name, generated_code):
+        self.settings.subscribe('script_save_location', lambda key, value: setattr(self, 'scripts_folder', value))
+        self.library = library or ScriptLibrary(self.settings.get_setting('script_library_location'), self.scripts_folder)
+        self.script_index = script_index or ScriptIndex(self.library)
+        self.scheduler = ScriptScheduler(self.library, self.job_engine, self.run_saved_script,
+                                         self.settings.get_setting('schedule_catch_up'),
+                                         self.settings.get_setting('schedule_max_catch_up_runs'))
+        self.search_index = ScriptSearchIndex()
+        self.similarity_index = ScriptSimilarityIndex()
+
+    def start_indexing(self):
+        self.script_index.add_listener(self.update_search_index)
+        self.script_index.start()
+        threading.Thread(target=self.build_search_index, daemon=True).start()
+
+    def build_search_index(self):
+        for script_name, content, prompt in self.library.entries():
+            self.search_index.add(script_name, content, prompt)
+            self.similarity_index.add(script_name, content, prompt)
+        self.similarity_index.request_rebuild()
+
+    def index_script(self, script_name):
+        entry = self.library.get(script_name)
+        if entry is None:
+            self.search_index.remove(script_name)
+            self.similarity_index.remove(script_name)
+            return
+        self.search_index.add(script_name, entry['code'], entry['prompt'])
+        self.similarity_index.add(script_name, entry['code'], entry['prompt'])
+
+    def update_search_index(self, added, removed, changed):
+        for script_name in removed:
+            self.search_index.remove(script_name)
+            self.similarity_index.remove(script_name)
+        for script_name in added + changed:
+            self.index_script(script_name)
+        self.similarity_index.request_rebuild()
+
+    def preload_hot_scripts(self, count):
+        # Compiles the most used scripts in the background so their first run is already cached
+        if self.bytecode_cache and count:
+            threading.Thread(target=self.preload_scripts, args=(count,), daemon=True).start()
+
+    def preload_scripts(self, count):
+        self.bytecode_cache.prune(content for _, content, _ in self.library.entries())
+        for script_name in self.library.names('most_used', limit=count):
+            script_code = self.library.code(script_name)
+            if script_code is not None:
+                self.bytecode_cache.get(script_code)
+
+    def compiled_script(self, script_code):
+        return self.bytecode_cache.get(script_code) if self.bytecode_cache else None
+
+    def find_similar_script(self, request):
+        matches = self.similarity_index.query(request, limit=1)
+        return matches[0] if matches else None
+
+    def search_scripts(self, query, order='name'):
+        # "tag:name" words filter by tag; the rest is a ranked text search
+        words = query.split()
+        tags = [word[4:] for word in words if word.lower().startswith('tag:') and len(word) > 4]
+        text = " ".join(word for word in words if not word.lower().startswith('tag:'))
+        if not text:
+            return self.library.names(order, tags)
+        ranked = self.search_index.search(text)
+        if tags:
+            tagged = set(self.library.names(tags=tags))
+            ranked = [script_name for script_name in ranked if script_name in tagged]
+        return ranked
+
+    def get_script(self, script_name):
+        return self.library.get(script_name)
+
+    def set_tags(self, script_name, tags):
+        self.library.set_tags(script_name, tags)
+
+    def record_run(self, script_name, seconds, error=None, trigger='manual'):
+        try:
+            self.library.record_run(script_name, seconds, error, trigger)
+        except sqlite3.Error as e:
+            self.log_output.insert(tk.END, f"Could not record the run of '{script_name}': {e}\n")
+
+    def set_schedule(self, script_name, spec):
+        # An empty spec removes the schedule
+        if not spec.strip():
+            self.scheduler.remove(script_name)
+            return None
+        return self.scheduler.add(script_name, spec)
+
+    def get_schedule(self, script_name):
+        return self.scheduler.get(script_name)
+
+    def recent_runs(self, script_name, limit=5):
+        return self.library.recent_runs(script_name, limit)
+
+    def run_saved_script(self, script_name, job=None, trigger='schedule', env=None):
+        script_code = self.library.code(script_name)
+        if script_code is None:
+            return f"'{script_name}' is no longer in the script library"
+        self.log_output.insert(tk.END, f"Running '{script_name}' ({trigger})\n")
+        self.log_output.see(tk.END)
+        return self.execute_script(script_name, script_code, job, trigger, env)
+
+    def pipeline_names(self):
+        return self.library.pipeline_names()
+
+    def get_pipeline(self, pipeline_name):
+        return self.library.pipeline(pipeline_name)
+
+    def save_pipeline(self, pipeline_name, definition):
+        # Raises ValueError for a malformed or cyclic pipeline, or one naming scripts that don't exist
+        pipeline = Pipeline(pipeline_name, definition)
+        missing = sorted({script_name for script_name, _ in pipeline.steps.values()
+                          if self.library.signature(script_name) is None})
+        if missing:
+            raise ValueError(f"Unknown scripts: {', '.join(missing)}")
+        self.library.save_pipeline(pipeline_name, definition)
+        return pipeline
+
+    def delete_pipeline(self, pipeline_name):
+        self.library.delete_pipeline(pipeline_name)
+
+    def run_pipeline(self, pipeline_name):
+        # Returns the PipelineRun unstarted, so callers can listen before the first step is queued
+        definition = self.library.pipeline(pipeline_name)
+        if definition is None:
+            raise ValueError(f"Pipeline '{pipeline_name}' not found")
+        pipeline = Pipeline(pipeline_name, definition)
+        durations = {}
+        for script_name, _ in pipeline.steps.values():
+            entry = self.library.get(script_name)
+            if entry and entry.get('average_run_seconds'):
+                durations[script_name] = entry['average_run_seconds']
+        runs_folder = self.settings.get_setting('pipeline_runs_location')
+        os.makedirs(runs_folder, exist_ok=True)
+        prefix = re.sub(r"[^\w.-]", "_", pipeline_name) + "-"
+        self.prune_pipeline_runs(runs_folder, prefix)
+        run_folder = tempfile.mkdtemp(prefix=prefix + time.strftime("%Y%m%d-%H%M%S-"), dir=runs_folder)
+        return PipelineRun(pipeline, self.job_engine, self.run_pipeline_step, run_folder, durations)
+
+    def prune_pipeline_runs(self, runs_folder, prefix):
+        keep = self.settings.get_setting('pipeline_keep_runs')
+        runs = sorted(entry.path for entry in os.scandir(runs_folder) if entry.is_dir() and entry.name.startswith(prefix))
+        for path in runs[:max(len(runs) - keep + 1, 0)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def run_pipeline_step(self, script_name, env, job):
+        return self.run_saved_script(script_name, job, 'pipeline', env)
+
+    def import_folder(self, folder):
+        count = self.library.import_folder(folder)
+        self.script_index.rescan()
+        return count
+
+    def export_folder(self, folder):
+        return self.library.export_folder(folder)
+
+    def save_code(self, script_name, generated_code, prompt=None):
         if not generated_code.strip():
             messagebox.showerror("Error", "No code generated to save.")
             return
@@ -383,90 +3600,271 @@ class ScriptManager:
             messagebox.showerror("Error", "Please enter a script name.")
             return
 
-        script_file = os.path.join(self.scripts_folder, f"{script_name}.py")
-
         def save_code_thread():
-            with open(script_file, "w") as file:
-                file.write(generated_code)
-            
-            self.saved_scripts_listbox.insert("", "end", text=script_name)
+            self.library.save(script_name, generated_code, prompt,
+                              self.dependency_resolver.third_party_distributions(generated_code))
+            # The list is updated from the index, so a save and the poller seeing it can't add the script twice
+            self.script_index.refresh_entry(script_name)
 
-            self.log_output.insert(tk.END, f"Script saved as '{script_file}'\n")
+            self.log_output.insert(tk.END, f"Script saved as '{script_name}'\n")
             self.log_output.see(tk.END)
 
-        threading.Thread(target=save_code_thread).start()
+        self.job_engine.submit_blocking(f"Save script: {script_name}", save_code_thread, priority=JobEngine.HIGH_PRIORITY)
 
     def load_saved_script(self):
         selected_item = self.saved_scripts_listbox.selection()
         if selected_item:
             script_name = self.saved_scripts_listbox.item(selected_item, 'text')
-            script_file = os.path.join(self.scripts_folder, f"{script_name}.py")
-
-            try:
-                with open(script_file, "r") as file:
-                    script_code = file.read()
+            script_code = self.library.code(script_name)
+            if script_code is None:
+                self.log_output.insert(tk.END, f"Error: '{script_name}' not found in the script library.\n")
+                self.log_output.see(tk.END)
+                return
 
+            if not self.job_engine.busy():  # other jobs may still be writing to the output
                 self.log_output.delete("1.0", tk.END)
-                self.log_output.insert(tk.END, script_code)
-                self.log_output.insert(tk.END, f"Loaded saved script '{script_name}.py':\n")
-                self.log_output.see(tk.END)
+            self.log_output.insert(tk.END, script_code)
+            self.log_output.insert(tk.END, f"Loaded saved script '{script_name}':\n")
+            self.log_output.see(tk.END)
 
-                exec(script_code)
-            except FileNotFoundError:
-                self.log_output.insert(tk.END, f"Error: '{script_name}.py' not found at '{script_file}'.\n")
-                self.log_output.see(tk.END)
-            except Exception as e:
-                self.log_output.insert(tk.END, f"An error occurred while loading or executing '{script_name}.py': {e}\n")
-                self.log_output.see(tk.END)
+            self.job_engine.submit(f"Run script: {script_name}",
+                                   lambda job: asyncio.to_thread(self.execute_script, script_name, script_code, job))
         else:
             messagebox.showerror("Error", "Please select a script to load.")
 
+    def execute_script(self, script_name, script_code, job=None, trigger='manual', env=None):
+        try:
+            python_executable = self.script_environment(script_name, script_code)
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.log_output.insert(tk.END, f"Failed to prepare the environment for '{script_name}': {e}\n")
+            self.log_output.see(tk.END)
+            self.library.add_run(script_name, trigger, 'failed', f"environment: {e}")
+            return str(e)
+        on_start = (lambda worker: setattr(job, 'process', worker)) if job else None
+        start_time = time.time()
+        error = self.executor_pool.run(script_code, self.log_script_output, python_executable, on_start,
+                                       self.compiled_script(script_code), env)
+        self.record_run(script_name, time.time() - start_time, error, trigger)
+        if error:
+            self.log_output.insert(tk.END, f"An error occurred while loading or executing '{script_name}': {error}\n")
+            self.log_output.see(tk.END)
+        return error
+
+    def log_script_output(self, stream, text):
+        self.log_output.insert(tk.END, text + "\n")
+        self.log_output.see(tk.END)
+
+    def script_environment(self, script_name, script_code):
+        if not self.environment_manager:
+            return None
+        entry = self.library.get(script_name)
+        packages = entry['dependencies'] if entry else None
+        if packages is None:
+            # Imported without resolved dependencies
+            packages = self.dependency_resolver.third_party_distributions(script_code)
+            if entry:
+                self.library.set_dependencies(script_name, packages)
+        if not packages:
+            return None
+        return self.environment_manager.ensure_environment(packages)
+
     def delete_saved_script(self):
         selected_item = self.saved_scripts_listbox.selection()
         if selected_item:
             script_name = self.saved_scripts_listbox.item(selected_item, 'text')
-            script_file = os.path.join(self.scripts_folder, f"{script_name}.py")
             
-            if os.path.exists(script_file):
-                os.remove(script_file)
-                self.saved_scripts_listbox.delete(selected_item)
-                self.log_output.insert(tk.END, f"Deleted script: {script_name}.py\n")
+            if self.library.delete(script_name):
+                self.scheduler.remove(script_name)
+                self.script_index.refresh_entry(script_name)
+                self.log_output.insert(tk.END, f"Deleted script: {script_name}\n")
                 self.log_output.see(tk.END)
             else:
-                messagebox.showerror("Error", f"Script file not found: {script_name}.py")
+                messagebox.showerror("Error", f"Script not found: {script_name}")
         else:
             messagebox.showerror("Error", "Please select a script to delete.")
 
 class APITracker:
-    def __init__(self, rpm_limit=15):
+    def __init__(self, rpm_limit=15, usage_file=None, save_delay=1.0):
         self.rpm_limit = rpm_limit
-        self.requests = []
+        self.window = 60
+        # Start times of requests in the current window; times in the future are reservations still waiting
+        self.requests = deque()
         self.total_requests = 0
+        self.usage_file = usage_file
+        self.save_delay = save_delay
+        self.save_timer = None
         self.lock = Lock()
+        self.save_lock = Lock()  # one writer at a time, without blocking reservations
+        self.load_usage()
+        atexit.register(self.flush)
 
-    def add_request(self):
+    def load_usage(self):
+        if not self.usage_file or not os.path.exists(self.usage_file):
+            return
+        try:
+            with open(self.usage_file, 'r') as f:
+                usage = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.total_requests = usage.get('total_requests', 0)
+        now = time.time()
+        # Requests from just before a restart still count against the quota
+        self.requests.extend(t for t in usage.get('recent_requests', []) if now - t < self.window)
+
+    def save_usage(self):
+        with self.save_lock:
+            with self.lock:
+                self.save_timer = None
+                data = json.dumps({'total_requests': self.total_requests, 'recent_requests': list(self.requests)})
+            temp_path = f"{self.usage_file}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    f.write(data)
+                os.replace(temp_path, self.usage_file)
+            except OSError:
+                pass
+
+    def schedule_save(self):
+        # Caller holds self.lock; a burst of requests becomes one write
+        if self.usage_file and self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.save_usage)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
         with self.lock:
-            current_time = time.time()
-            self.requests = [t for t in self.requests if current_time - t < 60]
-            self.requests.append(current_time)
+            if self.save_timer is None:
+                return
+            self.save_timer.cancel()
+        self.save_usage()
+
+    def next_slot(self, now):
+        # Caller holds self.lock
+        while self.requests and self.requests[0] <= now - self.window:
+            self.requests.popleft()
+        if len(self.requests) < self.rpm_limit:
+            return now
+        return max(now, self.requests[-self.rpm_limit] + self.window)
+
+    def reserve(self):
+        # Books the next free slot and returns its time; the caller waits until then before sending
+        with self.lock:
+            slot = self.next_slot(time.time())
+            self.requests.append(slot)
             self.total_requests += 1
+            self.schedule_save()
+        return slot
+
+    def release(self, slot):
+        # Gives back a reservation whose request was never sent, e.g. a cancelled job
+        with self.lock:
+            try:
+                self.requests.remove(slot)
+            except ValueError:
+                return
+            self.total_requests -= 1
+            self.schedule_save()
+
+    async def acquire_async(self, on_wait=None):
+        # Waits for a slot and returns it; on_wait is called with the delay when the quota is full
+        slot = self.reserve()
+        wait = slot - time.time()
+        if wait > 0 and on_wait:
+            on_wait(wait)
+        try:
+            await asyncio.sleep(max(0, wait))
+        except asyncio.CancelledError:
+            self.release(slot)
+            raise
+        return slot
+
+    def try_reserve(self):
+        # Books a slot only if one is free right now
+        with self.lock:
+            now = time.time()
+            if self.next_slot(now) > now:
+                return False
+            self.requests.append(now)
+            self.total_requests += 1
+            self.schedule_save()
+        return True
 
     def get_current_rpm(self):
         with self.lock:
-            current_time = time.time()
-            self.requests = [t for t in self.requests if current_time - t < 60]
-            return len(self.requests)
+            now = time.time()
+            return sum(1 for t in self.requests if now - self.window < t <= now)
+
+    def get_queue_status(self):
+        with self.lock:
+            now = time.time()
+            waiting = [t for t in self.requests if t > now]
+            next_free = self.next_slot(now) - now
+        if waiting:
+            return len(waiting), max(waiting) - now
+        return 0, next_free
 
     def get_total_requests(self):
         return self.total_requests
 
 
 class Settings:
-    def __init__(self):
-        self.config_file = 'config.json'
+    # One store per process (see instance()), kept in memory; writes are validated, saved atomically after a short
+    # debounce and announced to subscribers, and edits made to the file by hand are picked up while running
+    shared_instance = None
+    shared_lock = Lock()
+    # Checks on top of "same type as the default"
+    allowed_values = {'schedule_catch_up': ('skip', 'once', 'all')}
+    minimum_values = {
+        'response_cache_max_mb': 0, 'rpm_limit': 1, 'hedge_min_delay': 0, 'max_concurrent_jobs': 1,
+        'reuse_suggest_threshold': 0, 'reuse_autorun_threshold': 0, 'map_reduce_chunk_kb': 1,
+        'map_reduce_concurrency': 1, 'attachment_max_image_side': 1, 'attachment_text_budget_kb': 1,
+        'metrics_export_interval': 1, 'history_token_budget': 1, 'max_chat_sessions': 1, 'executor_pool_size': 0,
+        'preload_hot_scripts': 0, 'schedule_max_catch_up_runs': 1, 'pipeline_keep_runs': 1,
+    }
+    maximum_values = {'reuse_suggest_threshold': 1, 'reuse_autorun_threshold': 1}
+    model_name_pattern = re.compile(r"(models/)?[A-Za-z0-9][\w.\-]*")
+
+    def __init__(self, config_file='config.json', save_delay=0.5, poll_interval=2.0):
+        self.config_file = config_file
+        self.save_delay = save_delay
+        self.poll_interval = poll_interval
         self.default_settings = {
             'api_key': '',
             'script_save_location': os.path.join(os.path.dirname(__file__), "automated_scripts"),
+            'script_library_location': os.path.join(os.path.dirname(__file__), "scripts.db"),
+            'bytecode_cache_location': os.path.join(os.path.dirname(__file__), "bytecode_cache"),
+            'preload_hot_scripts': 10,
+            'schedule_catch_up': 'once',
+            'schedule_max_catch_up_runs': 50,
+            'pipeline_runs_location': os.path.join(os.path.dirname(__file__), "pipeline_runs"),
+            'pipeline_keep_runs': 20,
+            'response_cache_location': os.path.join(os.path.dirname(__file__), "response_cache"),
+            'response_cache_max_mb': 50,
+            'use_script_environments': True,
+            'environments_location': os.path.join(os.path.dirname(__file__), "script_envs"),
+            'wheelhouse_location': os.path.join(os.path.dirname(__file__), "wheelhouse"),
+            'rpm_limit': 15,
+            'api_usage_location': os.path.join(os.path.dirname(__file__), "api_usage.json"),
+            'model_backends': ['gemini-1.5-flash'],
+            'hedge_requests': True,
+            'hedge_min_delay': 1.0,
+            'max_concurrent_jobs': 2,
+            'reuse_saved_scripts': True,
+            'reuse_suggest_threshold': 0.5,
+            'reuse_autorun_threshold': 0.9,
+            'map_reduce_chunk_kb': 512,
+            'map_reduce_concurrency': 4,
+            'attachment_cache_location': os.path.join(os.path.dirname(__file__), "attachment_cache"),
+            'attachment_max_image_side': 1536,
+            'attachment_text_budget_kb': 64,
+            'upload_attachments': True,
+            'metrics_location': os.path.join(os.path.dirname(__file__), "metrics.prom"),
+            'metrics_export_interval': 5,
+            'history_token_budget': 8000,
+            'max_chat_sessions': 8,
+            'executor_pool_size': 2,
+            'executor_preload_modules': ['os', 'sys', 'time', 'json', 're', 'shutil', 'subprocess', 'pathlib',
+                                         'datetime', 'webbrowser', 'requests', 'pyautogui'],
             'shortcuts': {
                 'save_script': '<Control-s>',
                 'copy_output': '<Control-c>',
@@ -477,57 +3875,297 @@ class Settings:
                 'refresh' : '<Control-r>'
             } 
         }
+        self.lock = threading.RLock()
+        self.subscribers = {}  # key -> callbacks taking (key, value)
+        self.save_timer = None
+        self.file_signature = None  # (mtime, size) of the file as last read or written here
+        self.stopped = threading.Event()
         self.settings = self.load_settings()
+        atexit.register(self.flush)
+
+    @classmethod
+    def instance(cls):
+        with cls.shared_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+            return cls.shared_instance
+
+    def validate(self, key, value):
+        # Returns value, or raises ValueError if it doesn't fit the schema for key; unknown keys pass through
+        if key not in self.default_settings:
+            return value
+        default = self.default_settings[key]
+        if isinstance(default, bool):
+            expected = (bool,)
+        elif isinstance(default, float):
+            expected = (int, float)
+        else:
+            expected = (type(default),)
+        if not isinstance(value, expected) or (isinstance(value, bool) and not isinstance(default, bool)):
+            raise ValueError(f"Setting '{key}' must be of type {type(default).__name__}, got {value!r}")
+        if isinstance(value, list) and not all(isinstance(item, str) for item in value):
+            raise ValueError(f"Setting '{key}' must be a list of strings")
+        if isinstance(value, dict) and not all(isinstance(item, str) for item in value.values()):
+            raise ValueError(f"Setting '{key}' must map names to strings")
+        if key in self.allowed_values and value not in self.allowed_values[key]:
+            raise ValueError(f"Setting '{key}' must be one of {', '.join(self.allowed_values[key])}")
+        if key in self.minimum_values and value < self.minimum_values[key]:
+            raise ValueError(f"Setting '{key}' must be at least {self.minimum_values[key]}")
+        if key in self.maximum_values and value > self.maximum_values[key]:
+            raise ValueError(f"Setting '{key}' must be at most {self.maximum_values[key]}")
+        if key == 'model_backends':
+            # The router needs at least one backend to send requests to
+            if not value:
+                raise ValueError(f"Setting '{key}' must name at least one model")
+            invalid = [name for name in value if not self.model_name_pattern.fullmatch(name)]
+            if invalid:
+                raise ValueError(f"Setting '{key}' has invalid model names: {', '.join(map(repr, invalid))}")
+            if len(set(value)) != len(value):
+                raise ValueError(f"Setting '{key}' lists the same model more than once")
+        return value
+
+    def subscribe(self, keys, callback):
+        # callback(key, value) runs on the thread that made the change, or the file watcher for external edits
+        for key in [keys] if isinstance(keys, str) else keys:
+            self.subscribers.setdefault(key, []).append(callback)
+
+    def notify(self, changes):
+        for key, value in changes:
+            for callback in list(self.subscribers.get(key, [])):
+                callback(key, value)
 
     def update_shortcuts(self):
         current_shortcuts = self.settings.get('shortcuts', {})
-        for key, value in self.default_settings['shortcuts'].items():
-            if key not in current_shortcuts:
-                current_shortcuts[key] = value
-        self.settings['shortcuts'] = current_shortcuts
-        self.save_settings()
-        
+        missing = {key: value for key, value in self.default_settings['shortcuts'].items() if key not in current_shortcuts}
+        if missing:
+            self.set_setting('shortcuts', {**current_shortcuts, **missing})
+
+    def stat_signature(self):
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read_file(self):
+        # Valid values from the config file; a bad value falls back to its default rather than breaking startup
+        with open(self.config_file, 'r') as f:
+            loaded = json.load(f)
+        signature = self.stat_signature()
+        if not isinstance(loaded, dict):
+            raise ValueError(f"{self.config_file} must contain a JSON object")
+        values = {}
+        for key, value in loaded.items():
+            try:
+                values[key] = self.validate(key, value)
+            except ValueError as e:
+                print(f"Ignoring invalid setting in {self.config_file}: {e}", file=sys.stderr)
+        return values, signature
+
     def load_settings(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
-        return self.default_settings
+        try:
+            values, self.file_signature = self.read_file()
+            return values
+        except FileNotFoundError:
+            return copy.deepcopy(self.default_settings)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {self.config_file}, using defaults: {e}", file=sys.stderr)
+            return copy.deepcopy(self.default_settings)
 
     def save_settings(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self.settings, f, indent=4)
+        with self.lock:
+            self.save_timer = None
+            data = json.dumps(self.settings, indent=4)
+            temp_path = f"{self.config_file}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    f.write(data)
+                os.replace(temp_path, self.config_file)
+                self.file_signature = self.stat_signature()
+            except OSError as e:
+                print(f"Could not save {self.config_file}: {e}", file=sys.stderr)
+
+    def schedule_save(self):
+        # Caller holds self.lock; a burst of changes becomes one write
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.save_settings)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.save_timer is None:
+                return
+            self.save_timer.cancel()
+            self.save_settings()
 
     def get_setting(self, key):
-        if key == 'shortcuts':
-        # Merge the default shortcuts with the saved shortcuts
-            default_shortcuts = self.default_settings['shortcuts']
-            saved_shortcuts = self.settings.get('shortcuts', {})
-            return {**default_shortcuts, **saved_shortcuts}
-        return self.settings.get(key, self.default_settings.get(key))
-        
+        with self.lock:
+            if key == 'shortcuts':
+                # Merge the default shortcuts with the saved shortcuts
+                default_shortcuts = self.default_settings['shortcuts']
+                saved_shortcuts = self.settings.get('shortcuts', {})
+                return {**default_shortcuts, **saved_shortcuts}
+            # Copied so callers can't change the stored value behind the store's back
+            return copy.deepcopy(self.settings.get(key, self.default_settings.get(key)))
+
     def set_setting(self, key, value):
-        self.settings[key] = value
-        self.save_settings()
+        value = self.validate(key, value)
+        with self.lock:
+            if key in self.settings and self.settings[key] == value:
+                return
+            self.settings[key] = copy.deepcopy(value)
+            self.schedule_save()
+        self.notify([(key, value)])
 
     def reset_to_default(self):
-        self.settings = self.default_settings.copy()
-        self.save_settings()
+        with self.lock:
+            previous = self.settings
+            self.settings = copy.deepcopy(self.default_settings)
+            self.schedule_save()
+        self.notify([(key, value) for key, value in self.default_settings.items() if previous.get(key) != value])
+
+    def start_watching(self):
+        threading.Thread(target=self.watch_file, daemon=True).start()
+
+    def watch_file(self):
+        while not self.stopped.wait(self.poll_interval):
+            if self.stat_signature() not in (None, self.file_signature):
+                self.reload()
+
+    def reload(self):
+        # Keys present in the edited file win; keys missing from it keep their current values
+        try:
+            values, signature = self.read_file()
+        except (OSError, ValueError) as e:
+            print(f"Could not reload {self.config_file}: {e}", file=sys.stderr)
+            self.file_signature = self.stat_signature()  # wait for the next edit
+            return
+        with self.lock:
+            self.file_signature = signature
+            changes = [(key, value) for key, value in values.items() if self.settings.get(key) != value]
+            self.settings.update(values)
+        self.notify(changes)
+
+    def stop_watching(self):
+        self.stopped.set()
+
+class UIUpdateBus:
+    def __init__(self, root, frame_interval=16, metrics=None, max_operations=2000):
+        self.root = root
+        self.frame_interval = frame_interval
+        self.metrics = metrics
+        self.max_operations = max_operations  # per frame, so a flood of output can't freeze the window
+        self.operations = queue.SimpleQueue()
+
+    def start(self):
+        self.root.after(self.frame_interval, self.drain)
+
+    def post(self, target, method, args=(), kwargs=None):
+        self.operations.put((target, method, args, kwargs or {}))
+
+    def proxy(self, target):
+        if isinstance(target, tk.Variable):
+            return VariableProxy(self, target)
+        return WidgetProxy(self, target)
+
+    def drain(self):
+        started = time.time()
+        batch = []
+        variable_values = {}
+        scroll_targets = []
+        backlog = False
+        for _ in range(self.max_operations):
+            try:
+                target, method, args, kwargs = self.operations.get_nowait()
+            except queue.Empty:
+                break
+
+            if method == 'set' and isinstance(target, tk.Variable):
+                variable_values[target] = args[0]  # only the last value within a frame is ever visible
+            elif method == 'see' and args == (tk.END,):
+                if target not in scroll_targets:
+                    scroll_targets.append(target)
+            elif method == 'insert' and args[0] == tk.END and not kwargs:
+                # Consecutive appends with the same tags become a single insert
+                tags = tuple(args[2:])
+                last = batch[-1] if batch else None
+                if last and last[0] is target and last[1] == 'append' and last[3] == tags:
+                    last[2].append(args[1])
+                else:
+                    batch.append((target, 'append', [args[1]], tags))
+            else:
+                batch.append((target, method, args, kwargs))
+        else:
+            backlog = not self.operations.empty()
+
+        for target, method, args, extra in batch:
+            try:
+                if method == 'append':
+                    target.insert(tk.END, "".join(args), *extra)
+                else:
+                    getattr(target, method)(*args, **extra)
+            except tk.TclError:
+                pass  # the widget was destroyed while the update was queued
+        for variable, value in variable_values.items():
+            variable.set(value)
+        for target in scroll_targets:
+            target.see(tk.END)
+
+        if self.metrics and (batch or variable_values or scroll_targets):
+            self.metrics.record('render', time.time() - started)
+        # The rest of a backlog goes in the next tick, after Tk has handled input and redrawn
+        self.root.after(1 if backlog else self.frame_interval, self.drain)
+
+class WidgetProxy:
+    # Stands in for a widget on worker threads: updates are queued on the bus, reads go straight through
+    queued_methods = {'insert', 'delete', 'see', 'config', 'configure', 'mark_set', 'mark_unset', 'mark_gravity',
+                      'tag_add', 'tag_remove', 'move'}
+
+    def __init__(self, bus, widget):
+        self.bus = bus
+        self.widget = widget
+
+    def __getattr__(self, name):
+        if name in self.queued_methods:
+            return lambda *args, **kwargs: self.bus.post(self.widget, name, args, kwargs)
+        return getattr(self.widget, name)
+
+class VariableProxy:
+    def __init__(self, bus, variable):
+        self.bus = bus
+        self.variable = variable
+        self.value = variable.get()
+
+    def set(self, value):
+        self.value = value
+        self.bus.post(self.variable, 'set', (value,))
+
+    def get(self):
+        return self.value
 
 class GUI:
     def __init__(self, root, api_handler, code_generator, qa_handler, script_manager, update_handler, app):
         self.root = root
-        self.api_tracker = APITracker()
+        self.api_tracker = app.api_tracker
+        self.metrics = app.metrics
         self.api_handler = api_handler
         self.code_generator = code_generator
         self.qa_handler = qa_handler
         self.script_manager = script_manager
         self.update_handler = update_handler
-        self.settings = Settings()
+        self.settings = app.settings
         self.app = app
         self.mode_var = StringVar(value="Automation")
+        self.ui_bus = UIUpdateBus(self.root, metrics=self.metrics)
         self.setup_gui()
+        self.log_output_proxy = self.ui_bus.proxy(self.log_output)  # for writes from worker threads
+        self.ui_bus.start()
+        self.bound_shortcuts = []
         self.setup_keyboard_shortcuts()
-        self.update_api_tracker()
+        self.settings.subscribe('shortcuts', lambda key, value: self.ui_bus.post(self, 'setup_keyboard_shortcuts'))
+        self.settings.subscribe('rpm_limit', lambda key, value: self.ui_bus.post(self.rpm_progress, 'configure',
+                                                                                 kwargs={'maximum': value}))
         self.update_api_tracker()
         #self.setup_global_hotkey()
 
@@ -560,6 +4198,7 @@ class GUI:
         self.setup_input_section(left_pane)
         self.setup_output_section(left_pane)
         self.setup_saved_scripts_section(right_pane)
+        self.setup_jobs_section(right_pane)
         self.setup_api_tracker_display(self.root)
         self.setup_status_bar()
         self.set_tab_order()
@@ -667,12 +4306,14 @@ class GUI:
         ttk.Button(parent, text="Update API Key", command=lambda: self.update_api_key(api_key_var.get())).pack(anchor=W, padx=10, pady=10)
 
     def setup_save_location_tab(self, parent):
-        ttk.Label(parent, text="Script Save Location:").pack(anchor=W, padx=10, pady=10)
+        ttk.Label(parent, text="Script Folder (import / export):").pack(anchor=W, padx=10, pady=10)
         save_location_var = StringVar(value=self.settings.get_setting('script_save_location'))
         save_location_entry = ttk.Entry(parent, textvariable=save_location_var, width=50)
         save_location_entry.pack(anchor=W, padx=10, pady=5)
         ttk.Button(parent, text="Browse", command=lambda: self.browse_save_location(save_location_var)).pack(anchor=W, padx=10, pady=5)
         ttk.Button(parent, text="Update Save Location", command=lambda: self.update_save_location(save_location_var.get())).pack(anchor=W, padx=10, pady=10)
+        ttk.Button(parent, text="Import Scripts From Folder", command=lambda: self.import_scripts(save_location_var.get())).pack(anchor=W, padx=10, pady=5)
+        ttk.Button(parent, text="Export Scripts To Folder", command=lambda: self.export_scripts(save_location_var.get())).pack(anchor=W, padx=10, pady=5)
 
     def change_shortcut(self, action, shortcut_var):
         new_shortcut = simpledialog.askstring("Change Shortcut", f"Enter new shortcut for {action}:", parent=self.root)
@@ -680,18 +4321,14 @@ class GUI:
             shortcut_var.set(new_shortcut)
             shortcuts = self.settings.get_setting('shortcuts')
             shortcuts[action] = new_shortcut
-            self.settings.set_setting('shortcuts', shortcuts)
-            self.setup_keyboard_shortcuts()
+            self.settings.set_setting('shortcuts', shortcuts)  # rebinds through the settings subscription
 
     def reset_shortcuts(self):
-        self.settings.reset_to_default()
-        self.setup_keyboard_shortcuts()
+        self.settings.set_setting('shortcuts', dict(self.settings.default_settings['shortcuts']))
         messagebox.showinfo("Reset Shortcuts", "Shortcuts have been reset to default values.")
 
     def update_api_key(self, new_api_key):
         self.settings.set_setting('api_key', new_api_key)
-        self.api_handler.api_key = new_api_key
-        self.api_handler.configure_api()
         messagebox.showinfo("API Key Updated", "API Key has been updated successfully.")
 
     def browse_save_location(self, save_location_var):
@@ -702,12 +4339,30 @@ class GUI:
     def update_save_location(self, new_location):
         if os.path.exists(new_location):
             self.settings.set_setting('script_save_location', new_location)
-            self.script_manager.scripts_folder = new_location
             messagebox.showinfo("Save Location Updated", "Script save location has been updated successfully.")
         else:
             messagebox.showerror("Invalid Location", "The specified location does not exist.")
 
 
+    def import_scripts(self, folder):
+        if not os.path.isdir(folder):
+            messagebox.showerror("Invalid Location", "The specified location does not exist.")
+            return
+        try:
+            count = self.script_manager.import_folder(folder)
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("Import Failed", f"Could not import scripts from '{folder}': {e}")
+            return
+        messagebox.showinfo("Scripts Imported", f"Imported {count} scripts from '{folder}'.")
+
+    def export_scripts(self, folder):
+        try:
+            count = self.script_manager.export_folder(folder)
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("Export Failed", f"Could not export scripts to '{folder}': {e}")
+            return
+        messagebox.showinfo("Scripts Exported", f"Exported {count} scripts to '{folder}'.")
+
     def setup_input_section(self, parent):
         input_frame = ttk.LabelFrame(parent, text="Input", padding="10")
         input_frame.pack(fill=X, pady=(0, 10))
@@ -735,10 +4390,16 @@ class GUI:
         ttk.Radiobutton(mode_frame, text="Automation", variable=self.mode_var, value="Automation").pack(side=LEFT, padx=(0, 10))
         ttk.Radiobutton(mode_frame, text="Q/A", variable=self.mode_var, value="Q/A").pack(side=LEFT)
 
+        self.follow_up_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="Follow-up to previous request", variable=self.follow_up_var).pack(side=RIGHT)
+
         ttk.Button(input_frame, text="Process", command=self.process_input, style='success.TButton').pack(fill=X, pady=(10, 0))
         
     def clear_input_output(self):
         self.entry.delete(0, tk.END)
+        if self.app.job_engine.busy():
+            self.update_status("Input cleared; output kept while jobs are running")
+            return
         self.log_output.delete("1.0", tk.END)
         self.update_status("Input and output cleared")
 
@@ -747,6 +4408,7 @@ class GUI:
         output_frame.pack(fill=BOTH, expand=YES, pady=(10, 0))
 
         self.log_output = scrolledtext.ScrolledText(output_frame, wrap=tk.WORD, font=('Consolas', 11))
+        self.setup_markdown_tags(self.log_output)
         self.log_output.pack(fill=BOTH, expand=YES)
 
         button_frame = ttk.Frame(output_frame)
@@ -762,6 +4424,9 @@ class GUI:
         self.progress_bar = ttk.Progressbar(parent, variable=self.progress_var, maximum=100)
         self.progress_bar.pack(fill=X, pady=(10, 0))
 
+        self.ttft_var = tk.StringVar()
+        ttk.Label(parent, textvariable=self.ttft_var, anchor=E).pack(fill=X)
+
     def setup_saved_scripts_section(self, parent):
         scripts_frame = ttk.LabelFrame(parent, text="Saved Scripts", padding="10")
         scripts_frame.pack(fill=BOTH, expand=YES)
@@ -772,8 +4437,15 @@ class GUI:
     
         self.script_search_var = tk.StringVar() 
         self.script_search_var.trace("w", self.filter_scripts)
+        self.filter_after = None
         search_entry = ttk.Entry(search_frame, textvariable=self.script_search_var, width=30)
         search_entry.pack(side=LEFT, fill=X, expand=YES)
+        self.script_orders = {"Name": 'name', "Most used": 'most_used', "Recently run": 'recent'}
+        self.script_order_var = tk.StringVar(value="Name")
+        order_combobox = ttk.Combobox(search_frame, textvariable=self.script_order_var, values=list(self.script_orders),
+                                      state="readonly", width=12)
+        order_combobox.pack(side=LEFT, padx=(5, 0))
+        order_combobox.bind("<<ComboboxSelected>>", self.filter_scripts)
         #ttk.Label(search_frame, text="🔍").pack(side=LEFT, padx=(5, 0))
 
 
@@ -788,37 +4460,106 @@ class GUI:
         button_frame.pack(fill=X, pady=(10, 0))
 
         ttk.Button(button_frame, text="Load Selected Script", command=self.load_saved_script, style='info.TButton').pack(side=LEFT, fill=X, expand=YES, padx=(0, 5))
+        ttk.Button(button_frame, text="Edit Tags", command=self.edit_script_tags, style='secondary.TButton').pack(side=LEFT, fill=X, expand=YES, padx=5)
+        ttk.Button(button_frame, text="Schedule", command=self.edit_script_schedule, style='secondary.TButton').pack(side=LEFT, fill=X, expand=YES, padx=5)
+        ttk.Button(button_frame, text="Pipelines", command=self.open_pipelines, style='secondary.TButton').pack(side=LEFT, fill=X, expand=YES, padx=5)
         ttk.Button(button_frame, text="Delete Selected Script", command=self.delete_saved_script, style='danger.TButton').pack(side=RIGHT, fill=X, expand=YES, padx=(5, 0))
 
         self.populate_saved_scripts()
+        self.script_manager.script_index.add_listener(
+            lambda added, removed, changed: self.ui_bus.post(self, 'filter_scripts'))
+
+    def setup_jobs_section(self, parent):
+        jobs_frame = ttk.LabelFrame(parent, text="Jobs", padding="10")
+        jobs_frame.pack(fill=X, pady=(10, 0))
+
+        self.jobs_listbox = ttk.Treeview(jobs_frame, columns=("status",), show="tree headings", height=5, selectmode="browse")
+        self.jobs_listbox.heading("#0", text="Job")
+        self.jobs_listbox.heading("status", text="Status")
+        self.jobs_listbox.column("status", width=80, stretch=False)
+        self.jobs_listbox.pack(fill=X)
+
+        ttk.Button(jobs_frame, text="Cancel Selected Job", command=self.cancel_selected_job, style='danger.TButton').pack(fill=X, pady=(10, 0))
+
+        # Job updates arrive on the engine thread
+        self.app.job_engine.add_listener(lambda job: self.ui_bus.post(self, 'update_job_row', (job,)))
+
+    def update_job_row(self, job):
+        iid = str(job.job_id)
+        if self.jobs_listbox.exists(iid):
+            self.jobs_listbox.item(iid, values=(job.status,))
+        else:
+            self.jobs_listbox.insert("", 0, iid=iid, text=f"#{job.job_id} {job.description}", values=(job.status,))
+
+        # Rows follow the engine's capped history, so jobs it has forgotten drop out of the list
+        known = self.app.job_engine.known_job_ids()
+        for old_iid in self.jobs_listbox.get_children():
+            if int(old_iid) not in known:
+                self.jobs_listbox.delete(old_iid)
+
+    def cancel_selected_job(self):
+        selected = self.jobs_listbox.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a job to cancel.")
+            return
+        if self.app.job_engine.cancel(int(selected[0])):
+            self.update_status(f"Cancelling job #{selected[0]}")
+        else:
+            self.update_status(f"Job #{selected[0]} already finished")
 
     def filter_scripts(self, *args):
-        search_term = self.script_search_var.get().lower()
-        self.saved_scripts_listbox.delete(*self.saved_scripts_listbox.get_children())
-        scripts_folder = self.script_manager.scripts_folder
-        for script_file in os.listdir(scripts_folder):
-            if script_file.endswith(".py") and search_term in script_file.lower():
-                script_name = os.path.splitext(script_file)[0]
-                self.saved_scripts_listbox.insert("", "end", text=script_name)
+        # Wait for a pause in typing instead of filtering on every keystroke
+        if self.filter_after:
+            self.root.after_cancel(self.filter_after)
+        self.filter_after = self.root.after(150, self.populate_saved_scripts)
+    def setup_markdown_tags(self, text_widget):
+        text_widget.tag_configure('md_bold', font=('Consolas', 11, 'bold'))
+        text_widget.tag_configure('md_italic', font=('Consolas', 11, 'italic'))
+        text_widget.tag_configure('md_code', background='#eef0f3', foreground='#c7254e')
+        text_widget.tag_configure('md_code_block', background='#f4f5f7', lmargin1=12, lmargin2=12)
+        text_widget.tag_configure('md_h1', font=('Consolas', 15, 'bold'), spacing1=6, spacing3=2)
+        text_widget.tag_configure('md_h2', font=('Consolas', 13, 'bold'), spacing1=4, spacing3=2)
+        text_widget.tag_configure('md_h3', font=('Consolas', 11, 'bold'), spacing1=2)
+        text_widget.tag_configure('md_bullet', foreground='#2780e3')
+        text_widget.tag_configure('md_quote', foreground='#6c757d', lmargin1=12, lmargin2=12)
+        text_widget.tag_configure('md_rule', foreground='#adb5bd')
+
     def setup_api_tracker_display(self, parent):
         tracker_frame = ttk.LabelFrame(parent, text="API Usage", padding="10")
         tracker_frame.pack(fill=X, pady=(10, 0))
 
+        self.stage_stats_var = tk.StringVar()
+        ttk.Label(tracker_frame, textvariable=self.stage_stats_var, anchor=W).pack(side=BOTTOM, fill=X, pady=(5, 0))
+
+        self.routing_stats_var = tk.StringVar()
+        ttk.Label(tracker_frame, textvariable=self.routing_stats_var, anchor=W).pack(side=BOTTOM, fill=X, pady=(5, 0))
+
         self.rpm_var = tk.IntVar()
         self.total_requests_var = tk.IntVar()
 
         ttk.Label(tracker_frame, text="Requests per minute:").pack(side=LEFT, padx=(0, 5))
-        self.rpm_progress = ttk.Progressbar(tracker_frame, variable=self.rpm_var, maximum=15, length=200, mode='determinate', style='info.Horizontal.TProgressbar')
+        self.rpm_progress = ttk.Progressbar(tracker_frame, variable=self.rpm_var, maximum=self.api_tracker.rpm_limit, length=200, mode='determinate', style='info.Horizontal.TProgressbar')
         self.rpm_progress.pack(side=LEFT, padx=(0, 10))
 
         ttk.Label(tracker_frame, text="Total requests:").pack(side=LEFT, padx=(10, 5))
         ttk.Label(tracker_frame, textvariable=self.total_requests_var, font=('Helvetica', 10, 'bold')).pack(side=LEFT)
 
+        self.queue_status_var = tk.StringVar()
+        ttk.Label(tracker_frame, textvariable=self.queue_status_var).pack(side=LEFT, padx=(20, 0))
+
+        self.cache_stats_var = tk.StringVar()
+        ttk.Label(tracker_frame, text="Response cache:").pack(side=LEFT, padx=(20, 5))
+        ttk.Label(tracker_frame, textvariable=self.cache_stats_var).pack(side=LEFT)
+
     def setup_status_bar(self):
         self.status_bar = ttk.Label(self.root, text="Ready", relief=tk.SUNKEN, anchor=W, padding=(5, 2))
         self.status_bar.pack(side=BOTTOM, fill=X)
 
     def setup_keyboard_shortcuts(self):
+        # Also called when the shortcuts change, so drop the previous bindings first
+        for sequence in self.bound_shortcuts:
+            self.root.unbind(sequence)
+        self.bound_shortcuts = []
         shortcuts = self.settings.get_setting('shortcuts')
         shortcut_bindings = [
             ('save_script', self.save_code),
@@ -832,6 +4573,7 @@ class GUI:
         for shortcut_name, function in shortcut_bindings:
             if shortcut_name in shortcuts:
                 self.root.bind(shortcuts[shortcut_name], lambda e, f=function: f())
+                self.bound_shortcuts.append(shortcuts[shortcut_name])
      
     
             
@@ -858,19 +4600,53 @@ class GUI:
             self.file_path_var.set("")
             self.file_label.config(text="No file selected")
 
-    def process_input(self):
+    def process_input(self, priority=JobEngine.NORMAL_PRIORITY):
         if self.root.focus_get() == self.saved_scripts_listbox:
             self.load_saved_script()
         else:
             mode = self.mode_var.get()
-            self.update_status("Processing...")
+            follow_up = self.follow_up_var.get()
+            if mode == "Automation" and not follow_up and not self.file_path_var.get():
+                if self.reuse_saved_script(self.entry.get()):
+                    return
             if mode == "Automation":
-                self.code_generator.generate_code(self.entry.get(), self.file_path_var.get())
+                job = self.code_generator.generate_code(self.entry.get(), self.file_path_var.get(), priority,
+                                                        follow_up=follow_up)
             elif mode == "Q/A":
-                self.qa_handler.qa_mode(self.entry.get(), self.file_path_var.get())
-            self.update_status("Ready")
-            self.api_tracker.add_request()
+                job = self.qa_handler.qa_mode(self.entry.get(), self.file_path_var.get(), priority, follow_up=follow_up)
+            else:
+                return
+            self.update_status(f"Job #{job.job_id} queued")
     
+    def reuse_saved_script(self, request):
+        # Checks the saved scripts before asking the model; returns True if one was run instead
+        if not self.settings.get_setting('reuse_saved_scripts'):
+            return False
+        match = self.script_manager.find_similar_script(request)
+        if match is None:
+            return False
+        script_name, score = match
+        if score >= self.settings.get_setting('reuse_autorun_threshold'):
+            reuse = True
+        elif score >= self.settings.get_setting('reuse_suggest_threshold'):
+            reuse = messagebox.askyesno("Reuse Saved Script",
+                                        f"Reuse existing script '{script_name}' (score {score:.2f}) instead of "
+                                        "generating a new one?")
+        else:
+            return False
+        if not reuse:
+            return False
+
+        entry = self.script_manager.get_script(script_name)
+        if entry is None:
+            return False
+        script_code = entry['code']
+        self.log_output.insert(tk.END, f"Reusing saved script '{script_name}' (score {score:.2f}) instead of calling the model\n")
+        self.log_output.see(tk.END)
+        self.execute_script(script_code, script_name)
+        self.update_status(f"Reused saved script '{script_name}'")
+        return True
+
     def extract_content(self, content, file_type):
         start_marker = f"```{file_type.lower()}"
         end_marker = "```"
@@ -903,7 +4679,7 @@ class GUI:
                     confirm = messagebox.askyesno("Confirm Save", f"The following code will be saved:\n\n{generated_code}\n\nDo you want to proceed?")
                     if confirm:
                         # Save the code
-                        self.script_manager.save_code(script_name, generated_code)
+                        self.script_manager.save_code(script_name, generated_code, self.code_generator.request_text)
                         self.populate_saved_scripts()
                         self.update_status(f"Script '{script_name}' saved successfully")
                     else:
@@ -944,52 +4720,278 @@ class GUI:
         return 'break'  # Prevents the event from propagating
   
     def load_script(self, script_name):
-        script_file = os.path.join(self.script_manager.scripts_folder, f"{script_name}.py")
         try:
-            with open(script_file, "r") as file:
-                script_code = file.read()
+            entry = self.script_manager.get_script(script_name)
+            if entry is None:
+                self.log_output.insert(tk.END, f"Error: '{script_name}' not found in the script library.\n")
+                self.log_output.see(tk.END)
+                return
+            script_code = entry['code']
 
-            self.log_output.delete("1.0", tk.END)
+            if not self.app.job_engine.busy():  # other jobs may still be writing to the output
+                self.log_output.delete("1.0", tk.END)
             self.log_output.insert(tk.END, script_code)
-            self.log_output.insert(tk.END, f"\nLoaded saved script '{script_name}.py':\n")
+            self.log_output.insert(tk.END, f"\nLoaded saved script '{script_name}':\n")
+            if entry['prompt']:
+                self.log_output.insert(tk.END, f"Prompt: {entry['prompt']}\n")
+            if entry['tags']:
+                self.log_output.insert(tk.END, f"Tags: {', '.join(entry['tags'])}\n")
+            if entry['run_count']:
+                self.log_output.insert(tk.END, f"Runs: {entry['run_count']}, last {entry['last_run_seconds'] or 0:.2f}s, "
+                                               f"average {entry['average_run_seconds']:.2f}s\n")
+            last_runs = self.script_manager.recent_runs(script_name, 1)
+            if last_runs and last_runs[0]['status'] != 'done':
+                self.log_output.insert(tk.END, f"Last run {last_runs[0]['status']}: {last_runs[0]['error']}\n")
+            schedule = self.script_manager.get_schedule(script_name)
+            if schedule:
+                self.log_output.insert(tk.END, f"Schedule: {schedule.spec}, next run "
+                                               f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(schedule.next_run))}\n")
             self.log_output.see(tk.END)
 
             # Ask user if they want to execute the script
             if messagebox.askyesno("Execute Script", "Do you want to execute the loaded script?"):
-                self.execute_script(script_code)
+                self.execute_script(script_code, script_name)
             else:
                 self.log_output.insert(tk.END, "Script loaded but not executed.\n")
 
-        except FileNotFoundError:
-            self.log_output.insert(tk.END, f"Error: '{script_name}.py' not found at '{script_file}'.\n")
         except Exception as e:
-            self.log_output.insert(tk.END, f"An error occurred while loading '{script_name}.py': {e}\n")
+            self.log_output.insert(tk.END, f"An error occurred while loading '{script_name}': {e}\n")
         self.log_output.see(tk.END)
 
-    def execute_script(self, script_code):
-        try:
-            self.log_output.insert(tk.END, "Executing script...\n")
-            exec(script_code)
-            self.log_output.insert(tk.END, "Script execution completed.\n")
-        except Exception as e:
-            self.log_output.insert(tk.END, f"An error occurred during script execution: {e}\n")
+    def execute_script(self, script_code, script_name=None):
+        self.log_output.insert(tk.END, "Executing script...\n")
         self.log_output.see(tk.END)
+
+        def execute_script_thread(job):
+            try:
+                python_executable = self.script_manager.script_environment(script_name, script_code) if script_name else None
+            except (subprocess.CalledProcessError, OSError) as e:
+                self.log_output_proxy.insert(tk.END, f"Failed to prepare the script environment: {e}\n")
+                self.log_output_proxy.see(tk.END)
+                return
+            bytecode = self.script_manager.compiled_script(script_code) if script_name else None
+            start_time = time.time()
+            error = self.app.executor_pool.run(script_code, self.log_script_output, python_executable,
+                                               lambda worker: setattr(job, 'process', worker), bytecode)
+            if script_name:
+                self.script_manager.record_run(script_name, time.time() - start_time, error)
+                if self.script_order_var.get() != "Name":
+                    self.ui_bus.post(self, 'filter_scripts')
+            if error:
+                self.log_output_proxy.insert(tk.END, f"An error occurred during script execution: {error}\n")
+            else:
+                self.log_output_proxy.insert(tk.END, "Script execution completed.\n")
+            self.log_output_proxy.see(tk.END)
+
+        self.app.job_engine.submit(f"Run script: {script_name or 'loaded script'}",
+                                   lambda job: asyncio.to_thread(execute_script_thread, job))
+
+    def log_script_output(self, stream, text):
+        self.log_output_proxy.insert(tk.END, text + "\n")
+        self.log_output_proxy.see(tk.END)
         
     def delete_saved_script(self):
         self.script_manager.delete_saved_script()
         self.populate_saved_scripts()
 
+    def edit_script_tags(self):
+        selected_items = self.saved_scripts_listbox.selection()
+        if not selected_items:
+            messagebox.showerror("Error", "Please select a script to tag.")
+            return
+        script_name = self.saved_scripts_listbox.item(selected_items[0], 'text')
+        entry = self.script_manager.get_script(script_name)
+        if entry is None:
+            return
+        tags = simpledialog.askstring("Edit Tags", f"Tags for '{script_name}' (comma separated):",
+                                      initialvalue=", ".join(entry['tags']))
+        if tags is None:
+            return
+        self.script_manager.set_tags(script_name, [tag.strip() for tag in tags.split(",") if tag.strip()])
+        self.update_status(f"Tags updated for '{script_name}'")
+        self.filter_scripts()
+
+    def open_pipelines(self):
+        window = ttk.Toplevel(self.root)
+        window.title("Pipelines")
+        window.geometry("760x560")
+        self.pipeline_window = window
+        self.pipeline_run = None
+
+        list_frame = ttk.Frame(window, padding="10")
+        list_frame.pack(side=LEFT, fill=Y)
+        self.pipelines_listbox = ttk.Treeview(list_frame, show="tree", selectmode="browse", height=18)
+        self.pipelines_listbox.pack(fill=Y, expand=YES)
+        self.pipelines_listbox.bind("<<TreeviewSelect>>", self.show_pipeline)
+        ttk.Button(list_frame, text="New", command=self.new_pipeline, style='info.TButton').pack(fill=X, pady=(10, 0))
+        ttk.Button(list_frame, text="Delete", command=self.delete_pipeline, style='danger.TButton').pack(fill=X, pady=(5, 0))
+
+        edit_frame = ttk.Frame(window, padding="10")
+        edit_frame.pack(side=LEFT, fill=BOTH, expand=YES)
+        ttk.Label(edit_frame, text="Name:").pack(anchor=W)
+        self.pipeline_name_var = StringVar()
+        ttk.Entry(edit_frame, textvariable=self.pipeline_name_var).pack(fill=X, pady=(0, 5))
+        ttk.Label(edit_frame, text="Steps, one per line: [step =] saved script [<- step, step]").pack(anchor=W)
+        self.pipeline_text = tk.Text(edit_frame, height=10, font=('Consolas', 10))
+        self.pipeline_text.pack(fill=BOTH, expand=YES)
+
+        pipeline_buttons = ttk.Frame(edit_frame)
+        pipeline_buttons.pack(fill=X, pady=5)
+        ttk.Button(pipeline_buttons, text="Save", command=self.save_pipeline, style='info.TButton').pack(side=LEFT, fill=X, expand=YES, padx=(0, 5))
+        ttk.Button(pipeline_buttons, text="Run", command=self.run_pipeline, style='success.TButton').pack(side=LEFT, fill=X, expand=YES, padx=5)
+        ttk.Button(pipeline_buttons, text="Cancel Run", command=self.cancel_pipeline, style='danger.TButton').pack(side=LEFT, fill=X, expand=YES, padx=(5, 0))
+
+        self.pipeline_steps_listbox = ttk.Treeview(edit_frame, columns=("script", "status", "seconds"), show="tree headings", height=8)
+        self.pipeline_steps_listbox.heading("#0", text="Step")
+        self.pipeline_steps_listbox.heading("script", text="Script")
+        self.pipeline_steps_listbox.heading("status", text="Status")
+        self.pipeline_steps_listbox.heading("seconds", text="Seconds")
+        self.pipeline_steps_listbox.column("status", width=80, stretch=False)
+        self.pipeline_steps_listbox.column("seconds", width=70, stretch=False)
+        self.pipeline_steps_listbox.pack(fill=X, pady=(5, 0))
+
+        for pipeline_name in self.script_manager.pipeline_names():
+            self.pipelines_listbox.insert("", END, iid=pipeline_name, text=pipeline_name)
+
+    def show_pipeline(self, event=None):
+        selected = self.pipelines_listbox.selection()
+        if not selected:
+            return
+        definition = self.script_manager.get_pipeline(selected[0])
+        self.pipeline_name_var.set(selected[0])
+        self.pipeline_text.delete("1.0", tk.END)
+        self.pipeline_text.insert(tk.END, definition or "")
+
+    def new_pipeline(self):
+        self.pipelines_listbox.selection_set(())
+        self.pipeline_name_var.set("")
+        self.pipeline_text.delete("1.0", tk.END)
+
+    def save_pipeline(self):
+        pipeline_name = self.pipeline_name_var.get().strip()
+        if not pipeline_name:
+            messagebox.showerror("Error", "Please enter a pipeline name.", parent=self.pipeline_window)
+            return None
+        try:
+            self.script_manager.save_pipeline(pipeline_name, self.pipeline_text.get("1.0", tk.END).strip())
+        except ValueError as e:
+            messagebox.showerror("Invalid Pipeline", str(e), parent=self.pipeline_window)
+            return None
+        if not self.pipelines_listbox.exists(pipeline_name):
+            self.pipelines_listbox.insert("", END, iid=pipeline_name, text=pipeline_name)
+        self.update_status(f"Pipeline '{pipeline_name}' saved")
+        return pipeline_name
+
+    def delete_pipeline(self):
+        selected = self.pipelines_listbox.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a pipeline to delete.", parent=self.pipeline_window)
+            return
+        self.script_manager.delete_pipeline(selected[0])
+        self.pipelines_listbox.delete(selected[0])
+        self.new_pipeline()
+
+    def run_pipeline(self):
+        if self.pipeline_run and not self.pipeline_run.finished_event.is_set():
+            messagebox.showerror("Error", "A pipeline is already running.", parent=self.pipeline_window)
+            return
+        pipeline_name = self.save_pipeline()
+        if not pipeline_name:
+            return
+        run = self.script_manager.run_pipeline(pipeline_name)
+        self.pipeline_run = run
+        self.pipeline_steps_listbox.delete(*self.pipeline_steps_listbox.get_children())
+        for step, (script_name, _) in run.pipeline.steps.items():
+            self.pipeline_steps_listbox.insert("", END, iid=step, text=step, values=(script_name, "pending", ""))
+        # Step updates arrive on the job engine thread
+        run.add_listener(lambda step, status: self.ui_bus.post(self, 'update_pipeline_step', (run, step, status)))
+        run.start()
+        self.update_status(f"Pipeline '{pipeline_name}' started")
+
+    def cancel_pipeline(self):
+        if self.pipeline_run:
+            self.pipeline_run.cancel()
+
+    def update_pipeline_step(self, run, step, status):
+        if step is None:
+            self.log_output.insert(tk.END, run.summary() + "\n")
+            self.log_output.see(tk.END)
+            self.update_status(f"Pipeline '{run.pipeline.name}' {status}")
+            return
+        if status == 'failed':
+            self.log_output.insert(tk.END, f"Pipeline step '{step}' failed: {run.errors.get(step)}\n")
+            self.log_output.see(tk.END)
+        if run is not self.pipeline_run or not self.pipeline_window.winfo_exists():
+            return
+        seconds = run.seconds.get(step)
+        self.pipeline_steps_listbox.item(step, values=(run.pipeline.steps[step][0], status,
+                                                       f"{seconds:.1f}" if seconds is not None else ""))
+
+    def edit_script_schedule(self):
+        selected_items = self.saved_scripts_listbox.selection()
+        if not selected_items:
+            messagebox.showerror("Error", "Please select a script to schedule.")
+            return
+        script_name = self.saved_scripts_listbox.item(selected_items[0], 'text')
+        current = self.script_manager.get_schedule(script_name)
+        spec = simpledialog.askstring("Schedule Script",
+                                      f"Run '{script_name}' every N minutes (e.g. 'every 30s', 'every 2h') or on a cron "
+                                      "expression (e.g. '0 9 * * 1-5'). Leave empty to remove the schedule:",
+                                      initialvalue=current.spec if current else "")
+        if spec is None:
+            return
+        try:
+            schedule = self.script_manager.set_schedule(script_name, spec)
+        except ValueError as e:
+            messagebox.showerror("Invalid Schedule", str(e))
+            return
+        if schedule is None:
+            self.update_status(f"Schedule removed for '{script_name}'")
+        else:
+            self.update_status(f"'{script_name}' scheduled, next run {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(schedule.next_run))}")
+
     def update_status(self, message):
         self.status_bar.config(text=message)
         self.root.update_idletasks()
 
     def populate_saved_scripts(self):
-        self.saved_scripts_listbox.delete(*self.saved_scripts_listbox.get_children())
-        scripts_folder = self.script_manager.scripts_folder
-        for script_file in os.listdir(scripts_folder):
-            if script_file.endswith(".py"):
-                script_name = os.path.splitext(script_file)[0]
-                self.saved_scripts_listbox.insert("", "end", text=script_name)
+        self.filter_after = None
+        wanted = self.script_manager.search_scripts(self.script_search_var.get(),
+                                                    self.script_orders[self.script_order_var.get()])
+
+        # Only touch the rows that changed; rows use the script name as their id
+        wanted_names = set(wanted)
+        current = self.saved_scripts_listbox.get_children()
+        stale = [name for name in current if name not in wanted_names]
+        if stale:
+            self.saved_scripts_listbox.delete(*stale)
+        rows = [name for name in current if name in wanted_names]
+        shown = set(rows)
+        for position, name in enumerate(wanted):
+            if position < len(rows) and rows[position] == name:
+                continue
+            if name in shown:
+                # Ranked results can change order between queries
+                rows.remove(name)
+                self.saved_scripts_listbox.move(name, "", position)
+            else:
+                self.saved_scripts_listbox.insert("", position, iid=name, text=name)
+            rows.insert(position, name)
+
+    def format_routing_stats(self, stats):
+        backends = []
+        for backend in stats['backends']:
+            if backend['p50'] is None:
+                backends.append(f"{backend['name']}: no samples")
+            else:
+                backends.append(f"{backend['name']}: p50 {backend['p50']:.2f}s / p95 {backend['p95']:.2f}s, "
+                                f"{backend['wins']} of {backend['requests']} won")
+        text = "Models - " + " | ".join(backends)
+        if stats['hedges']:
+            text += f" | {stats['hedges']} hedged, {stats['hedge_wins']} won by hedge"
+        if stats['last_route']:
+            text += f" | last: {stats['last_route']}"
+        return text
 
     def update_api_tracker(self):
         current_rpm = self.api_tracker.get_current_rpm()
@@ -998,9 +5000,29 @@ class GUI:
         self.rpm_var.set(current_rpm)
         self.total_requests_var.set(total_requests)
 
-        if current_rpm >= 13:
+        waiting, eta = self.api_tracker.get_queue_status()
+        if waiting:
+            self.queue_status_var.set(f"{waiting} queued, clears in {eta:.0f}s")
+        elif eta > 0:
+            self.queue_status_var.set(f"Quota full, next slot in {eta:.0f}s")
+        else:
+            self.queue_status_var.set("")
+
+        if self.code_generator.response_cache:
+            stats = self.code_generator.response_cache.get_stats()
+            self.cache_stats_var.set(f"{stats['hits']} hits / {stats['misses']} misses / {stats['evictions']} evicted")
+
+        if hasattr(self.code_generator.model, 'get_stats'):
+            self.routing_stats_var.set(self.format_routing_stats(self.code_generator.model.get_stats()))
+
+        stages = self.metrics.get_stage_stats()
+        if stages:
+            self.stage_stats_var.set("Stages p50/p95 - " + " | ".join(
+                f"{stage} {stats['p50']:.2f}/{stats['p95']:.2f}s" for stage, stats in stages.items()))
+
+        if current_rpm >= self.api_tracker.rpm_limit - 2:
             self.rpm_progress.configure(style='danger.Horizontal.TProgressbar')
-        elif current_rpm >= 10:
+        elif current_rpm >= self.api_tracker.rpm_limit - 5:
             self.rpm_progress.configure(style='warning.Horizontal.TProgressbar')
         else:
             self.rpm_progress.configure(style='info.Horizontal.TProgressbar')
@@ -1008,30 +5030,300 @@ class GUI:
         self.root.after(1000, self.update_api_tracker)
 
 
+class ConsoleLog:
+    # Stands in for the output widget when there is no GUI
+    def __init__(self, echo=None):
+        self.parts = []
+        self.length = 0
+        self.marks = {}
+        self.echo = echo
+
+    def index(self, index):
+        if index == "1.0":
+            return 0
+        if index in (tk.END, "end-1c"):
+            return self.length
+        return self.marks.get(index, self.length)
+
+    def insert(self, index, text, *tags):
+        self.parts.append(text)
+        self.length += len(text)
+        if self.echo:
+            self.echo.write(text)
+
+    def delete(self, start, end=None):
+        offset = self.index(start)
+        text = self.getvalue()[:offset]
+        self.parts = [text]
+        self.length = len(text)
+
+    def mark_set(self, name, index):
+        self.marks[name] = self.index(index)
+
+    def mark_unset(self, name):
+        self.marks.pop(name, None)
+
+    def mark_gravity(self, name, gravity):
+        pass
+
+    def see(self, index):
+        pass
+
+    def config(self, **kwargs):
+        pass
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+class ConsoleVariable:
+    def __init__(self, value=0):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class BatchRunner:
+    def __init__(self, settings, mode="Automation", concurrency=None, execute=True, model=None, api_tracker=None,
+                 response_cache=None, metrics=None):
+        self.settings = settings
+        self.mode = mode
+        self.execute = execute
+        if metrics is None:
+            metrics = MetricsRecorder(self.settings.get_setting('metrics_location'),
+                                      export_interval=self.settings.get_setting('metrics_export_interval'))
+            metrics.start()
+        self.metrics = metrics
+        self.api_tracker = api_tracker or APITracker(self.settings.get_setting('rpm_limit'),
+                                                     self.settings.get_setting('api_usage_location'))
+        if model is None:
+            api_handler = APIHandler(self.settings, self.api_tracker)
+            if os.environ.get('API_KEY'):
+                api_handler.api_key = os.environ['API_KEY']
+                api_handler.configure_api()
+            model = api_handler.model
+        self.model = model
+        self.response_cache = response_cache or ResponseCache(
+            self.settings.get_setting('response_cache_location'),
+            self.settings.get_setting('response_cache_max_mb') * 1024 * 1024)
+        self.executor_pool = ScriptExecutorPool(self.settings.get_setting('executor_pool_size'),
+                                                self.settings.get_setting('executor_preload_modules'))
+        self.executor_pool.start()
+        self.job_engine = JobEngine(concurrency or self.settings.get_setting('max_concurrent_jobs'))
+        self.job_engine.start()
+        self.dependency_resolver = DependencyResolver()
+        self.environment_manager = None
+        if self.settings.get_setting('use_script_environments'):
+            self.environment_manager = EnvironmentManager(self.settings.get_setting('environments_location'),
+                                                          self.settings.get_setting('wheelhouse_location'))
+
+    def submit(self, task, log_output):
+        # One handler per task so concurrent tasks don't share an output sink
+        if self.mode == "Q/A":
+            qa_handler = QAHandler(self.model, log_output, ConsoleVariable(), None, self.api_tracker,
+                                   self.job_engine, metrics=self.metrics)
+            return qa_handler.qa_mode(task, None)
+        code_generator = CodeGenerator(self.model, log_output, ConsoleVariable(), self.api_tracker,
+                                       self.response_cache, self.executor_pool, self.dependency_resolver,
+                                       self.environment_manager, self.job_engine, metrics=self.metrics)
+        return code_generator.generate_code(task, None, execute=self.execute)
+
+    def run(self, tasks, output, records=None):
+        finished_jobs = queue.SimpleQueue()
+        self.job_engine.add_listener(
+            lambda job: finished_jobs.put(job) if job.status in ('done', 'failed', 'cancelled') else None)
+
+        submitted = {}
+        for index, task in enumerate(tasks):
+            log_output = ConsoleLog()
+            job = self.submit(task, log_output)
+            submitted[job.job_id] = (index, task, log_output)
+
+        failures = 0
+        for _ in range(len(submitted)):
+            job = finished_jobs.get()
+            index, task, log_output = submitted[job.job_id]
+            record = {'index': index, 'task': task, 'mode': self.mode, 'status': job.status}
+            record.update(job.result or {})
+            if job.error is not None:
+                record['error'] = str(job.error)
+            record['output'] = log_output.getvalue()
+            record['queued_seconds'] = (job.started - job.created) if job.started else None
+            record['spans'] = self.metrics.get_job_spans(job.job_id)
+            if output:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            if records is not None:
+                records.append(record)
+            if job.status != 'done' or record.get('error'):
+                failures += 1
+        return failures
+
+    def shutdown(self):
+        self.job_engine.shutdown()
+        self.executor_pool.shutdown()
+        self.metrics.shutdown()
+
+class ReplayHarness:
+    stages = ['queued', 'first_token', 'generate', 'install', 'execute', 'total']
+
+    def __init__(self, settings, session, mode="Automation", concurrency=None, execute=True, first_token_delay=0.5,
+                 chunk_delay=0.05, chunk_size=40):
+        self.tasks = []
+        responses = {}
+        for task, response in session:
+            self.tasks.append(task)
+            if response is not None:
+                responses[task] = response
+        default_response = "Replayed answer." if mode == "Q/A" else "```python\nprint('replayed')\n```"
+        self.model = FakeGenerativeModel(responses, default_response, first_token_delay, chunk_delay, chunk_size)
+        # A fresh cache and no quota, so every run measures the same work
+        self.cache_folder = tempfile.mkdtemp(prefix="replay_cache_")
+        self.runner = BatchRunner(settings, mode, concurrency, execute, self.model, APITracker(rpm_limit=10 ** 9),
+                                  ResponseCache(self.cache_folder), MetricsRecorder())
+
+    @staticmethod
+    def load_session(session_file):
+        # Takes plain prompts, or JSON lines such as the --batch output with the recorded code or answer
+        session = []
+        for line in session_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = line
+            if not isinstance(record, dict):
+                session.append((line, None))
+                continue
+            response = record.get('response')
+            if response is None and record.get('code'):
+                response = f"```python\n{record['code']}\n```"
+            if response is None:
+                response = record.get('answer')
+            session.append((record.get('task') or record.get('prompt'), response))
+        return session
+
+    def run(self, output=None):
+        records = []
+        started = time.time()
+        failures = self.runner.run(self.tasks, output, records)
+        elapsed = time.time() - started
+
+        stages = {}
+        for stage in self.stages:
+            if stage == 'queued':
+                values = [record['queued_seconds'] for record in records if record.get('queued_seconds') is not None]
+            else:
+                values = [record['timings'][stage] for record in records if stage in record.get('timings', {})]
+            if values:
+                stages[stage] = {'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95),
+                                 'p99': percentile(values, 0.99), 'max': max(values)}
+        return {
+            'requests': len(records),
+            'failures': failures,
+            'seconds': elapsed,
+            'requests_per_second': len(records) / elapsed if elapsed else None,
+            'stages': stages,
+            'spans': self.runner.metrics.get_stage_stats(),
+            'peak_memory_mb': self.peak_memory(),
+        }
+
+    def peak_memory(self):
+        if resource is None:
+            return None
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale}
+
+    @staticmethod
+    def format_report(report):
+        lines = [f"{report['requests']} requests in {report['seconds']:.2f}s "
+                 f"({report['requests_per_second'] or 0:.2f} req/s), {report['failures']} failed"]
+        lines.append(f"{'stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for stage, stats in report['stages'].items():
+            lines.append(f"{stage:<12}" + "".join(f"{stats[key]:>9.3f}s" for key in ('p50', 'p95', 'p99', 'max')))
+        lines.append(f"{'span':<12}{'p50':>10}{'p95':>10}{'count':>10}")
+        for stage, stats in report['spans'].items():
+            lines.append(f"{stage:<12}{stats['p50']:>9.3f}s{stats['p95']:>9.3f}s{stats['count']:>10}")
+        memory = report['peak_memory_mb']
+        if memory:
+            lines.append(f"peak memory: {memory['self']:.1f} MB (largest child process {memory['children']:.1f} MB)")
+        return "\n".join(lines)
+
+    def shutdown(self):
+        self.runner.shutdown()
+        shutil.rmtree(self.cache_folder, ignore_errors=True)
+
 class App:
     def __init__(self):
         self.current_version = "1.0.0"  # Set your current version here
         self.root = ttk.Window(themename="cosmo")
-        self.settings = Settings()
-        self.api_handler = APIHandler(self.settings)
-        self.api_tracker = APITracker()
+        self.settings = Settings.instance()
+        self.settings.start_watching()
+        self.api_tracker = APITracker(self.settings.get_setting('rpm_limit'),
+                                      self.settings.get_setting('api_usage_location'))
+        self.settings.subscribe('rpm_limit', lambda key, value: setattr(self.api_tracker, 'rpm_limit', value))
+        self.api_handler = APIHandler(self.settings, self.api_tracker)
         self.settings.update_shortcuts()
-        self.code_generator = CodeGenerator(self.api_handler.model, None, None, self.api_tracker)
-        self.qa_handler = QAHandler(self.api_handler.model, None, None, None, self.api_tracker)
-        self.script_manager = ScriptManager(None, None, self.settings)
+        self.metrics = MetricsRecorder(self.settings.get_setting('metrics_location'),
+                                       export_interval=self.settings.get_setting('metrics_export_interval'))
+        self.metrics.start()
+        self.response_cache = ResponseCache(self.settings.get_setting('response_cache_location'),
+                                            self.settings.get_setting('response_cache_max_mb') * 1024 * 1024)
+        self.executor_pool = ScriptExecutorPool(self.settings.get_setting('executor_pool_size'),
+                                                self.settings.get_setting('executor_preload_modules'))
+        self.executor_pool.start()
+        self.job_engine = JobEngine(self.settings.get_setting('max_concurrent_jobs'))
+        self.job_engine.start()
+        self.dependency_resolver = DependencyResolver()
+        self.environment_manager = None
+        if self.settings.get_setting('use_script_environments'):
+            self.environment_manager = EnvironmentManager(self.settings.get_setting('environments_location'),
+                                                          self.settings.get_setting('wheelhouse_location'))
+        self.session_manager = ChatSessionManager(self.api_handler.model, self.settings.get_setting('history_token_budget'),
+                                                  self.settings.get_setting('max_chat_sessions'))
+        self.attachments = AttachmentProcessor(self.settings.get_setting('attachment_cache_location'),
+                                               self.settings.get_setting('attachment_max_image_side'),
+                                               text_byte_budget=self.settings.get_setting('attachment_text_budget_kb') * 1024,
+                                               upload=self.settings.get_setting('upload_attachments'))
+        self.code_generator = CodeGenerator(self.api_handler.model, None, None, self.api_tracker, self.response_cache,
+                                            self.executor_pool, self.dependency_resolver, self.environment_manager,
+                                            self.job_engine, self.session_manager, self.metrics, self.attachments)
+        self.qa_handler = QAHandler(self.api_handler.model, None, None, None, self.api_tracker, self.job_engine,
+                                    self.session_manager, self.metrics, self.attachments,
+                                    self.settings.get_setting('map_reduce_chunk_kb') * 1024,
+                                    self.settings.get_setting('map_reduce_concurrency'))
+        self.bytecode_cache = BytecodeCache(self.settings.get_setting('bytecode_cache_location'))
+        self.script_manager = ScriptManager(None, None, self.settings, self.executor_pool, self.dependency_resolver,
+                                            self.environment_manager, self.job_engine,
+                                            bytecode_cache=self.bytecode_cache)
+        self.script_manager.start_indexing()
+        self.script_manager.preload_hot_scripts(self.settings.get_setting('preload_hot_scripts'))
         
         self.update_handler = UpdateHandler(self.current_version, "YourGitHubUsername", "TaskAutomate")
         
         self.gui = GUI(self.root, self.api_handler, self.code_generator, self.qa_handler, self.script_manager, self.update_handler, self)
         
         # Set the missing attributes
-        self.code_generator.log_output = self.gui.log_output
-        self.code_generator.progress_var = self.gui.progress_var
-        self.qa_handler.log_output = self.gui.log_output
-        self.qa_handler.progress_var = self.gui.progress_var
-        self.qa_handler.copy_button = self.gui.copy_button
-        self.script_manager.log_output = self.gui.log_output
-        self.script_manager.saved_scripts_listbox = self.gui.saved_scripts_listbox
+        # Handlers write from worker threads, so they get proxies that route through the UI update bus
+        bus = self.gui.ui_bus
+        self.code_generator.log_output = self.gui.log_output_proxy
+        self.code_generator.progress_var = bus.proxy(self.gui.progress_var)
+        self.code_generator.ttft_var = bus.proxy(self.gui.ttft_var)
+        self.qa_handler.log_output = self.gui.log_output_proxy
+        self.qa_handler.progress_var = self.code_generator.progress_var
+        self.qa_handler.ttft_var = self.code_generator.ttft_var
+        self.qa_handler.copy_button = bus.proxy(self.gui.copy_button)
+        self.script_manager.log_output = self.gui.log_output_proxy
+        self.script_manager.saved_scripts_listbox = bus.proxy(self.gui.saved_scripts_listbox)
+
+        # Started once the handlers log to the GUI, since missed runs may be caught up straight away
+        self.script_manager.scheduler.start()
 
         self.popup_search_bar = PopupSearchBar(self)
         self.setup_global_hotkey()
@@ -1050,10 +5342,75 @@ class App:
 
     def on_closing(self):
         self.listener.stop()
+        self.job_engine.shutdown()
+        self.executor_pool.shutdown()
+        self.metrics.shutdown()
+        self.script_manager.scheduler.stop()
+        self.script_manager.script_index.stop()
+        self.script_manager.library.close()
+        self.settings.stop_watching()
+        self.settings.flush()
         self.root.destroy()
 
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Task Automate")
+    parser.add_argument('--batch', metavar='TASKS_FILE',
+                        help="run the tasks in TASKS_FILE (one per line, '-' for stdin) without the GUI")
+    parser.add_argument('--replay', metavar='SESSION_FILE',
+                        help="replay the prompts in SESSION_FILE against a fake model and report throughput")
+    parser.add_argument('--output', help="file to append JSONL results to (default: stdout for --batch)")
+    parser.add_argument('--mode', choices=['automation', 'qa'], default='automation')
+    parser.add_argument('--concurrency', type=int, help="maximum number of tasks processed at once")
+    parser.add_argument('--no-execute', action='store_true', help="generate code and install dependencies only")
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="fake model delay before the first chunk")
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help="fake model delay between chunks")
+    parser.add_argument('--chunk-size', type=int, default=40, help="characters per fake model chunk")
+    parser.add_argument('--import-scripts', metavar='FOLDER', help="import the .py scripts in FOLDER into the script library")
+    parser.add_argument('--export-scripts', metavar='FOLDER', help="export the script library to FOLDER")
+    args = parser.parse_args()
+    mode = "Q/A" if args.mode == 'qa' else "Automation"
+
+    if args.import_scripts or args.export_scripts:
+        library = ScriptLibrary(Settings.instance().get_setting('script_library_location'))
+        if args.import_scripts:
+            print(f"Imported {library.import_folder(args.import_scripts)} scripts from {args.import_scripts}")
+        if args.export_scripts:
+            print(f"Exported {library.export_folder(args.export_scripts)} scripts to {args.export_scripts}")
+        library.close()
+        sys.exit(0)
+
+    if args.replay:
+        with open(args.replay, 'r', encoding='utf-8') as session_file:
+            session = ReplayHarness.load_session(session_file)
+        output = open(args.output, 'a', encoding='utf-8') if args.output else None
+        report_output = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+        os.dup2(2, 1)  # Keep script output out of the report
+        harness = ReplayHarness(Settings.instance(), session, mode, args.concurrency, not args.no_execute,
+                                args.first_token_delay, args.chunk_delay, args.chunk_size)
+        report = harness.run(output)
+        harness.shutdown()
+        if output:
+            output.close()
+        report_output.write(ReplayHarness.format_report(report) + "\n")
+        report_output.close()
+        sys.exit(1 if report['failures'] else 0)
+
+    if args.batch:
+        tasks_file = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        tasks = [line.strip() for line in tasks_file if line.strip() and not line.lstrip().startswith('#')]
+        if args.output in (None, '-'):
+            # Keep pip and script output off the JSONL stream
+            output = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+            os.dup2(2, 1)
+        else:
+            output = open(args.output, 'a', encoding='utf-8')
+        runner = BatchRunner(Settings.instance(), mode, args.concurrency, not args.no_execute)
+        failures = runner.run(tasks, output)
+        runner.shutdown()
+        output.close()
+        sys.exit(1 if failures else 0)
+
     app = App()
     app.root.protocol("WM_DELETE_WINDOW", app.on_closing)
     app.run()
\ No newline at end of file
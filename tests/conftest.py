@@ -0,0 +1,50 @@
+import importlib.util
+import os
+import sys
+import types
+
+
+class StubModule(types.ModuleType):
+    # Every attribute is another stub, so the GUI code can reference widgets and constants at import time
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        stub = StubModule(f"{self.__name__}.{name}")
+        setattr(self, name, stub)
+        return stub
+
+    def __call__(self, *args, **kwargs):
+        return StubModule(f"{self.__name__}()")
+
+
+def stub_module(name):
+    module = StubModule(name)
+    module.__all__ = []
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent in sys.modules:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+# The Tk theme and Gemini client are always stubbed so tests never open a window or reach the API
+for name in ('ttkbootstrap', 'ttkbootstrap.constants', 'google.generativeai', 'pyperclip'):
+    if name == 'google.generativeai':
+        try:
+            import google
+        except ImportError:
+            stub_module('google')
+    stub_module(name)
+
+# Needed only by features the tests don't exercise
+for name in ('PIL', 'PIL.Image', 'requests'):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        stub_module(name)
+
+spec = importlib.util.spec_from_file_location(
+    'task_automate', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Task-Automate.py'))
+task_automate = importlib.util.module_from_spec(spec)
+sys.modules['task_automate'] = task_automate
+spec.loader.exec_module(task_automate)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+
+import task_automate as ta
+
+
+def test_slots_beyond_the_limit_wait_for_the_window():
+    tracker = ta.APITracker(rpm_limit=2)
+    now = time.time()
+    first, second, third = tracker.reserve(), tracker.reserve(), tracker.reserve()
+    assert first - now < 0.1 and second - now < 0.1
+    assert 59 < third - now <= 60.1
+    assert tracker.get_queue_status()[0] == 1
+    assert not tracker.try_reserve()
+
+
+def test_cancelled_wait_releases_its_slot():
+    tracker = ta.APITracker(rpm_limit=1)
+    waits = []
+
+    async def main():
+        await tracker.acquire_async()
+        waiting = asyncio.ensure_future(tracker.acquire_async(waits.append))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+    assert len(waits) == 1 and waits[0] > 59
+    assert len(tracker.requests) == 1
+    assert tracker.total_requests == 1
+
+
+def test_release_of_an_unknown_slot_is_ignored():
+    tracker = ta.APITracker()
+    slot = tracker.reserve()
+    tracker.release(slot)
+    tracker.release(slot)
+    assert tracker.total_requests == 0
+
+
+def test_usage_is_saved_debounced_and_restored(tmp_path):
+    usage_file = str(tmp_path / "usage.json")
+    tracker = ta.APITracker(rpm_limit=5, usage_file=usage_file, save_delay=0.1)
+    for _ in range(3):
+        tracker.reserve()
+    assert not (tmp_path / "usage.json").exists()
+    time.sleep(0.3)
+    with open(usage_file) as f:
+        assert json.load(f)['total_requests'] == 3
+
+    tracker.reserve()
+    tracker.flush()
+    restored = ta.APITracker(rpm_limit=5, usage_file=usage_file)
+    assert restored.total_requests == 4
+    assert restored.get_current_rpm() == 4
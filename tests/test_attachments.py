@@ -0,0 +1,96 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    calls = []
+
+    def upload_file(path, mime_type=None):
+        calls.append(path)
+        return SimpleNamespace(name=f"files/{len(calls)}", uri=f"https://files.example/{len(calls)}")
+
+    monkeypatch.setattr(ta.genai, 'upload_file', upload_file, raising=False)
+    return calls
+
+
+def write_binary(path, data):
+    with open(path, 'wb') as f:
+        f.write(b"\0" + data)  # a NUL byte keeps it from being sent as text
+    return str(path)
+
+
+def test_the_same_file_is_uploaded_once(tmp_path, uploads):
+    processor = ta.AttachmentProcessor(cache_folder=str(tmp_path / "cache"), upload=True)
+    path = write_binary(tmp_path / "data.bin", b"payload")
+
+    first = processor.prepare(path)
+    assert processor.prepare(path) == first
+    assert first == {'file_data': {'mime_type': 'application/octet-stream', 'file_uri': "https://files.example/1"}}
+    assert len(uploads) == 1
+
+
+def test_a_copy_with_the_same_contents_reuses_the_upload(tmp_path, uploads):
+    processor = ta.AttachmentProcessor(cache_folder=str(tmp_path / "cache"), upload=True)
+    processor.prepare(write_binary(tmp_path / "a.bin", b"payload"))
+    processor.prepare(write_binary(tmp_path / "b.bin", b"payload"))
+    assert len(uploads) == 1
+
+
+def test_a_modified_file_is_uploaded_again(tmp_path, uploads):
+    processor = ta.AttachmentProcessor(cache_folder=str(tmp_path / "cache"), upload=True)
+    path = write_binary(tmp_path / "data.bin", b"payload")
+    first = processor.prepare(path)
+
+    write_binary(tmp_path / "data.bin", b"payload, edited")
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+    second = processor.prepare(path)
+
+    assert len(uploads) == 2
+    assert second['file_data']['file_uri'] != first['file_data']['file_uri']
+
+
+def test_an_expired_upload_is_uploaded_again(tmp_path, uploads):
+    processor = ta.AttachmentProcessor(cache_folder=str(tmp_path / "cache"), upload=True)
+    path = write_binary(tmp_path / "data.bin", b"payload")
+    processor.prepare(path)
+
+    for upload in processor.uploads.values():
+        upload['uploaded'] -= processor.upload_ttl + 1
+    processor.prepare(path)
+    assert len(uploads) == 2
+
+    processor.prepare(path)
+    assert len(uploads) == 2
+
+
+def test_uploads_are_reused_after_a_restart_until_they_expire(tmp_path, uploads):
+    cache = str(tmp_path / "cache")
+    path = write_binary(tmp_path / "data.bin", b"payload")
+    ta.AttachmentProcessor(cache_folder=cache, upload=True).prepare(path)
+
+    ta.AttachmentProcessor(cache_folder=cache, upload=True).prepare(path)
+    assert len(uploads) == 1
+
+    restarted = ta.AttachmentProcessor(cache_folder=cache, upload=True)
+    for upload in restarted.uploads.values():
+        upload['uploaded'] -= restarted.upload_ttl + 1
+    with restarted.lock:
+        restarted.save_uploads()
+    ta.AttachmentProcessor(cache_folder=cache, upload=True).prepare(path)
+    assert len(uploads) == 2
+
+
+def test_a_failed_upload_falls_back_to_inline_data(tmp_path, monkeypatch):
+    def upload_file(path, mime_type=None):
+        raise PermissionError("no File API access")
+
+    monkeypatch.setattr(ta.genai, 'upload_file', upload_file, raising=False)
+    processor = ta.AttachmentProcessor(cache_folder=str(tmp_path / "cache"), upload=True)
+    part = processor.prepare(write_binary(tmp_path / "data.bin", b"payload"))
+    assert part == {'mime_type': 'application/octet-stream', 'data': b"\0payload"}
+    assert processor.uploads == {}
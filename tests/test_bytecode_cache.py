@@ -0,0 +1,71 @@
+import marshal
+import os
+
+import task_automate as ta
+
+
+def run(data):
+    namespace = {}
+    exec(marshal.loads(data), namespace)
+    return namespace['result']
+
+
+def test_repeat_runs_reuse_the_compiled_code(tmp_path):
+    cache = ta.BytecodeCache(str(tmp_path))
+    code = "result = 6 * 7\n"
+    assert run(cache.get(code)) == 42
+    assert run(cache.get(code)) == 42
+    assert (cache.compiles, cache.hits) == (1, 1)
+
+    reopened = ta.BytecodeCache(str(tmp_path))
+    assert run(reopened.get(code)) == 42
+    assert (reopened.compiles, reopened.hits) == (0, 1)
+
+
+def test_a_source_edit_compiles_the_new_code(tmp_path):
+    cache = ta.BytecodeCache(str(tmp_path))
+    assert run(cache.get("result = 1\n")) == 1
+    assert run(cache.get("result = 2\n")) == 2
+    assert cache.compiles == 2
+
+    reopened = ta.BytecodeCache(str(tmp_path))
+    assert run(reopened.get("result = 3\n")) == 3
+    assert reopened.compiles == 1
+
+
+def test_a_different_python_version_does_not_reuse_the_cache(tmp_path, monkeypatch):
+    code = "result = 'cached'\n"
+    ta.BytecodeCache(str(tmp_path)).get(code)
+
+    monkeypatch.setattr(ta.importlib.util, 'MAGIC_NUMBER', b"\x00\x00\r\n")
+    other_magic = ta.BytecodeCache(str(tmp_path))
+    assert run(other_magic.get(code)) == 'cached'
+    assert other_magic.compiles == 1
+
+    monkeypatch.setattr(ta.sys.implementation, 'cache_tag', "otherpython-99")
+    other_interpreter = ta.BytecodeCache(str(tmp_path))
+    other_interpreter.get(code)
+    assert other_interpreter.compiles == 1
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_a_corrupt_cache_file_falls_back_to_compiling(tmp_path):
+    code = "result = 'fresh'\n"
+    cache = ta.BytecodeCache(str(tmp_path))
+    path = cache.entry_path(cache.make_key(code))
+
+    for corrupt in (b"", b"\xff\x00garbage", marshal.dumps("not code"), marshal.dumps(compile(code, "x", "exec"))[:10]):
+        with open(path, 'wb') as f:
+            f.write(corrupt)
+        reopened = ta.BytecodeCache(str(tmp_path))
+        assert run(reopened.get(code)) == 'fresh'
+        assert reopened.compiles == 1
+
+    with open(path, 'rb') as f:
+        assert run(f.read()) == 'fresh'  # the corrupt entry was replaced
+
+
+def test_code_that_does_not_compile_returns_none(tmp_path):
+    cache = ta.BytecodeCache(str(tmp_path))
+    assert cache.get("def broken(:\n") is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,91 @@
+import asyncio
+
+import task_automate as ta
+
+
+def fake_model():
+    return ta.FakeGenerativeModel(responses={f"request {i}": f"reply {i}" for i in range(10)},
+                                  default_response="reply", first_token_delay=0, chunk_delay=0)
+
+
+def send(session, prompt):
+    async def go():
+        response = await session.chat.send_message_async(prompt)
+        return response.text
+    return asyncio.run(go())
+
+
+def texts(manager, session):
+    return [(content.role, manager.content_text(content)) for content in session.chat.history]
+
+
+def test_get_reuses_the_session_for_a_conversation_and_evicts_the_least_recent():
+    manager = ta.ChatSessionManager(fake_model(), max_sessions=2)
+    first = manager.get(1)
+    assert manager.get(1) is first
+
+    manager.get(2)
+    manager.get(1)  # 2 is now least recently used
+    manager.get(3)
+    assert list(manager.sessions) == [1, 3]
+    assert manager.get(1) is first
+
+
+def test_follow_up_sees_the_previous_exchange():
+    manager = ta.ChatSessionManager(fake_model())
+    session = manager.get(manager.new_conversation())
+    assert send(session, "request 0") == "reply 0"
+    assert send(manager.get(session.conversation_id), "request 1") == "reply 1"
+    assert texts(manager, session) == [('user', "request 0"), ('model', "reply 0"),
+                                       ('user', "request 1"), ('model', "reply 1")]
+
+
+def test_record_appends_the_exchange_for_cached_replies():
+    manager = ta.ChatSessionManager(fake_model())
+    session = manager.get(1)
+    manager.record(session, "request 0", "cached reply")
+    assert texts(manager, session) == [('user', "request 0"), ('model', "cached reply")]
+
+
+def test_trim_keeps_the_first_exchange_and_drops_the_oldest_follow_ups():
+    # Each request/reply pair is 3 tokens, so a budget of 9 fits three pairs
+    manager = ta.ChatSessionManager(fake_model(), history_token_budget=9)
+    session = manager.get(1)
+    for i in range(6):
+        send(session, f"request {i}")
+    manager.trim(session)
+
+    history = texts(manager, session)
+    assert history[:2] == [('user', "request 0"), ('model', "reply 0")]
+    assert history[2][1].startswith("Summary of earlier requests")
+    assert "- request 1" in history[2][1] and "- request 0" not in history[2][1]
+    assert history[3] == ('model', "Noted.")
+    assert history[-2:] == [('user', "request 5"), ('model', "reply 5")]
+    assert ('user', "request 1") not in history
+    kept = session.chat.history[:2] + session.chat.history[4:]
+    assert manager.estimate_tokens(kept) <= 9
+
+
+def test_repeated_trims_keep_one_summary_of_everything_dropped():
+    manager = ta.ChatSessionManager(fake_model(), history_token_budget=9)
+    session = manager.get(1)
+    for i in range(10):
+        send(session, f"request {i}")
+        manager.trim(session)
+
+    history = texts(manager, session)
+    assert history[:2] == [('user', "request 0"), ('model', "reply 0")]
+    summaries = [text for role, text in history if text.startswith("Summary of earlier requests")]
+    assert len(summaries) == 1
+    dropped = [f"request {i}" for i in range(1, 10) if ('user', f"request {i}") not in history]
+    assert dropped and all(f"- {request}" in summaries[0] for request in dropped)
+    assert history[-2:] == [('user', "request 9"), ('model', "reply 9")]
+
+
+def test_trim_leaves_a_history_within_budget_alone():
+    manager = ta.ChatSessionManager(fake_model())
+    session = manager.get(1)
+    send(session, "request 0")
+    before = texts(manager, session)
+    manager.trim(session)
+    assert texts(manager, session) == before
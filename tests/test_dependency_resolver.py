@@ -0,0 +1,55 @@
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def resolver():
+    return ta.DependencyResolver()
+
+
+def test_stdlib_modules_are_filtered(resolver):
+    code = "import os, sys\nimport json\nfrom collections import OrderedDict\nfrom __future__ import annotations\nimport requests"
+    assert resolver.third_party_distributions(code) == ['requests']
+
+
+def test_submodules_resolve_to_their_top_level_package(resolver):
+    code = "import xml.etree.ElementTree\nfrom google.cloud import storage\nimport matplotlib.pyplot as plt"
+    assert resolver.find_imports(code) == ['xml', 'google', 'matplotlib']
+
+
+def test_relative_imports_are_ignored(resolver):
+    assert resolver.find_imports("from . import helpers\nfrom .models import User\nfrom ..utils import x") == []
+
+
+def test_import_names_map_to_pip_names(resolver):
+    code = "import cv2\nfrom PIL import Image\nimport yaml\nfrom bs4 import BeautifulSoup\nimport win32gui, win32con"
+    assert resolver.third_party_distributions(code) == ['Pillow', 'PyYAML', 'beautifulsoup4', 'opencv-python',
+                                                        'pywin32']
+
+
+def test_dynamic_imports_are_found(resolver):
+    code = "import importlib\nnp = __import__('numpy')\npd = importlib.import_module('pandas.io')\nname = 'x'\n__import__(name)"
+    assert resolver.find_imports(code) == ['importlib', 'numpy', 'pandas']
+
+
+def test_try_import_fallbacks_only_require_the_fallback(resolver):
+    code = ("try:\n    import ujson as json\nexcept ImportError:\n    import json\n"
+            "try:\n    from lxml import etree\nexcept (ImportError, AttributeError):\n    import xml.etree.ElementTree as etree\n")
+    assert resolver.third_party_distributions(code) == []
+
+
+def test_guarded_import_without_fallback_is_still_required(resolver):
+    code = "try:\n    import requests\nexcept ImportError:\n    print('pip install requests')\n    raise SystemExit(1)"
+    assert resolver.third_party_distributions(code) == ['requests']
+
+
+def test_unparseable_code_falls_back_to_line_scanning(resolver):
+    code = "import pyautogui, requests as r  # comment\nfrom selenium.webdriver import Chrome\ndef broken(:\n"
+    assert resolver.find_imports(code) == ['pyautogui', 'requests', 'selenium']
+
+
+def test_find_missing_uses_installed_check(resolver):
+    resolver.spec_cache.update({'requests': True, 'notinstalled': False, 'cv2': False})
+    assert resolver.find_missing("import os\nimport requests\nimport notinstalled\nimport cv2") == {
+        'notinstalled': 'notinstalled', 'cv2': 'opencv-python'}
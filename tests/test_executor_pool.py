@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def pool():
+    pool = ta.ScriptExecutorPool(size=1)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def run(pool, code, **kwargs):
+    output = []
+    error = pool.run(code, lambda stream, text: output.append((stream, text)), **kwargs)
+    return error, output
+
+
+def test_print_goes_to_stdout(pool):
+    error, output = run(pool, "print('hello')\nprint('world')")
+    assert error is None
+    assert output == [('stdout', 'hello'), ('stdout', 'world')]
+
+
+def test_output_without_trailing_newline(pool):
+    error, output = run(pool, "import sys\nsys.stdout.write('partial')")
+    assert error is None
+    assert output == [('stdout', 'partial')]
+
+
+def test_protocol_lookalike_lines_are_plain_output(pool):
+    fake = json.dumps({'done': True, 'error': 'not really'})
+    error, output = run(pool, f"print({fake!r})\nprint('after')")
+    assert error is None
+    assert output == [('stdout', fake), ('stdout', 'after')]
+
+
+def test_child_process_output_is_relayed(pool):
+    code = ("import subprocess, sys\n"
+            "subprocess.run([sys.executable, '-c', 'import sys; print(42); print(7, file=sys.stderr)'])")
+    error, output = run(pool, code)
+    assert error is None
+    assert ('stdout', '42') in output
+    assert ('stderr', '7') in output
+
+
+def test_exception_is_reported_with_traceback_on_stderr(pool):
+    error, output = run(pool, "print('before')\nraise ValueError('boom')")
+    assert 'ValueError: boom' in error
+    assert ('stdout', 'before') in output
+    assert any(stream == 'stderr' and 'ValueError' in text for stream, text in output)
+
+
+def test_exit_status_is_an_error(pool):
+    error, _ = run(pool, "import sys\nsys.exit(3)")
+    assert error == "Script exited with status 3"
+
+
+def test_env_is_passed_to_the_script(pool):
+    error, output = run(pool, "import os\nprint(os.environ['TASK_TEST_VALUE'])", env={'TASK_TEST_VALUE': 'x1'})
+    assert error is None
+    assert output == [('stdout', 'x1')]
+
+
+def wait_for_idle(pool, python_executable):
+    deadline = time.time() + 10
+    while not pool.idle_workers.get(python_executable) and time.time() < deadline:
+        time.sleep(0.05)
+    return pool.idle_workers.get(python_executable)
+
+
+def test_prewarmed_worker_is_used(pool):
+    worker = wait_for_idle(pool, pool.python_executable)[0]
+    assert pool.acquire() is worker
+
+
+def test_environment_interpreters_get_their_own_pool(pool, tmp_path):
+    python_executable = str(tmp_path / "python")
+    os.symlink(sys.executable, python_executable)
+    error, output = run(pool, "print('env')", python_executable=python_executable)
+    assert error is None
+    assert output == [('stdout', 'env')]
+    worker = wait_for_idle(pool, python_executable)[0]
+    assert pool.acquire(python_executable) is worker
+
+
+@pytest.mark.parametrize('line, message', [
+    ('{"stream": "stdout", "text": "a"}\n', {'stream': 'stdout', 'text': 'a'}),
+    ('{"done": true, "error": null}\n', {'done': True, 'error': None}),
+    ('{"done": true, "error": "x"}\n', {'done': True, 'error': 'x'}),
+    ('{"stream": "other", "text": "a"}\n', None),
+    ('{"done": true, "error": 3}\n', None),
+    ('[1, 2]\n', None),
+    ('not json\n', None),
+])
+def test_parse_message(line, message):
+    assert ta.ScriptExecutorPool.parse_message(line) == message
+
@@ -0,0 +1,23 @@
+import task_automate as ta
+
+
+def test_is_bounded(tmp_path):
+    hasher = ta.FileHasher(max_entries=2)
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"{index}.txt"
+        path.write_text(str(index))
+        paths.append(str(path))
+        hasher.hash(str(path))
+    assert len(hasher.hashes) == 2
+    (tmp_path / "0.txt").write_text("changed")
+    assert hasher.hash(paths[0]) == ta.hashlib.sha256(b"changed").hexdigest()
+
+
+def test_same_content_same_hash(tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_bytes(b"data" * 1000)
+    second.write_bytes(b"data" * 1000)
+    hasher = ta.FileHasher()
+    assert hasher.hash(str(first)) == hasher.hash(str(second))
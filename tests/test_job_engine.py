@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def job_engine():
+    job_engine = ta.JobEngine(2, max_history=10)
+    job_engine.start()
+    yield job_engine
+    job_engine.shutdown()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_finished_jobs_are_kept_only_in_a_capped_history(job_engine):
+    jobs = [job_engine.submit(f"job {number}", lambda job: asyncio.sleep(0)) for number in range(100)]
+    assert wait_for(lambda: all(job.status == 'done' for job in jobs))
+    assert wait_for(lambda: not job_engine.jobs)
+    assert list(job_engine.history) == [job.job_id for job in jobs[-10:]]
+    assert job_engine.known_job_ids() == {job.job_id for job in jobs[-10:]}
+    assert jobs[-1].coroutine_factory is None
+
+
+def test_busy_ignores_the_calling_job(job_engine):
+    job = job_engine.submit("sleep", lambda job: asyncio.sleep(0.3))
+    assert wait_for(lambda: job.status == 'running')
+    assert job_engine.busy()
+    assert not job_engine.busy(job)
+    assert wait_for(lambda: not job_engine.busy())
+
+
+def test_priority_order_and_cancel_of_queued_jobs(job_engine):
+    order = []
+
+    async def record(name):
+        order.append(name)
+        await asyncio.sleep(0.1)
+
+    blockers = [job_engine.submit(f"blocker {number}", lambda job: asyncio.sleep(0.2)) for number in range(2)]
+    low = job_engine.submit("low", lambda job: record("low"), ta.JobEngine.LOW_PRIORITY)
+    cancelled = job_engine.submit("cancelled", lambda job: record("cancelled"))
+    high = job_engine.submit("high", lambda job: record("high"), ta.JobEngine.HIGH_PRIORITY)
+    assert job_engine.cancel(cancelled.job_id)
+    assert wait_for(lambda: low.status == 'done' and high.status == 'done')
+    assert order == ["high", "low"]
+    assert cancelled.status == 'cancelled'
+    assert cancelled.job_id in job_engine.history
+    assert not job_engine.cancel(cancelled.job_id)
+    assert all(job.status == 'done' for job in blockers)
+
+
+def test_failed_jobs_keep_their_error(job_engine):
+    async def fail(job):
+        raise RuntimeError("boom")
+
+    job = job_engine.submit("fail", fail)
+    assert wait_for(lambda: job.status == 'failed')
+    assert str(job.error) == "boom"
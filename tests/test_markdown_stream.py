@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+import task_automate as ta
+
+
+class RecordingText:
+    # Keeps (character, tags) pairs, so renders can be compared however the inserts were split
+    def __init__(self):
+        self.characters = []
+
+    def insert(self, index, text, tags=()):
+        self.characters.extend((character, tuple(tags)) for character in text)
+
+    def text(self):
+        return "".join(character for character, _ in self.characters)
+
+
+def render(chunks):
+    output = RecordingText()
+    stream = ta.MarkdownStream(output)
+    for chunk in chunks:
+        stream.feed(chunk)
+    stream.flush()
+    return output
+
+
+def random_chunks(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+SAMPLES = {
+    'headers': "# Title\n## Section\n### Detail\nplain text\n",
+    'lists': "- first\n* second\n  + nested\n1. numbered\n> quoted line\n---\n",
+    'fenced code': "Run this:\n```python\nx = 2 * 3\nprint(`x`)\n```\nafter the block\n",
+    'bold and italic': "some **bold** and *italic* and **both *kinds***\n",
+    'inline code': "use `pip install` then `run`\n",
+    'lone asterisk': "2 * 3 = 6\nand a*b*c\n",
+    'unfinished': "ends with a lone *",
+}
+
+
+@pytest.mark.parametrize('name', sorted(SAMPLES))
+def test_chunking_does_not_change_the_output(name):
+    text = SAMPLES[name]
+    whole = render([text]).characters
+    assert render(list(text)).characters == whole
+    rng = random.Random(name)
+    for _ in range(50):
+        assert render(random_chunks(text, rng)).characters == whole
+
+
+def tagged(output, tag):
+    return "".join(character for character, tags in output.characters if tag in tags)
+
+
+def test_markers_become_tags():
+    output = render([SAMPLES['headers'] + SAMPLES['bold and italic']])
+    assert tagged(output, 'md_h1') == "Title"
+    assert tagged(output, 'md_h2') == "Section"
+    assert tagged(output, 'md_bold') == "boldboth kinds"
+    assert tagged(output, 'md_italic') == "italickinds"
+    assert "#" not in output.text() and "**" not in output.text()
+
+
+def test_code_block_is_verbatim():
+    output = render([SAMPLES['fenced code']])
+    assert tagged(output, 'md_code_block') == "x = 2 * 3\nprint(`x`)\n"
+    assert "python" not in output.text()
+
+
+def test_lists_and_rules():
+    output = render([SAMPLES['lists']])
+    assert "• first" in output.text()
+    assert "  • nested" in output.text()
+    assert tagged(output, 'md_quote') == "quoted line"
+    assert tagged(output, 'md_rule') == "─" * 40
+
+
+def test_lone_asterisk_is_kept():
+    output = render([SAMPLES['lone asterisk']])
+    assert output.text().startswith("2 * 3 = 6\n")
+    assert render([SAMPLES['unfinished']]).text() == "ends with a lone *"
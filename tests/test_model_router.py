@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import task_automate as ta
+
+
+def backend(name, first_token_delay, response="print(1)"):
+    model = ta.FakeGenerativeModel(default_response=response, first_token_delay=first_token_delay, chunk_delay=0,
+                                   model_name=name)
+    return ta.ModelBackend(name, model)
+
+
+class FailingModel(ta.FakeGenerativeModel):
+    def lookup(self, message):
+        raise ConnectionError("backend down")
+
+
+def failing_backend(name):
+    return ta.ModelBackend(name, FailingModel(first_token_delay=0, model_name=name))
+
+
+async def ask(router, message="hello"):
+    response = await router.start_chat().send_message_async(message, stream=True)
+    return "".join([chunk.text async for chunk in response])
+
+
+def test_empty_router_raises_a_clear_error():
+    with pytest.raises(ValueError, match="No model backends"):
+        ta.ModelRouter([]).start_chat()
+
+
+def test_fastest_backend_wins_once_measured():
+    router = ta.ModelRouter([backend("slow", 0.1), backend("fast", 0.01)], hedging=False)
+
+    async def main():
+        for _ in range(4):
+            await ask(router)
+
+    asyncio.run(main())
+    assert router.ranked_backends()[0].name == "fast"
+    assert router.last_route == "fast"
+
+
+def test_slow_primary_is_hedged():
+    slow, fast = backend("slow", 0.5), backend("fast", 0.01)
+    router = ta.ModelRouter([slow, fast], hedge_min_delay=0.05, min_samples=1)
+    slow.record_latency(0.01)  # looks fast, so it is tried first
+    fast.record_latency(0.02)
+    assert asyncio.run(ask(router)) == "print(1)"
+    stats = router.get_stats()
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+    assert stats['last_route'] == "fast (hedge)"
+
+
+def test_failover_books_a_rate_limit_slot():
+    tracker = ta.APITracker(rpm_limit=5)
+    router = ta.ModelRouter([failing_backend("down"), backend("up", 0.01)], api_tracker=tracker, hedging=False)
+    tracker.reserve()  # the caller's own slot
+    assert asyncio.run(ask(router)) == "print(1)"
+    assert tracker.total_requests == 2
+    assert router.last_route == "up"
+
+
+def test_no_failover_past_the_rate_limit():
+    tracker = ta.APITracker(rpm_limit=1)
+    up = backend("up", 0.01)
+    router = ta.ModelRouter([failing_backend("down"), up], api_tracker=tracker, hedging=False)
+    tracker.reserve()
+    with pytest.raises(ConnectionError):
+        asyncio.run(ask(router))
+    assert up.requests == 0
+    assert tracker.total_requests == 1
+
+
+def test_set_backends_keeps_stats_of_unchanged_names():
+    old = backend("a", 0.01)
+    old.record_latency(0.2)
+    old.wins = 3
+    router = ta.ModelRouter([old, backend("b", 0.01)])
+    replacement, added = backend("a", 0.01), backend("c", 0.01)
+    router.set_backends([replacement, added])
+    assert list(replacement.latencies) == [0.2]
+    assert replacement.wins == 3
+    assert list(added.latencies) == []
+    assert router.model_name == "a+c"
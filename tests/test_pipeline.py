@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+
+import pytest
+
+import task_automate as ta
+
+
+DEFINITION = """
+# fetch, then two branches that meet in the report
+fetch
+resize <- fetch
+upload = upload_files <- resize
+thumbnails <- fetch
+report <- upload, thumbnails
+"""
+
+
+def test_parse_steps_and_aliases():
+    pipeline = ta.Pipeline("daily", DEFINITION)
+    assert pipeline.steps['upload'] == ('upload_files', ['resize'])
+    assert pipeline.steps['report'] == ('report', ['upload', 'thumbnails'])
+    assert pipeline.order[0] == 'fetch'
+    assert pipeline.order[-1] == 'report'
+
+
+@pytest.mark.parametrize('definition, message', [
+    ("", "no steps"),
+    ("a\na", "defined twice"),
+    ("a <- b", "unknown step"),
+    ("a <- b\nb <- a", "cycle"),
+    ("= script", "expected"),
+])
+def test_invalid_definitions(definition, message):
+    with pytest.raises(ValueError, match=message):
+        ta.Pipeline("bad", definition)
+
+
+def test_remaining_path_follows_the_longest_branch():
+    pipeline = ta.Pipeline("daily", DEFINITION)
+    remaining = pipeline.remaining_path({'fetch': 1, 'resize': 5, 'upload_files': 1, 'thumbnails': 2, 'report': 1})
+    assert remaining['fetch'] == 8
+    assert remaining['thumbnails'] == 3
+    assert remaining['report'] == 1
+
+
+@pytest.fixture
+def job_engine():
+    job_engine = ta.JobEngine(4)
+    job_engine.start()
+    yield job_engine
+    job_engine.shutdown()
+
+
+class Steps:
+    def __init__(self, delays=None, errors=None):
+        self.delays = delays or {}
+        self.errors = errors or {}
+        self.started = []
+        self.lock = threading.Lock()
+
+    def __call__(self, script_name, env, job):
+        with self.lock:
+            self.started.append(script_name)
+        inputs = {}
+        for step, path in json.loads(env['TASK_STEP_INPUTS']).items():
+            with open(path) as f:
+                inputs[step] = json.load(f)
+        deadline = time.time() + self.delays.get(script_name, 0)
+        while time.time() < deadline:
+            if job.status == 'cancelled':
+                return "cancelled"
+            time.sleep(0.01)
+        with open(env['TASK_STEP_OUTPUT'], 'w') as f:
+            json.dump({'step': env['TASK_STEP_NAME'], 'inputs': sorted(inputs)}, f)
+        return self.errors.get(script_name)
+
+
+def start(pipeline, job_engine, steps, tmp_path):
+    run = ta.PipelineRun(pipeline, job_engine, steps, str(tmp_path / "run"))
+    events = []
+    run.add_listener(lambda step, status: events.append((step, status)))
+    run.start()
+    return run, events
+
+
+def test_branches_run_in_parallel_and_pass_outputs(job_engine, tmp_path):
+    steps = Steps({'resize': 0.3, 'upload_files': 0.3, 'thumbnails': 0.3})
+    run, events = start(ta.Pipeline("daily", DEFINITION), job_engine, steps, tmp_path)
+    assert run.wait(10)
+    assert set(run.status.values()) == {'done'}
+    assert events[-1] == (None, 'done')
+    assert run.finished - run.started < 0.85  # thumbnails overlaps resize -> upload
+    with open(run.output_path('report')) as f:
+        assert json.load(f) == {'step': 'report', 'inputs': ['thumbnails', 'upload']}
+
+
+def test_failure_skips_only_dependents(job_engine, tmp_path):
+    steps = Steps(errors={'resize': "Script exited with status 3"})
+    run, events = start(ta.Pipeline("daily", DEFINITION), job_engine, steps, tmp_path)
+    assert run.wait(10)
+    assert run.status == {'fetch': 'done', 'resize': 'failed', 'upload': 'skipped', 'thumbnails': 'done',
+                          'report': 'skipped'}
+    assert run.errors == {'resize': "Script exited with status 3"}
+    assert events[-1] == (None, 'failed')
+    assert 'upload_files' not in steps.started
+
+
+def test_cancel_stops_running_steps_and_skips_the_rest(job_engine, tmp_path):
+    steps = Steps({'fetch': 5})
+    run, events = start(ta.Pipeline("daily", DEFINITION), job_engine, steps, tmp_path)
+    time.sleep(0.2)
+    run.cancel()
+    assert run.wait(10)
+    assert run.status['fetch'] == 'cancelled'
+    assert all(run.status[step] == 'skipped' for step in ('resize', 'upload', 'thumbnails', 'report'))
+    assert events[-1] == (None, 'cancelled')
+
+
+
+def test_runs_and_scheduler_share_the_engine(job_engine, tmp_path):
+    # Pipeline steps and scheduled runs are submitted concurrently; neither holds its lock while submitting
+    library = ta.ScriptLibrary(str(tmp_path / "scripts.db"))
+    library.save("tick", "pass")
+    scheduler = ta.ScriptScheduler(library, job_engine, lambda script_name, job: None)
+    scheduler.start()
+    try:
+        scheduler.add("tick", "every 0.01s")
+        runs = [start(ta.Pipeline(f"p{number}", DEFINITION), job_engine, Steps(), tmp_path / str(number))[0]
+                for number in range(10)]
+        assert all(run.wait(10) for run in runs)
+        assert all(set(run.status.values()) == {'done'} for run in runs)
+    finally:
+        scheduler.stop()
+        library.close()
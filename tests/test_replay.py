@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def settings(tmp_path):
+    # The same steps as --replay, with every location in a temporary folder
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({
+        'use_script_environments': False,
+        'executor_pool_size': 1,
+        'executor_preload_modules': [],
+        'max_concurrent_jobs': 2,
+    }))
+    settings = ta.Settings(str(config_file))
+    yield settings
+    settings.stop_watching()
+
+
+def replay(settings, session_text, mode="Automation", execute=True):
+    session = ta.ReplayHarness.load_session(io.StringIO(session_text))
+    harness = ta.ReplayHarness(settings, session, mode, execute=execute, first_token_delay=0, chunk_delay=0)
+    output = io.StringIO()
+    try:
+        report = harness.run(output)
+    finally:
+        harness.shutdown()
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    return report, sorted(records, key=lambda record: record['index'])
+
+
+def test_load_session_reads_prompts_and_recorded_batch_output():
+    session = ta.ReplayHarness.load_session(io.StringIO(
+        "# a comment\n"
+        "print the date\n"
+        "\n"
+        + json.dumps({'task': "add two numbers", 'code': "print(1 + 2)"}) + "\n"
+        + json.dumps({'prompt': "what is pi", 'answer': "About 3.14."}) + "\n"))
+    assert session == [("print the date", None),
+                       ("add two numbers", "```python\nprint(1 + 2)\n```"),
+                       ("what is pi", "About 3.14.")]
+
+
+def test_replay_runs_recorded_scripts_through_the_fake_model(settings):
+    session_text = ("print the date\n"
+                    + json.dumps({'task': "add two numbers", 'code': "print(1 + 2)"}) + "\n")
+    report, records = replay(settings, session_text)
+
+    assert report['requests'] == 2
+    assert report['failures'] == 0
+    assert [record['task'] for record in records] == ["print the date", "add two numbers"]
+    assert all(record['status'] == 'done' for record in records)
+    assert "\nreplayed\n" in records[0]['output']  # printed by the executed script
+    assert "\n3\n" in records[1]['output']
+    assert {'first_token', 'total'} <= set(report['stages'])
+
+    text = ta.ReplayHarness.format_report(report)
+    assert text.startswith("2 requests in ")
+    assert "0 failed" in text
+
+
+def test_replay_answers_questions_in_qa_mode(settings):
+    session_text = json.dumps({'prompt': "what is pi", 'answer': "About 3.14."}) + "\nanything else\n"
+    report, records = replay(settings, session_text, mode="Q/A")
+
+    assert report['failures'] == 0
+    assert "About 3.14." in records[0]['output']
+    assert "Replayed answer." in records[1]['output']
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ta.ResponseCache(str(tmp_path / "cache"), max_bytes=10 * 1024)
+
+
+def test_key_ignores_whitespace_differences(cache):
+    assert cache.make_key("list  the\nfiles ", None, "model") == cache.make_key("list the files", None, "model")
+
+
+def test_key_keeps_case(cache):
+    assert cache.make_key("rename to README", None, "model") != cache.make_key("rename to readme", None, "model")
+
+
+def test_key_depends_on_model_and_attachment(cache, tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text("one")
+    second.write_text("two")
+    key = cache.make_key("summarize", str(first), "model")
+    assert key != cache.make_key("summarize", str(first), "other-model")
+    assert key != cache.make_key("summarize", str(second), "model")
+    assert key != cache.make_key("summarize", None, "model")
+    assert key == cache.make_key("summarize", str(first), "model")
+
+
+def test_put_get_and_reload(cache, tmp_path):
+    cache.put("k", "print(1)")
+    assert cache.get("k") == "print(1)"
+    assert ta.ResponseCache(str(tmp_path / "cache")).get("k") == "print(1)"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ta.ResponseCache(str(tmp_path / "cache"), max_bytes=300)
+    cache.put("a", "x" * 100)
+    cache.put("b", "x" * 100)
+    cache.get("a")
+    cache.put("c", "x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+
+
+def test_concurrent_misses_share_one_computation(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "print(2)"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [code for code, _ in results] == ["print(2)"] * 3
+    assert cache.coalesced == 2
+
@@ -0,0 +1,192 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import task_automate as ta
+
+
+def at(*args):
+    return datetime.datetime(*args).timestamp()
+
+
+def moment(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+@pytest.mark.parametrize('expression, start, expected', [
+    ("*/15 * * * *", (2026, 3, 2, 10, 7), (2026, 3, 2, 10, 15)),
+    ("0 9 * * 1-5", (2026, 3, 6, 9, 0), (2026, 3, 9, 9, 0)),  # Friday 9:00 -> Monday 9:00
+    ("30 2 1 * *", (2026, 1, 15, 0, 0), (2026, 2, 1, 2, 30)),
+    ("0 0 29 2 *", (2026, 3, 1, 0, 0), (2028, 2, 29, 0, 0)),
+    ("0 12 * * 7", (2026, 3, 2, 0, 0), (2026, 3, 8, 12, 0)),  # 7 is Sunday, like 0
+    ("5,10 8-9 * 6 *", (2026, 6, 30, 9, 10), (2027, 6, 1, 8, 5)),
+])
+def test_cron_next_after(expression, start, expected):
+    assert moment(ta.CronExpression(expression).next_after(at(*start))) == datetime.datetime(*expected)
+
+
+def test_cron_day_and_weekday_match_either():
+    cron = ta.CronExpression("0 0 13 * 5")  # the 13th, or any Friday
+    assert moment(cron.next_after(at(2026, 3, 1))) == datetime.datetime(2026, 3, 6)
+    assert moment(cron.next_after(at(2026, 3, 10))) == datetime.datetime(2026, 3, 13)
+
+
+@pytest.mark.parametrize('expression', ["* * * *", "61 * * * *", "a * * * *", "5-1 * * * *", "*/0 * * * *",
+                                        "0 0 31 2 *"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        ta.CronExpression(expression).next_after(at(2026, 1, 1))
+
+
+@pytest.mark.parametrize('spec, interval', [("every 30s", 30), ("5m", 300), ("every 2h", 7200), ("10", 600),
+                                            ("every 0.5s", 0.5)])
+def test_interval_specs(spec, interval):
+    schedule = ta.Schedule("script", spec)
+    assert schedule.interval == interval
+    assert schedule.next_after(100) == 100 + interval
+
+
+def test_zero_interval_is_rejected():
+    with pytest.raises(ValueError):
+        ta.Schedule("script", "every 0s")
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = ta.ScriptLibrary(str(tmp_path / "scripts.db"))
+    for name in ("fast", "slow", "missed"):
+        library.save(name, "print(1)")
+    yield library
+    library.close()
+
+
+@pytest.fixture
+def job_engine():
+    job_engine = ta.JobEngine(4)
+    job_engine.start()
+    yield job_engine
+    job_engine.shutdown()
+
+
+class Runs:
+    def __init__(self, library, delays=None):
+        self.library = library
+        self.delays = delays or {}
+        self.names = []
+        self.lock = threading.Lock()
+
+    def __call__(self, script_name, job):
+        with self.lock:
+            self.names.append(script_name)
+        time.sleep(self.delays.get(script_name, 0))
+        self.library.record_run(script_name, 0.01, None, 'schedule')
+
+    def count(self, name):
+        with self.lock:
+            return self.names.count(name)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_interval_schedule_runs_repeatedly(library, job_engine):
+    runs = Runs(library)
+    scheduler = ta.ScriptScheduler(library, job_engine, runs)
+    scheduler.start()
+    try:
+        scheduler.add("fast", "every 0.1s")
+        assert wait_for(lambda: runs.count("fast") >= 3)
+        assert library.schedules()[0]['next_run_at'] > time.time() - 1
+    finally:
+        scheduler.stop()
+
+
+def test_runs_never_overlap(library, job_engine):
+    runs = Runs(library, {'slow': 0.6})
+    scheduler = ta.ScriptScheduler(library, job_engine, runs)
+    scheduler.start()
+    try:
+        scheduler.add("slow", "every 0.1s")
+        time.sleep(0.5)
+        assert runs.count("slow") == 1
+        skipped = [run for run in library.recent_runs("slow", 50) if run['status'] == 'skipped']
+        assert skipped
+        assert wait_for(lambda: runs.count("slow") >= 2)
+    finally:
+        scheduler.stop()
+
+
+def test_removed_schedule_stops(library, job_engine):
+    runs = Runs(library)
+    scheduler = ta.ScriptScheduler(library, job_engine, runs)
+    scheduler.start()
+    try:
+        scheduler.add("fast", "every 0.1s")
+        assert wait_for(lambda: runs.count("fast") >= 1)
+        scheduler.remove("fast")
+        time.sleep(0.2)
+        count = runs.count("fast")
+        time.sleep(0.3)
+        assert runs.count("fast") == count
+        assert scheduler.get("fast") is None
+    finally:
+        scheduler.stop()
+
+
+@pytest.mark.parametrize('policy, expected_runs', [('skip', 0), ('once', 1), ('all', 5)])
+def test_catch_up_policies(library, job_engine, policy, expected_runs):
+    library.set_schedule("missed", "every 1h", time.time() - 5 * 3600 + 60)
+    runs = Runs(library)
+    scheduler = ta.ScriptScheduler(library, job_engine, runs, policy)
+    scheduler.start()
+    try:
+        wait_for(lambda: runs.count("missed") >= expected_runs and expected_runs, timeout=2)
+        time.sleep(0.2)
+        assert runs.count("missed") == expected_runs
+        assert scheduler.get("missed").next_run > time.time()
+        if policy == 'skip':
+            assert library.recent_runs("missed")[0]['status'] == 'missed'
+    finally:
+        scheduler.stop()
+
+
+def test_invalid_stored_schedule_is_ignored(library, job_engine):
+    library.set_schedule("fast", "not a schedule", None)
+    scheduler = ta.ScriptScheduler(library, job_engine, Runs(library))
+    scheduler.start()
+    try:
+        assert scheduler.get("fast") is None
+    finally:
+        scheduler.stop()
+
+
+def test_cancelled_run_still_blocks_overlap_until_its_thread_ends(library, job_engine):
+    release = threading.Event()
+    started = []
+
+    def run_script(script_name, job):
+        started.append(script_name)
+        release.wait(5)
+
+    scheduler = ta.ScriptScheduler(library, job_engine, run_script)
+    scheduler.start()
+    try:
+        jobs = []
+        job_engine.add_listener(lambda job: jobs.append(job) if job.description == "Scheduled run: slow" else None)
+        scheduler.add("slow", "every 0.05s")
+        assert wait_for(lambda: started)
+        job_engine.cancel(jobs[0].job_id)
+        assert wait_for(lambda: jobs[0].status == 'cancelled')
+        time.sleep(0.3)
+        assert len(started) == 1  # the cancelled run's thread is still inside run_script
+        release.set()
+        assert wait_for(lambda: len(started) >= 2)
+    finally:
+        release.set()
+        scheduler.stop()
@@ -0,0 +1,149 @@
+import json
+import sqlite3
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = ta.ScriptLibrary(str(tmp_path / "scripts.db"))
+    yield library
+    library.close()
+
+
+def user_version(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def tables(path):
+    connection = sqlite3.connect(path)
+    try:
+        return {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        connection.close()
+
+
+def test_new_library_applies_every_migration(library, tmp_path):
+    path = str(tmp_path / "scripts.db")
+    assert user_version(path) == len(ta.ScriptLibrary.migrations)
+    assert {'scripts', 'script_tags', 'schedules', 'script_runs', 'pipelines'} <= tables(path)
+
+
+def test_old_library_is_migrated_and_keeps_its_scripts(tmp_path):
+    path = str(tmp_path / "scripts.db")
+    connection = sqlite3.connect(path)
+    connection.executescript(f"{ta.ScriptLibrary.migrations[0]}\nPRAGMA user_version = 1;")
+    connection.execute("INSERT INTO scripts (name, code, created_at, updated_at) VALUES ('old', 'print(1)', 0, 0)")
+    connection.commit()
+    connection.close()
+
+    library = ta.ScriptLibrary(path)
+    try:
+        assert library.code('old') == 'print(1)'
+        library.save_pipeline('daily', 'old')
+        assert library.pipeline('daily') == 'old'
+    finally:
+        library.close()
+    assert user_version(path) == len(ta.ScriptLibrary.migrations)
+
+
+def test_reopening_does_not_reapply_migrations(tmp_path):
+    path = str(tmp_path / "scripts.db")
+    ta.ScriptLibrary(path).close()
+    library = ta.ScriptLibrary(path, legacy_folder=str(tmp_path))
+    try:
+        assert library.names() == []
+    finally:
+        library.close()
+
+
+def test_legacy_folder_is_imported_once(tmp_path):
+    legacy = tmp_path / "automated_scripts"
+    legacy.mkdir()
+    (legacy / "hello.py").write_text("print('hello')")
+    (legacy / ".prompts.json").write_text(json.dumps({'hello': 'say hello'}))
+    path = str(tmp_path / "scripts.db")
+    library = ta.ScriptLibrary(path, legacy_folder=str(legacy))
+    library.delete('hello')
+    library.close()
+
+    library = ta.ScriptLibrary(path, legacy_folder=str(legacy))
+    try:
+        assert library.names() == []
+    finally:
+        library.close()
+
+
+def test_save_bumps_version_and_keeps_prompt(library):
+    library.save('a', 'print(1)', 'print one', ['requests'])
+    library.save('a', 'print(2)', 'print one', ['requests'])
+    entry = library.get('a')
+    assert entry['code'] == 'print(2)'
+    assert entry['version'] == 2
+    assert entry['dependencies'] == ['requests']
+
+
+def test_tags_filter_and_cascade(library):
+    library.save('a', 'x')
+    library.save('b', 'y')
+    library.set_tags('a', ['Daily', 'web'])
+    library.set_tags('b', ['daily'])
+    assert library.names(tags=['daily']) == ['a', 'b']
+    assert library.names(tags=['daily', 'web']) == ['a']
+    library.delete('a')
+    assert library.names(tags=['web']) == []
+
+
+def test_runs_update_stats_and_order(library):
+    library.save('a', 'x')
+    library.save('b', 'y')
+    library.record_run('b', 2.0)
+    library.record_run('b', 4.0, error='boom')
+    entry = library.get('b')
+    assert entry['run_count'] == 2
+    assert entry['average_run_seconds'] == 3.0
+    assert library.names(order='most_used') == ['b', 'a']
+    assert sorted(run['status'] for run in library.recent_runs('b')) == ['done', 'failed']
+
+
+def test_export_and_import_round_trip(library, tmp_path):
+    library.save('a', 'print(1)', 'print one')
+    library.set_tags('a', ['demo'])
+    library.record_run('a', 1.5)
+    folder = str(tmp_path / "export")
+    assert library.export_folder(folder) == 1
+
+    copy = ta.ScriptLibrary(str(tmp_path / "copy.db"))
+    try:
+        assert copy.import_folder(folder) == 1
+        entry = copy.get('a')
+        assert (entry['code'], entry['prompt'], entry['tags'], entry['run_count']) == ('print(1)', 'print one', ['demo'], 1)
+    finally:
+        copy.close()
+
+
+def test_changes_from_another_connection_are_noticed(library, tmp_path):
+    other = ta.ScriptLibrary(str(tmp_path / "scripts.db"))
+    try:
+        assert not library.changed_elsewhere()
+        other.save('a', 'x')
+        assert library.changed_elsewhere()
+        assert not library.changed_elsewhere()
+    finally:
+        other.close()
+
+
+def test_import_defaults_missing_run_timings(library, tmp_path):
+    folder = tmp_path / "export"
+    folder.mkdir()
+    (folder / "a.py").write_text("print(1)")
+    (folder / ta.ScriptLibrary.manifest_name).write_text(json.dumps({'a': {'run_count': 3}}))
+    assert library.import_folder(str(folder)) == 1
+    entry = library.get('a')
+    assert (entry['run_count'], entry['last_run_seconds'], entry['average_run_seconds']) == (3, 0, 0)
@@ -0,0 +1,53 @@
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def index():
+    index = ta.ScriptSearchIndex()
+    index.add("resize_images", "from PIL import Image\nfor path in paths: Image.open(path).thumbnail((800, 800))",
+              "resize every image in a folder")
+    index.add("backup_documents", "import shutil\nshutil.copytree(source, destination)", "back up my documents")
+    index.add("merge_pdfs", "from pypdf import PdfWriter\nwriter = PdfWriter()", "merge pdf files into one")
+    return index
+
+
+def test_tokenize_splits_camel_case_and_plurals():
+    assert ta.tokenize_words("mergePdfs images class") == ["merge", "pdf", "image", "class"]
+
+
+def test_name_matches_rank_above_content_matches():
+    index = ta.ScriptSearchIndex()
+    index.add("copy_files", "print('done')")
+    index.add("cleanup", "copy the files somewhere")
+    assert index.search("copy") == ["copy_files", "cleanup"]
+
+
+def test_prompt_words_are_searchable(index):
+    assert index.search("folder")[0] == "resize_images"
+
+
+def test_misspelled_and_partial_words_still_match(index):
+    assert index.search("documets")[0] == "backup_documents"
+    assert index.search("resi")[0] == "resize_images"
+
+
+def test_name_substring_wins(index):
+    assert index.search("merge_p")[0] == "merge_pdfs"
+
+
+def test_rare_terms_weigh_more():
+    index = ta.ScriptSearchIndex()
+    for number in range(5):
+        index.add(f"common_{number}", "import os\nprint(os.getcwd())")
+    index.add("rare", "import os\nimport zipfile")
+    assert index.search("os zipfile")[0] == "rare"
+
+
+def test_removed_and_replaced_scripts(index):
+    index.remove("merge_pdfs")
+    assert "merge_pdfs" not in index.search("pdf")
+    index.add("backup_documents", "print('nothing to see')")
+    assert index.search("shutil") == []
+    assert index.search("") == []
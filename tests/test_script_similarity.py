@@ -0,0 +1,51 @@
+import task_automate as ta
+
+
+def build(scripts):
+    index = ta.ScriptSimilarityIndex()
+    for name, content, prompt in scripts:
+        index.add(name, content, prompt)
+    index.rebuild()
+    return index
+
+
+def test_query_before_rebuild_is_empty():
+    index = ta.ScriptSimilarityIndex()
+    index.add("a", "print(1)", "print one")
+    assert index.query("print one") == []
+
+
+def test_same_prompt_scores_one():
+    index = build([("screenshot", "import pyautogui", "take a screenshot of the screen"),
+                   ("weather", "import requests", "show the weather forecast")])
+    name, score = index.query("take a screenshot of the screen")[0]
+    assert name == "screenshot"
+    assert abs(score - 1.0) < 1e-5
+
+
+def test_best_matches_first_and_unrelated_excluded():
+    index = build([("screenshot", "import pyautogui", "take a screenshot"),
+                   ("screenshot_window", "import pyautogui\nwindow = active()", "take a screenshot of the window"),
+                   ("weather", "import requests", "show the weather forecast")])
+    results = index.query("screenshot active window", limit=3)
+    assert [name for name, _ in results] == ["screenshot_window", "screenshot"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_scripts_without_prompt_match_on_code():
+    index = build([("zip_logs", "import zipfile\nzipfile.ZipFile('logs.zip', 'w')", "")])
+    assert index.query("zip the logs")[0][0] == "zip_logs"
+
+
+def test_unknown_words_lower_the_score():
+    index = build([("weather", "import requests", "show the weather forecast")])
+    close = index.query("show the weather forecast")[0][1]
+    diluted = index.query("show the weather forecast tomorrow in lisbon please")[0][1]
+    assert diluted < close
+
+
+def test_removed_script_disappears_after_rebuild():
+    index = build([("weather", "import requests", "show the weather forecast")])
+    index.remove("weather")
+    index.rebuild()
+    assert index.query("weather forecast") == []
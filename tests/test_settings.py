@@ -0,0 +1,144 @@
+import json
+import time
+
+import pytest
+
+import task_automate as ta
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    return str(tmp_path / "config.json")
+
+
+@pytest.fixture
+def settings(config_file):
+    settings = ta.Settings(config_file, save_delay=0.1, poll_interval=0.05)
+    yield settings
+    settings.stop_watching()
+    settings.flush()
+
+
+def read(config_file):
+    with open(config_file) as f:
+        return json.load(f)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.mark.parametrize('key, value', [
+    ('rpm_limit', "15"), ('rpm_limit', True), ('rpm_limit', 0), ('hedge_requests', 1),
+    ('schedule_catch_up', 'sometimes'), ('reuse_autorun_threshold', 1.5), ('executor_preload_modules', ['os', 3]),
+    ('shortcuts', {'save_script': 5}), ('model_backends', []), ('model_backends', ['gemini flash']),
+    ('model_backends', ['gemini-1.5-flash', 'gemini-1.5-flash']), ('model_backends', 'gemini-1.5-flash'),
+])
+def test_invalid_values_are_rejected(settings, key, value):
+    with pytest.raises(ValueError):
+        settings.set_setting(key, value)
+    assert settings.get_setting(key) == settings.default_settings[key]
+
+
+@pytest.mark.parametrize('key, value', [
+    ('rpm_limit', 30), ('hedge_min_delay', 2), ('schedule_catch_up', 'all'),
+    ('model_backends', ['gemini-1.5-pro', 'models/gemini-1.5-flash']), ('some_unknown_key', {'any': 'thing'}),
+])
+def test_valid_values_are_stored(settings, key, value):
+    settings.set_setting(key, value)
+    assert settings.get_setting(key) == value
+
+
+def test_subscribers_hear_changes_once(settings):
+    changes = []
+    settings.subscribe(['rpm_limit', 'hedge_requests'], lambda key, value: changes.append((key, value)))
+    settings.set_setting('rpm_limit', 20)
+    settings.set_setting('rpm_limit', 20)
+    settings.set_setting('max_concurrent_jobs', 3)
+    assert changes == [('rpm_limit', 20)]
+
+
+def test_returned_values_are_copies(settings):
+    backends = settings.get_setting('model_backends')
+    backends.append('changed')
+    assert settings.get_setting('model_backends') == settings.default_settings['model_backends']
+
+
+def test_writes_are_debounced_and_atomic(settings, config_file, monkeypatch):
+    replaced = []
+    original_replace = ta.os.replace
+    monkeypatch.setattr(ta.os, 'replace', lambda source, target: (replaced.append(target),
+                                                                   original_replace(source, target)))
+    for value in range(10, 20):
+        settings.set_setting('rpm_limit', value)
+    assert replaced == []
+    assert wait_for(lambda: replaced)
+    time.sleep(0.2)
+    assert replaced == [config_file]
+    assert read(config_file)['rpm_limit'] == 19
+
+
+def test_flush_writes_pending_changes_now(settings, config_file):
+    settings.set_setting('rpm_limit', 42)
+    settings.flush()
+    assert read(config_file)['rpm_limit'] == 42
+
+
+def test_invalid_file_values_fall_back_to_defaults(config_file, capsys):
+    with open(config_file, 'w') as f:
+        json.dump({'rpm_limit': 'many', 'max_concurrent_jobs': 3, 'model_backends': []}, f)
+    settings = ta.Settings(config_file)
+    assert settings.get_setting('rpm_limit') == settings.default_settings['rpm_limit']
+    assert settings.get_setting('model_backends') == settings.default_settings['model_backends']
+    assert settings.get_setting('max_concurrent_jobs') == 3
+    assert "Ignoring invalid setting" in capsys.readouterr().err
+
+
+def test_unreadable_file_uses_defaults(config_file):
+    with open(config_file, 'w') as f:
+        f.write("{not json")
+    assert ta.Settings(config_file).get_setting('rpm_limit') == 15
+
+
+def test_external_edits_are_reloaded(settings, config_file):
+    settings.set_setting('rpm_limit', 20)
+    settings.flush()
+    changes = []
+    settings.subscribe('rpm_limit', lambda key, value: changes.append(value))
+    settings.start_watching()
+    time.sleep(0.1)
+    data = read(config_file)
+    data['rpm_limit'] = 99
+    with open(config_file, 'w') as f:
+        json.dump(data, f)
+    assert wait_for(lambda: changes == [99])
+    assert settings.get_setting('rpm_limit') == 99
+
+
+def test_broken_edit_keeps_current_values(settings, config_file):
+    settings.set_setting('rpm_limit', 25)
+    settings.flush()
+    settings.start_watching()
+    with open(config_file, 'w') as f:
+        f.write("{broken")
+    time.sleep(0.3)
+    assert settings.get_setting('rpm_limit') == 25
+
+
+def test_own_writes_are_not_reloaded(settings, config_file):
+    changes = []
+    settings.subscribe('rpm_limit', lambda key, value: changes.append(value))
+    settings.start_watching()
+    settings.set_setting('rpm_limit', 21)
+    settings.flush()
+    time.sleep(0.3)
+    assert changes == [21]
+
+
+def test_instance_is_shared(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ta.Settings, 'shared_instance', None)
+    assert ta.Settings.instance() is ta.Settings.instance()
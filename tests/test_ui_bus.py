@@ -0,0 +1,69 @@
+import task_automate as ta
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(delay)
+
+
+class FakeText:
+    def __init__(self):
+        self.inserts = []
+        self.calls = []
+
+    def insert(self, index, text, *tags):
+        self.inserts.append((text, tags))
+
+    def delete(self, *args):
+        self.calls.append(('delete', args))
+
+    def see(self, index):
+        self.calls.append(('see', index))
+
+
+def test_drain_applies_queued_updates_and_waits_a_frame():
+    root = FakeRoot()
+    bus = ta.UIUpdateBus(root, frame_interval=16)
+    text = FakeText()
+    widget = bus.proxy(text)
+    widget.insert(ta.tk.END, "a")
+    widget.insert(ta.tk.END, "b")
+    widget.insert(ta.tk.END, "c", "error")
+    widget.see(ta.tk.END)
+    widget.see(ta.tk.END)
+
+    bus.drain()
+    assert text.inserts == [("ab", ()), ("c", ("error",))]
+    assert text.calls == [('see', ta.tk.END)]
+    assert root.scheduled == [16]
+
+
+def test_drain_caps_the_work_per_tick_and_reschedules_the_backlog():
+    root = FakeRoot()
+    bus = ta.UIUpdateBus(root, frame_interval=16, max_operations=100)
+    text = FakeText()
+    widget = bus.proxy(text)
+    for i in range(250):
+        widget.delete(i)
+
+    bus.drain()
+    assert len(text.calls) == 100
+    assert root.scheduled == [1]
+
+    bus.drain()
+    bus.drain()
+    assert [args for _, args in text.calls] == [(i,) for i in range(250)]
+    assert root.scheduled == [1, 1, 16]
+
+
+def test_a_backlog_of_exactly_the_cap_waits_a_full_frame():
+    root = FakeRoot()
+    bus = ta.UIUpdateBus(root, frame_interval=16, max_operations=10)
+    widget = bus.proxy(FakeText())
+    for i in range(10):
+        widget.delete(i)
+    bus.drain()
+    assert root.scheduled == [16]